@@ -0,0 +1,23 @@
+"""
+벤치마크용 봇 모듈 로더.
+code.py 는 표준 라이브러리 code 모듈과 이름이 겹치므로 경로로 직접 불러온다.
+"""
+import importlib.util
+import os
+import sys
+from typing import Dict, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_bot(workdir: str, env: Optional[Dict[str, str]] = None):
+    """workdir 를 작업 디렉터리로 (knowledge.json 위치) 봇 모듈을 새로 불러옴"""
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    for k, v in (env or {}).items():
+        os.environ[k] = v
+    spec = importlib.util.spec_from_file_location("hoshino_bot", os.path.join(REPO_DIR, "code.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["hoshino_bot"] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,307 @@
+"""
+핫패스 벤치마크: 실제 핸들러를 대역 Discord 객체로 호출 (네트워크 없음)
+  - on_message (배운 말 적중 / 없는 말 / 트리거 아닌 일반 대화), /가르치기, /배운내용 (서버 / 유저), 페이지 넘김,
+    KnowledgeView.delete (대답 1개), MultiDeleteView._on_confirm
+  - 지연 시간 백분위수, 호출당 할당량(tracemalloc), 저장 I/O 량(save_data / 저널)
+
+사용법:
+  python benchmarks/bench_hotpaths.py --guilds 20 --keywords 2000 --responses 3 --teachers 200 \\
+      --iterations 2000 --storage snapshot [--json result.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from _bot import load_bot
+import datasets
+from fake_discord import FakeChannel, FakeGuild, FakeInteraction, FakeMessage, FakeUser
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class IOCounter:
+    """save_data / 스냅샷(guilds 모드는 길드 파일) 쓰기 / 저널 추가를 감싸서 횟수와 바이트 수를 셈"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.save_calls = 0
+        self.snapshot_writes = 0
+        self.snapshot_bytes = 0
+        self.journal_records = 0
+        self.journal_bytes = 0
+        orig_save, orig_write, orig_append = bot.save_data, bot._write_knowledge_file, bot._journal_append
+        orig_write_guilds = bot._write_guild_files
+
+        def save_data(*args):
+            self.save_calls += 1
+            return orig_save(*args)
+
+        def write_knowledge_file(*args):
+            orig_write(*args)
+            self.snapshot_writes += 1
+            self.snapshot_bytes += os.path.getsize(bot.DATA_FILE)
+
+        def write_guild_files(snap, names):
+            orig_write_guilds(snap, names)
+            for gid in snap:
+                self.snapshot_writes += 1
+                if os.path.exists(bot._guild_path(gid)):
+                    self.snapshot_bytes += os.path.getsize(bot._guild_path(gid))
+
+        def journal_append(rec, *args, **kwargs):
+            orig_append(rec, *args, **kwargs)
+            self.journal_records += 1
+            self.journal_bytes += len((json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        bot.save_data = save_data
+        bot._write_knowledge_file = write_knowledge_file
+        bot._write_guild_files = write_guild_files
+        bot._journal_append = journal_append
+
+    def as_dict(self) -> Dict[str, int]:
+        return {k: v for k, v in vars(self).items() if k != "bot"}
+
+
+class Bench:
+    def __init__(self, bot, args):
+        self.bot = bot
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.latencies: Dict[str, List[float]] = {}
+        self.allocs: Dict[str, float] = {}
+        self.guild_ids = sorted(bot.learned_data.keys()) if bot.learned_data else []
+        self.guilds = {gid: FakeGuild(int(gid)) for gid in self.guild_ids}
+        self.users = [FakeUser(f"user{t}", 1000 + t) for t in range(args.teachers)]
+        self.channel = FakeChannel()
+        self._seq = 0
+
+    def _guild(self) -> FakeGuild:
+        return self.guilds[self.rnd.choice(self.guild_ids)]
+
+    def _keyword(self) -> str:
+        return f"키워드{self.rnd.randrange(self.args.keywords)}"
+
+    def _fresh(self) -> str:
+        self._seq += 1
+        return f"bench-{self._seq}"
+
+    # 각 작업: 준비(시간 제외)를 마친 뒤 측정할 코루틴 함수를 돌려줌
+
+    async def op_trigger_hit(self) -> Callable:
+        msg = FakeMessage(f"호시노야 {self._keyword()}", self.users[0], self._guild(), self.channel)
+        return lambda: self.bot.on_message(msg)
+
+    async def op_trigger_miss(self) -> Callable:
+        msg = FakeMessage("호시노야 없는말", self.users[0], self._guild(), self.channel)
+        return lambda: self.bot.on_message(msg)
+
+    async def op_chatter(self) -> Callable:
+        msg = FakeMessage("오늘 점심 뭐 먹지 ㅋㅋ", self.users[0], self._guild(), self.channel)
+        return lambda: self.bot.on_message(msg)
+
+    async def op_teach(self) -> Callable:
+        inter = FakeInteraction(self.rnd.choice(self.users), self._guild())
+        kw, resp = self._keyword(), self._fresh()
+        return lambda: self.bot.teach.callback(inter, kw, resp)
+
+    async def op_show_guild(self) -> Callable:
+        inter = FakeInteraction(self.users[0], self._guild())
+        return lambda: self.bot.show_knowledge_command.callback(inter, None)
+
+    async def op_show_user(self) -> Callable:
+        inter = FakeInteraction(self.users[0], self._guild())
+        name = self.rnd.choice(self.users).name
+        return lambda: self.bot.show_knowledge_command.callback(inter, name)
+
+    async def op_page_next(self) -> Callable:
+        if not hasattr(self, "_page_view") or self._page_view.next.disabled:
+            inter = FakeInteraction(self.users[0], self._guild())
+            await self.bot.show_knowledge_command.callback(inter, None)
+            self._page_view = inter.last("view")
+        view = self._page_view
+        inter = FakeInteraction(self.users[0], None)
+        return lambda: view.next.callback(inter)
+
+    async def op_delete_single(self) -> Callable:
+        user, guild = self.rnd.choice(self.users), self._guild()
+        gid, kw = str(guild.id), self._fresh()
+        await self.bot.store.add(gid, kw, "지울 대답", user.name)
+        view = self.bot.KnowledgeView(user, [(gid, kw, user.name)])
+        await view.load_page()
+        inter = FakeInteraction(user, guild)
+        return lambda: view.delete.callback(inter)
+
+    async def op_multi_delete(self) -> Callable:
+        user, guild = self.rnd.choice(self.users), self._guild()
+        gid, kw = str(guild.id), self._fresh()
+        for r in ("대답1", "대답2", "대답3"):
+            await self.bot.store.add(gid, kw, r, user.name)
+        view = self.bot.KnowledgeView(user, [(gid, kw, user.name)])
+        await view.load_page()
+        inter = FakeInteraction(user, guild)
+        await view.delete.callback(inter)
+        menu = inter.last("view")
+        menu.selected_values = ["대답1", "대답3"]
+        confirm = FakeInteraction(user, guild)
+        return lambda: menu.confirm.callback(confirm)
+
+    OPS = ("trigger_hit", "trigger_miss", "chatter", "teach", "show_guild", "show_user", "page_next", "delete_single", "multi_delete")
+
+    async def run_latency(self, iterations: int):
+        for name in self.OPS:
+            prepare = getattr(self, f"op_{name}")
+            samples = self.latencies.setdefault(name, [])
+            for _ in range(iterations):
+                call = await prepare()
+                t = time.perf_counter_ns()
+                await call()
+                samples.append((time.perf_counter_ns() - t) / 1000.0)
+                # 측정 밖에서 루프에 한 번 양보 (저장 타이머/스레드 완료 콜백이 실제처럼 돌도록)
+                await asyncio.sleep(0)
+
+    async def run_allocs(self, iterations: int):
+        for name in self.OPS:
+            prepare = getattr(self, f"op_{name}")
+            total = 0
+            for _ in range(iterations):
+                call = await prepare()
+                tracemalloc.start()
+                await call()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                total += peak
+            self.allocs[name] = total / iterations
+
+
+async def run(args) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="hoshino-bench-")
+    datasets.write(os.path.join(workdir, "knowledge.json"),
+                   datasets.generate(args.guilds, args.keywords, args.responses, args.teachers, args.seed))
+    env = {"KNOWLEDGE_STORAGE": args.storage, "KNOWLEDGE_SAVE_INTERVAL": str(args.save_interval), "HOSHINO_MATCH": args.match,
+           "KNOWLEDGE_GUILD_CACHE_MB": str(args.guild_cache_mb), "HOSHINO_SELECT": args.select,
+           "HOSHINO_SELECT_NO_REPEAT": str(args.no_repeat), "KNOWLEDGE_VIEW_PER_PAGE": str(args.per_page)}
+    if not args.rate_limits:
+        # 같은 사용자/채널로 연달아 호출하므로 기본 한도면 대부분 버려짐 -> 핸들러 비용만 재려면 끔
+        env.update({name: "0" for name in ("HOSHINO_RATE_REPLY_USER", "HOSHINO_RATE_REPLY_CHANNEL", "HOSHINO_RATE_REPLY_GUILD",
+                                           "HOSHINO_RATE_TEACH_USER", "HOSHINO_RATE_TEACH_GUILD")})
+    bot = load_bot(workdir, env)
+
+    async def no_prefix_commands(message):
+        # 접두사 명령은 쓰지 않으므로 대역 메시지로 commands 파이프라인을 돌리지 않음
+        return None
+
+    bot.bot.process_commands = no_prefix_commands
+    io = IOCounter(bot)
+
+    t = time.perf_counter()
+    await bot.load_knowledge_store()
+    load_seconds = time.perf_counter() - t
+
+    bench = Bench(bot, args)
+    if bot.STORAGE_MODE in ("sqlite", "guilds"):
+        # 시작 시 learned_data 가 비어 있는 모드
+        bench.guild_ids = [str(100000000000000000 + g) for g in range(args.guilds)]
+        bench.guilds = {gid: FakeGuild(int(gid)) for gid in bench.guild_ids}
+    await bench.run_latency(args.iterations)
+    await bench.run_allocs(args.alloc_iterations)
+    await bot.flush_persistence()
+    bot.store.shutdown()
+
+    result: Dict[str, Any] = {
+        "dataset": {"guilds": args.guilds, "keywords": args.keywords, "responses": args.responses, "teachers": args.teachers},
+        "storage": args.storage,
+        "match": args.match,
+        "select": args.select,
+        "no_repeat": args.no_repeat,
+        "per_page": args.per_page,
+        "load_seconds": load_seconds,
+        "ops": {},
+        "io": io.as_dict(),
+        "shed": {},
+        "guild_cache": {},
+    }
+    if bot.STORAGE_MODE == "guilds":
+        loads = bot.metrics.stage_summary("guild_load")
+        result["guild_cache"] = {
+            "budget_mb": args.guild_cache_mb,
+            "loads": loads.count,
+            "load_p50_us": loads.quantile(0.5) * 1e6,
+            "evictions": int(sum(v for (name, _), v in bot.metrics.counters.items() if name == "guild_evict")),
+            "resident_guilds": len(bot.learned_data),
+        }
+    for (name, _), v in bot.metrics.counters.items():
+        if name.startswith(("reply_", "teach_shed_")):
+            result["shed"][name] = result["shed"].get(name, 0) + int(v)
+    for name in bench.OPS:
+        samples = sorted(bench.latencies[name])
+        result["ops"][name] = {
+            "n": len(samples),
+            "p50_us": percentile(samples, 50),
+            "p90_us": percentile(samples, 90),
+            "p99_us": percentile(samples, 99),
+            "max_us": samples[-1] if samples else 0.0,
+            "alloc_peak_bytes": bench.allocs.get(name, 0.0),
+        }
+    return result
+
+
+def print_result(result: Dict[str, Any]):
+    d = result["dataset"]
+    print(f"dataset: {d['guilds']} guilds x {d['keywords']} keywords x {d['responses']} responses, "
+          f"{d['teachers']} teachers / storage={result['storage']} / match={result['match']} / "
+          f"select={result['select']} (no-repeat {result['no_repeat']}) / per-page {result['per_page']} / load {result['load_seconds']:.2f}s")
+    print(f"{'op':<16}{'n':>7}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'max us':>11}{'alloc KB':>10}")
+    for name, o in result["ops"].items():
+        print(f"{name:<16}{o['n']:>7}{o['p50_us']:>10.1f}{o['p90_us']:>10.1f}{o['p99_us']:>10.1f}"
+              f"{o['max_us']:>11.1f}{o['alloc_peak_bytes'] / 1024:>10.1f}")
+    io = result["io"]
+    print(f"save_data: {io['save_calls']} calls, snapshot writes {io['snapshot_writes']} "
+          f"({io['snapshot_bytes'] / 1e6:.2f} MB), journal {io['journal_records']} records ({io['journal_bytes'] / 1e3:.1f} KB)")
+    gc = result["guild_cache"]
+    if gc:
+        print(f"guild cache ({gc['budget_mb']} MB): {gc['loads']} loads (p50 <= {gc['load_p50_us']:.0f} us), "
+              f"{gc['evictions']} evictions, {gc['resident_guilds']} resident at end")
+    if result["shed"]:
+        print("rate limiting: " + ", ".join(f"{k}={v}" for k, v in sorted(result["shed"].items())))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--guilds", type=int, default=20)
+    ap.add_argument("--keywords", type=int, default=2000)
+    ap.add_argument("--responses", type=int, default=3)
+    ap.add_argument("--teachers", type=int, default=200)
+    ap.add_argument("--iterations", type=int, default=2000)
+    ap.add_argument("--alloc-iterations", type=int, default=200)
+    ap.add_argument("--storage", choices=("snapshot", "journal", "sqlite", "guilds"), default="snapshot")
+    ap.add_argument("--guild-cache-mb", type=float, default=64, help="guilds 모드 메모리 예산")
+    ap.add_argument("--save-interval", type=float, default=2.0)
+    ap.add_argument("--match", choices=("exact", "normalized", "fuzzy"), default="exact")
+    ap.add_argument("--select", choices=("teacher", "response", "recent"), default="teacher")
+    ap.add_argument("--no-repeat", type=int, default=0, help="채널별로 피할 최근 대답 수")
+    ap.add_argument("--per-page", type=int, default=1, help="/배운내용 한 페이지 최대 항목 수")
+    ap.add_argument("--rate-limits", action="store_true", help="기본 속도 제한을 켠 채로 측정")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="결과를 JSON 으로도 저장할 경로")
+    args = ap.parse_args()
+
+    result = asyncio.run(run(args))
+    print_result(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
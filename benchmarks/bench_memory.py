@@ -0,0 +1,70 @@
+"""
+메모리 벤치마크: 대답 하나당 상주 메모리 비교
+  - dict 모델: json.load 결과 그대로 ({"response", "teacher"} dict 리스트, 기존 learned_data)
+  - 압축 모델: KeywordRecord + teacher_table + teacher_index (현재 learned_data, 스트리밍 로드)
+
+사용법:
+  python benchmarks/bench_memory.py --guilds 50 --keywords 500 --responses 4 --teachers 200
+"""
+import argparse
+import gc
+import json
+import os
+import tempfile
+import tracemalloc
+
+from _bot import load_bot
+import datasets
+
+
+def measure(fn):
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    keep = fn()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return keep, current - base, peak - base
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--guilds", type=int, default=50)
+    ap.add_argument("--keywords", type=int, default=500)
+    ap.add_argument("--responses", type=int, default=4)
+    ap.add_argument("--teachers", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="hoshino-bench-")
+    path = os.path.join(workdir, "knowledge.json")
+    datasets.write(path, datasets.generate(args.guilds, args.keywords, args.responses, args.teachers, args.seed))
+    total = args.guilds * args.keywords * args.responses
+    print(f"dataset: {total} responses, {os.path.getsize(path) / 1e6:.1f} MB ({path})")
+
+    # 빈 작업 디렉터리에서 모듈만 불러옴 (import 시점 로드는 비어 있음)
+    bot = load_bot(os.path.join(workdir, "empty"), {"KNOWLEDGE_STORAGE": "snapshot"})
+
+    def load_dicts():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load_compact():
+        bot.DATA_FILE = path
+        bot.learned_data = bot.load_knowledge()
+        bot.rebuild_teacher_index()
+        return bot.learned_data
+
+    dicts, dict_bytes, dict_peak = measure(load_dicts)
+    del dicts
+    _, compact_bytes, compact_peak = measure(load_compact)
+
+    print(f"{'model':<10}{'resident MB':>14}{'peak MB':>10}{'bytes/response':>18}")
+    print(f"{'dict':<10}{dict_bytes / 1e6:>14.1f}{dict_peak / 1e6:>10.1f}{dict_bytes / total:>18.1f}")
+    print(f"{'compact':<10}{compact_bytes / 1e6:>14.1f}{compact_peak / 1e6:>10.1f}{compact_bytes / total:>18.1f}")
+    print(f"reduction: {100 * (1 - compact_bytes / dict_bytes):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+합성 knowledge.json 생성기 (길드 x 키워드 x 대답 x 가르친 사람).
+"""
+import json
+import random
+from typing import Dict, List
+
+
+def generate(guilds: int, keywords: int, responses: int, teachers: int, seed: int = 0) -> Dict[str, Dict[str, List[Dict[str, str]]]]:
+    rnd = random.Random(seed)
+    teacher_names = [f"user{t}" for t in range(teachers)]
+    data: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+    for g in range(guilds):
+        gid = str(100000000000000000 + g)
+        kw_map: Dict[str, List[Dict[str, str]]] = {}
+        for k in range(keywords):
+            kw_map[f"키워드{k}"] = [
+                {"response": f"대답 {g}-{k}-{r} {rnd.randrange(1 << 30)}", "teacher": rnd.choice(teacher_names)}
+                for r in range(responses)
+            ]
+        data[gid] = kw_map
+    return data
+
+
+def write(path: str, data: Dict[str, Dict[str, List[Dict[str, str]]]]):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
@@ -0,0 +1,94 @@
+"""
+네트워크 없이 핸들러를 돌리기 위한 Discord 객체 대역.
+핸들러가 실제로 쓰는 속성/메서드만 흉내 낸다 (보낸 내용은 기록만 함).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class FakeUser:
+    def __init__(self, name: str, user_id: int, bot: bool = False):
+        self.name = name
+        self.id = user_id
+        self.bot = bot
+
+    def __eq__(self, other: Any) -> bool:
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self) -> int:
+        return self.id
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, name: Optional[str] = None):
+        self.id = guild_id
+        self.name = name or f"guild-{guild_id}"
+        self.members: Dict[int, FakeUser] = {}
+
+    def get_member(self, user_id: int) -> Optional[FakeUser]:
+        return self.members.get(user_id)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int = 1):
+        self.id = channel_id
+        self.sent: List[str] = []
+
+    async def send(self, content: str = None, **kwargs):
+        self.sent.append(content)
+
+
+class FakeMessage:
+    def __init__(self, content: str, author: FakeUser, guild: Optional[FakeGuild], channel: Optional[FakeChannel] = None):
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.channel = channel or FakeChannel()
+        self.edits: List[Dict[str, Any]] = []
+
+    async def edit(self, **kwargs):
+        self.edits.append(kwargs)
+
+
+class FakeResponse:
+    def __init__(self, log: List[Tuple[str, Dict[str, Any]]]):
+        self._log = log
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content: str = None, **kwargs):
+        self._done = True
+        self._log.append(("send_message", dict(kwargs, content=content)))
+
+    async def edit_message(self, **kwargs):
+        self._done = True
+        self._log.append(("edit_message", kwargs))
+
+    async def defer(self, **kwargs):
+        self._done = True
+        self._log.append(("defer", kwargs))
+
+
+class FakeFollowup:
+    def __init__(self, log: List[Tuple[str, Dict[str, Any]]]):
+        self._log = log
+
+    async def send(self, content: str = None, **kwargs):
+        self._log.append(("followup", dict(kwargs, content=content)))
+
+
+class FakeInteraction:
+    """slash 명령/버튼 콜백에 넘기는 Interaction 대역. 응답은 log 에 쌓인다"""
+
+    def __init__(self, user: FakeUser, guild: Optional[FakeGuild], message: Optional[FakeMessage] = None):
+        self.user = user
+        self.guild = guild
+        self.log: List[Tuple[str, Dict[str, Any]]] = []
+        self.response = FakeResponse(self.log)
+        self.followup = FakeFollowup(self.log)
+        self.message = message or FakeMessage("", user, guild)
+
+    def last(self, key: str) -> Any:
+        """마지막 응답의 인자 (예: "view", "embed", "content")"""
+        return self.log[-1][1].get(key) if self.log else None
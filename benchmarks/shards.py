@@ -0,0 +1,270 @@
+"""
+샤드 점검: 한 프로세스에 봇 모듈 두 개 (HOSHINO_SHARD_COUNT=2, 샤드 0 / 1)를 InProcessBus 로 묶어서
+다른 샤드로 가는 경로를 실제 핸들러로 확인하고 지연을 잰다 (네트워크 없음)
+  - 처음 시작: 기존 knowledge.json 에서 샤드마다 자기 길드만 가져옴
+  - /배운내용 유저: -> keys_for_teacher 를 모든 샤드에 묻고 합침, 페이지 항목은 주인 샤드의 get_entry
+  - 다른 샤드 길드 항목 삭제 (삭제 버튼 -> 멀티 삭제 확정) -> 주인 샤드의 remove
+  - /일괄삭제 유저: -> purge_teacher 를 모든 샤드에, 서버id: 로 다른 샤드 길드의 키워드 / 전체
+  - 한 샤드가 응답하지 않을 때: 키 목록은 나머지만, purge_teacher 는 ShardUnavailable 후 다시 실행하면 남은 것만
+  - 끝나고 두 샤드를 새로 불러와 (재시작) 내용이 그대로인지
+
+사용법:
+  python benchmarks/shards.py --storage snapshot [--guilds 8 --keywords 200 --teachers 20 --iterations 300]
+  점검이 하나라도 틀리면 종료 코드 1
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Set, Tuple
+
+from _bot import load_bot
+import datasets
+from bench_hotpaths import percentile
+from fake_discord import FakeGuild, FakeInteraction, FakeUser
+
+SHARDS = 2
+Row = Tuple[str, str, str, str]  # (guild, keyword, 가르친 사람, 대답)
+
+
+def shard_guild_ids(count: int) -> List[str]:
+    # 디스코드 규칙 (guild_id >> 22) % SHARDS 가 번갈아 나오도록 위쪽 비트를 하나씩 올림
+    base = 100000000000000000 >> 22
+    return [str((base + g) << 22 | 1234) for g in range(count)]
+
+
+class Cluster:
+    """샤드 봇 모듈들 + 같은 InProcessBus"""
+
+    def __init__(self, workdir: str, env: Dict[str, str]):
+        self.workdir = workdir
+        self.env = env
+        self.bots: List[Any] = []
+        self.bus = None
+
+    async def start(self):
+        self.bots = []
+        for sid in range(SHARDS):
+            bot = load_bot(self.workdir, dict(self.env, HOSHINO_SHARD_COUNT=str(SHARDS), HOSHINO_SHARD_ID=str(sid)))
+            if self.bus is None:
+                self.bus = bot.InProcessBus()
+            # 기본 SqliteShardBus 대신 같은 프로세스 버스로 묶음
+            bot.store.bus.close()
+            bot.store = bot.ShardedKnowledgeStore(bot.store.local, self.bus)
+            bot.privileged_users.append("admin")
+            self.bots.append(bot)
+        for bot in self.bots:
+            await bot.load_knowledge_store()
+
+    async def stop(self):
+        for bot in self.bots:
+            await bot.flush_persistence()
+            bot.store.shutdown()
+        self.bus = None
+
+    def owner(self, gid: str) -> Any:
+        return next(bot for bot in self.bots if bot.owns_guild(gid))
+
+
+async def dump(store, guild_ids: List[str]) -> Set[Row]:
+    rows: Set[Row] = set()
+    for gid in guild_ids:
+        async for batch in store.export_rows(gid):
+            rows.update(tuple(row) for row in batch)
+    return rows
+
+
+class Check:
+    def __init__(self, cluster: Cluster, expected: Set[Row], guild_ids: List[str], args):
+        self.cluster = cluster
+        self.expected = expected
+        self.guild_ids = guild_ids
+        self.args = args
+        self.failures: List[str] = []
+        self.latencies: Dict[str, List[float]] = {}
+
+    def expect(self, name: str, ok: bool, detail: str = ""):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f" ({detail})" if detail and not ok else ""))
+        if not ok:
+            self.failures.append(f"{name}: {detail}")
+
+    async def timed(self, name: str, coro) -> Any:
+        t = time.perf_counter_ns()
+        result = await coro
+        self.latencies.setdefault(name, []).append((time.perf_counter_ns() - t) / 1000.0)
+        return result
+
+    def teacher_keys(self, teacher: str, guilds: List[str] = None) -> Set[Tuple[str, str, str]]:
+        return {(g, k, t) for g, k, t, _ in self.expected if t == teacher and (guilds is None or g in guilds)}
+
+    async def partitioned(self, name: str):
+        for sid, bot in enumerate(self.cluster.bots):
+            mine = [gid for gid in self.guild_ids if bot.owns_guild(gid)]
+            want = {row for row in self.expected if row[0] in mine}
+            got = await dump(bot.store.local, self.guild_ids)
+            self.expect(f"{name}: 샤드 {sid} 는 자기 길드 {len(mine)}개만", got == want,
+                        f"없는 행 {len(want - got)}, 남는 행 {len(got - want)}")
+
+    async def fan_out(self, teacher: str):
+        want = self.teacher_keys(teacher)
+        for sid, bot in enumerate(self.cluster.bots):
+            user = FakeUser("viewer", 1)
+            inter = FakeInteraction(user, FakeGuild(int(self.guild_ids[sid])))
+            await bot.show_knowledge_command.callback(inter, teacher)
+            view = inter.last("view")
+            keys = set(view.keys) if view is not None else set()
+            self.expect(f"샤드 {sid} 에서 /배운내용 유저:{teacher} 키 목록 = 두 샤드 합", keys == want,
+                        f"기대 {len(want)}, 실제 {len(keys)}")
+            # 모든 페이지를 넘기며 항목 내용 비교 (다른 샤드 길드는 주인 샤드에서 꺼내옴)
+            seen = {}
+            while view is not None:
+                for entry, _ in view.page:
+                    seen[(entry["guild_id"], entry["keyword"], entry["teacher"])] = set(entry["responses"])
+                if view.next.disabled:
+                    break
+                await view.next.callback(FakeInteraction(user, None))
+            bad = [key for key in want if seen.get(key) != {r for g, k, t, r in self.expected if (g, k, t) == key}]
+            self.expect(f"샤드 {sid} 페이지 항목 {len(seen)}개 내용 일치", not bad and len(seen) == len(want), f"틀린 항목 {bad[:3]}")
+
+    async def remote_delete(self, teacher: str):
+        a, b = self.cluster.bots
+        gid = next(g for g in self.guild_ids if b.owns_guild(g))
+        user = FakeUser(teacher, 7)
+        guild = FakeGuild(int(gid))
+        # 주인 샤드에서 가르치고 (대답 셋), 다른 샤드에서 지움
+        for r in ("원격1", "원격2", "원격3"):
+            inter = FakeInteraction(user, guild)
+            await b.teach.callback(inter, "원격키워드", r)
+            self.expected.add((gid, "원격키워드", teacher, r))
+        view = a.KnowledgeView(user, [(gid, "원격키워드", teacher)])
+        await view.load_page()
+        self.expect("다른 샤드 항목 불러오기", view.current is not None and len(view.current["responses"]) == 3,
+                    f"{view.current}")
+        inter = FakeInteraction(user, FakeGuild(int(self.guild_ids[0])))
+        await view.delete.callback(inter)
+        menu = inter.last("view")
+        menu.select._values = ["원격1", "원격3"]
+        await menu._on_select(FakeInteraction(user, None))
+        confirm = FakeInteraction(user, None)
+        await menu._on_confirm(confirm)
+        self.expected -= {(gid, "원격키워드", teacher, "원격1"), (gid, "원격키워드", teacher, "원격3")}
+        entry = await b.store.local.get_entry(gid, "원격키워드", teacher)
+        self.expect("다른 샤드에서 멀티 삭제 -> 주인 샤드 remove", entry is not None and entry["responses"] == ["원격2"], f"{entry}")
+        self.expect("삭제 후 페이지 갱신", view.current is not None and view.current["responses"] == ["원격2"], f"{view.current}")
+
+    async def purge(self, bot, inter_args: Tuple[Any, ...]) -> str:
+        admin = FakeUser("admin", 2)
+        guild = FakeGuild(int(self.guild_ids[0]))
+        inter = FakeInteraction(admin, guild)
+        await bot.purge_command.callback(inter, *inter_args)
+        view = inter.last("view")
+        confirm = FakeInteraction(admin, guild)
+        await view.confirm.callback(confirm)
+        return confirm.last("content") or ""
+
+    async def remote_purges(self):
+        a, b = self.cluster.bots
+        gid = next(g for g in self.guild_ids if b.owns_guild(g))
+        keyword = next(k for g, k, _, _ in sorted(self.expected) if g == gid)
+        msg = await self.purge(a, (None, keyword, False, gid))
+        self.expected = {row for row in self.expected if not (row[0] == gid and row[1] == keyword)}
+        got = await dump(b.store.local, [gid])
+        self.expect("다른 샤드 길드 키워드 일괄삭제", msg.startswith("✅") and not any(row[1] == keyword for row in got), msg)
+        gid2 = [g for g in self.guild_ids if b.owns_guild(g)][-1]
+        msg = await self.purge(a, (None, None, True, gid2))
+        self.expected = {row for row in self.expected if row[0] != gid2}
+        got = await dump(b.store.local, [gid2])
+        self.expect("다른 샤드 길드 전체 일괄삭제", msg.startswith("✅") and not got, msg)
+
+    async def purge_teacher(self, teacher: str):
+        a, b = self.cluster.bots
+        msg = await self.purge(b, (teacher, None, False, None))
+        self.expected = {row for row in self.expected if row[2] != teacher}
+        left = [await bot.store.local.keys_for_teacher(teacher) for bot in self.cluster.bots]
+        self.expect(f"유저 {teacher} 일괄삭제가 두 샤드 모두에서", msg.startswith("✅") and not any(left), f"{msg} / 남음 {list(map(len, left))}")
+
+    async def unavailable(self, teacher: str):
+        a, b = self.cluster.bots
+        bus = self.cluster.bus
+        handler = bus.handlers.pop(1)
+        keys = set(await a.store.keys_for_teacher(teacher))
+        local = self.teacher_keys(teacher, [g for g in self.guild_ids if a.owns_guild(g)])
+        self.expect("샤드 1 이 없으면 키 목록은 샤드 0 것만", keys == local, f"기대 {len(local)}, 실제 {len(keys)}")
+        msg = await self.purge(a, (teacher, None, False, None))
+        remote_left = await b.store.local.keys_for_teacher(teacher)
+        self.expect("샤드 1 이 없으면 purge_teacher 는 ShardUnavailable (샤드 0 것만 삭제)",
+                    msg.startswith("❌") and not await a.store.local.keys_for_teacher(teacher) and bool(remote_left), msg)
+        bus.handlers[1] = handler
+        msg = await self.purge(a, (teacher, None, False, None))
+        self.expected = {row for row in self.expected if row[2] != teacher}
+        self.expect("샤드 1 이 돌아온 뒤 다시 실행하면 남은 것 삭제", msg.startswith("✅") and not await b.store.local.keys_for_teacher(teacher), msg)
+
+    async def measure(self, teachers: List[str]):
+        a = self.cluster.bots[0]
+        keys = sorted({(g, k, t) for g, k, t, _ in self.expected})
+        local = [key for key in keys if a.owns_guild(key[0])]
+        remote = [key for key in keys if not a.owns_guild(key[0])]
+        for i in range(self.args.iterations):
+            await self.timed("keys_for_teacher (fan-out)", a.store.keys_for_teacher(teachers[i % len(teachers)]))
+            await self.timed("get_entry local", a.store.get_entry(*local[i % len(local)]))
+            await self.timed("get_entry remote", a.store.get_entry(*remote[i % len(remote)]))
+
+
+async def run(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="hoshino-shards-")
+    guild_ids = shard_guild_ids(args.guilds)
+    generated = datasets.generate(args.guilds, args.keywords, args.responses, args.teachers, args.seed)
+    data = {gid: kw_map for gid, kw_map in zip(guild_ids, generated.values())}
+    datasets.write(os.path.join(workdir, "knowledge.json"), data)
+    expected = {(gid, kw, item["teacher"], item["response"]) for gid, kw_map in data.items()
+                for kw, items in kw_map.items() for item in items}
+    env = {"KNOWLEDGE_STORAGE": args.storage, "KNOWLEDGE_SAVE_INTERVAL": "0.05", "KNOWLEDGE_VIEW_PER_PAGE": "5"}
+    env.update({name: "0" for name in ("HOSHINO_RATE_TEACH_USER", "HOSHINO_RATE_TEACH_GUILD")})
+
+    cluster = Cluster(workdir, env)
+    await cluster.start()
+    check = Check(cluster, expected, guild_ids, args)
+    await check.partitioned("처음 시작")
+    teachers = sorted({t for _, _, t, _ in expected})
+    await check.fan_out(teachers[0])
+    await check.remote_delete(teachers[1])
+    await check.fan_out(teachers[1])
+    await check.remote_purges()
+    await check.purge_teacher(teachers[2])
+    await check.unavailable(teachers[3])
+    await check.measure(teachers[4:] or teachers)
+    await check.partitioned("작업 후")
+    await cluster.stop()
+
+    await cluster.start()
+    await check.partitioned("재시작 후")
+    await check.fan_out(teachers[1])
+    await cluster.stop()
+
+    print(f"\n{'op':<28}{'n':>6}{'p50 us':>10}{'p99 us':>10}")
+    for name, samples in check.latencies.items():
+        samples.sort()
+        print(f"{name:<28}{len(samples):>6}{percentile(samples, 50):>10.1f}{percentile(samples, 99):>10.1f}")
+    if check.failures:
+        print(f"\n{len(check.failures)}개 실패")
+        return 1
+    print("\n모든 점검 통과")
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--storage", choices=("snapshot", "journal", "sqlite", "guilds"), default="snapshot")
+    ap.add_argument("--guilds", type=int, default=8)
+    ap.add_argument("--keywords", type=int, default=200)
+    ap.add_argument("--responses", type=int, default=2)
+    ap.add_argument("--teachers", type=int, default=20)
+    ap.add_argument("--iterations", type=int, default=300)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,648 @@
+"""
+소크 테스트: 시드 고정 재생 부하 생성기 (네트워크 없음, 가상 시계)
+  - /가르치기, on_message (배운 말 호출 / 일반 대화), /배운내용 + 이전/다음, 삭제 (항목 고르기 -> 멀티 삭제 확정)를
+    실제 핸들러에 대역 Discord 객체로 섞어서 몇 시간 분량(가상 시간)을 재생
+  - 대역 응답/전송은 한 번 양보(await)해서 실제 네트워크처럼 다른 코루틴이 끼어들게 함
+    -> 가르치기 / 삭제 / 조회가 겹치고, 열어 둔 뷰는 그 사이 바뀐 데이터를 들고 있게 됨
+  - 불변식 (그림자 모델: 끝난 가르치기/삭제만 반영)
+      유령 대답: 작업 시작 전에 삭제가 끝난 대답이 답장/페이지에 나옴
+      사라진 대답: 작업 시작 전에 배웠고 끝날 때까지 아무도 안 지운 대답이 답장/페이지에 없음
+      끝난 뒤 store 전체 == 그림자 모델, 다시 불러온(재시작) 뒤에도 같음 (snapshot 모드는 knowledge.json 도 직접 비교)
+  - 가상 시간 구간마다 처리량 / 지연 / 메모리 (RSS, 캐시 등 자료구조 크기) 기록
+
+사용법:
+  python benchmarks/soak.py --hours 4 --rate 2 --storage snapshot --seed 1 [--concurrency 32] [--json soak.json]
+  --concurrency 1 이면 작업이 겹치지 않아 같은 시드로 항상 같은 실행이 재현됨
+  guilds 모드 내리기/다시 올리기 확인: --storage guilds --guild-cache-mb 0.05 (길드 하나도 예산을 넘어 계속 내리고 올림)
+  불변식이 깨지면 종료 코드 1
+"""
+import argparse
+import asyncio
+import gc
+import heapq
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from _bot import load_bot
+import datasets
+from bench_hotpaths import percentile
+from fake_discord import FakeChannel, FakeGuild, FakeInteraction, FakeMessage, FakeResponse, FakeUser
+
+INF = float("inf")
+
+
+class SimTime:
+    """봇 모듈의 time 대역: monotonic/time 은 가상 시계, 나머지(perf_counter 등)는 진짜 time 모듈"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return 1_700_000_000.0 + self.now
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(time, name)
+
+
+class NetResponse(FakeResponse):
+    """응답을 보내기 전에 한 번 양보 (실제 HTTP 요청 자리)"""
+
+    async def send_message(self, content: str = None, **kwargs):
+        await asyncio.sleep(0)
+        await super().send_message(content, **kwargs)
+
+    async def edit_message(self, **kwargs):
+        await asyncio.sleep(0)
+        await super().edit_message(**kwargs)
+
+    async def defer(self, **kwargs):
+        await asyncio.sleep(0)
+        await super().defer(**kwargs)
+
+
+class NetInteraction(FakeInteraction):
+    def __init__(self, user: FakeUser, guild: Optional[FakeGuild], message: Optional[FakeMessage] = None):
+        super().__init__(user, guild, message)
+        self.response = NetResponse(self.log)
+
+    def content(self) -> str:
+        return self.last("content") or ""
+
+
+class NetChannel(FakeChannel):
+    async def send(self, content: str = None, **kwargs):
+        await asyncio.sleep(0)
+        await super().send(content, **kwargs)
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # 최대값 (리눅스 KB)
+
+
+def bot_heap_bytes(bot) -> int:
+    """지금 살아 있는 할당 중 봇 모듈(code.py)에서 만든 것 (그림자 모델 등 이 스크립트 몫은 빼고)"""
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, bot.__file__)])
+    return sum(stat.size for stat in snapshot.statistics("filename"))
+
+
+class Shadow:
+    """기대 상태: 끝난 가르치기/삭제만 반영. 대답마다 가르치기 끝난 순번 / 삭제 시작·끝 순번도 기록
+    (대답 문자열은 전부 서로 다름 -> 대답 하나로 그 키를 찾을 수 있음)"""
+
+    def __init__(self, data: Dict[str, Dict[str, List[Dict[str, str]]]]):
+        self.by_key: Dict[Tuple[str, str], Dict[str, str]] = {}  # (guild, keyword) -> {대답: 가르친 사람}
+        self.meta: Dict[str, Tuple[str, str, str]] = {}  # 대답 -> (guild, keyword, 가르친 사람)
+        self.born_at: Dict[str, int] = {}
+        self.kill_started: Dict[str, int] = {}
+        self.dead_at: Dict[str, int] = {}
+        for gid, kw_map in data.items():
+            for kw, items in kw_map.items():
+                for item in items:
+                    self.taught(gid, kw, item["teacher"], item["response"], 0)
+
+    def teaching(self, gid: str, kw: str, teacher: str, resp: str):
+        # 가르치기는 답장 전에 이미 보일 수 있음 (guilds 모드는 길드를 내리기 전 저장을 기다리는 동안)
+        self.meta[resp] = (gid, kw, teacher)
+
+    def taught(self, gid: str, kw: str, teacher: str, resp: str, seq: int):
+        self.meta[resp] = (gid, kw, teacher)
+        if resp in self.dead_at:
+            return  # 가르치기 답장이 오기 전에 이미 지워짐
+        self.born_at[resp] = seq
+        self.by_key.setdefault((gid, kw), {})[resp] = teacher
+
+    def killing(self, responses: List[str], seq: int):
+        for r in responses:
+            self.kill_started.setdefault(r, seq)
+
+    def killed(self, gid: str, kw: str, responses: List[str], seq: int):
+        bucket = self.by_key.get((gid, kw), {})
+        for r in responses:
+            self.dead_at.setdefault(r, seq)
+            bucket.pop(r, None)
+        if not bucket:
+            self.by_key.pop((gid, kw), None)
+
+    def stable(self, gid: str, kw: str, teacher: Optional[str], start: int) -> List[str]:
+        """start 전에 배웠고 지금까지 아무도 지우기 시작하지 않은 대답 (반드시 보여야 함)"""
+        return [r for r, t in self.by_key.get((gid, kw), {}).items()
+                if (teacher is None or t == teacher) and self.born_at[r] < start and r not in self.kill_started]
+
+    def rows(self) -> List[Tuple[str, str, str, str]]:
+        return sorted((gid, kw, t, r) for (gid, kw), bucket in self.by_key.items() for r, t in bucket.items())
+
+    def count(self) -> int:
+        return sum(len(bucket) for bucket in self.by_key.values())
+
+
+class Session:
+    """한 사용자의 /배운내용 뷰 하나 (열기 -> 이전/다음 -> 삭제 흐름). 결정은 세션 전용 난수로"""
+
+    def __init__(self, user: FakeUser, guild: FakeGuild, rnd: random.Random):
+        self.user = user
+        self.guild = guild
+        self.rnd = rnd
+        self.view = None
+        self.steps = 0
+        self.menu = None  # EntryPickView / MultiDeleteView
+
+
+class Soak:
+    def __init__(self, bot, clock: SimTime, data: Dict[str, Dict[str, List[Dict[str, str]]]], args):
+        self.bot = bot
+        self.clock = clock
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.shadow = Shadow(data)
+        self.guild_ids = sorted(data)
+        self.guilds = {gid: FakeGuild(int(gid)) for gid in self.guild_ids}
+        self.users = [FakeUser(f"user{t}", 1000 + t) for t in range(args.teachers)]
+        self.seq = 0  # 작업 시작/끝마다 하나씩 (유령/사라짐 판정용 순서)
+        self.fresh = 0
+        self.new_keywords: List[str] = []
+        self.taught_by: Dict[str, List[Tuple[FakeGuild, str]]] = {}  # 사용자 -> 가르친 (길드, 키워드)
+        self.sessions = 0
+        self.heap: List[Tuple[float, int, Callable]] = []
+        self.heap_seq = 0
+        self.latencies: Dict[str, List[float]] = {}
+        self.window: List[float] = []
+        self.violations: Dict[str, List[str]] = {}
+        self.outcomes: Dict[str, int] = {}
+        self.timeline: List[Dict[str, Any]] = []
+
+    # 기록
+
+    def tick(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def violation(self, kind: str, detail: str):
+        self.violations.setdefault(kind, []).append(f"t={self.clock.now:.0f}s {detail}")
+
+    def outcome(self, name: str):
+        self.outcomes[name] = self.outcomes.get(name, 0) + 1
+
+    def check_seen(self, where: str, gid: str, kw: str, teacher: Optional[str], resp: str, start: int):
+        meta = self.shadow.meta.get(resp)
+        if meta is None or meta[0] != gid or meta[1] != kw or (teacher is not None and meta[2] != teacher):
+            self.violation("ghost_unknown", f"{where}: {gid}/{kw}/{teacher} -> {resp!r} (실제 {meta})")
+        elif self.shadow.dead_at.get(resp, INF) < start:
+            self.violation("ghost_deleted", f"{where}: {gid}/{kw} -> {resp!r} 삭제된 대답")
+
+    def check_page(self, where: str, view, start: int):
+        for entry, _ in view.page:
+            gid, kw, teacher = entry["guild_id"], entry["keyword"], entry["teacher"]
+            shown = set(entry["responses"])
+            for r in shown:
+                self.check_seen(where, gid, kw, teacher, r, start)
+            missing = [r for r in self.shadow.stable(gid, kw, teacher, start) if r not in shown]
+            if missing:
+                self.violation("lost_page", f"{where}: {gid}/{kw}/{teacher} 에 {missing[:3]} 없음")
+
+    # 작업 고르기
+
+    def _guild(self, rnd: random.Random) -> FakeGuild:
+        return self.guilds[rnd.choice(self.guild_ids)]
+
+    def _keyword(self, rnd: random.Random) -> str:
+        # 앞쪽 키워드에 몰리게 (인기 키워드) + 가끔 새로 가르친 키워드
+        if self.new_keywords and rnd.random() < 0.15:
+            return rnd.choice(self.new_keywords)
+        return f"키워드{int(self.args.keywords * rnd.random() ** 2)}"
+
+    def schedule(self, at: float, step: Callable):
+        self.heap_seq += 1
+        heapq.heappush(self.heap, (at, self.heap_seq, step))
+
+    def arrival(self) -> Tuple[str, Callable]:
+        rnd = self.rnd
+        x = rnd.random()
+        mix = self.args.mix
+        if x < mix[0]:
+            return "trigger", self.make_trigger(self._guild(rnd), self._keyword(rnd), rnd.choice(self.users))
+        x -= mix[0]
+        if x < mix[1]:
+            return "chatter", self.make_chatter(self._guild(rnd), rnd.choice(self.users))
+        x -= mix[1]
+        if x < mix[2]:
+            user = rnd.choice(self.users)
+            mine = self.taught_by.setdefault(user.name, [])
+            if mine and rnd.random() < 0.3:
+                # 자기가 가르친 키워드에 대답 하나 더 -> 한 사람 대답이 여러 개인 항목 (멀티 삭제 메뉴)
+                guild, kw = rnd.choice(mine)
+            else:
+                guild = self._guild(rnd)
+                if rnd.random() < 0.1:
+                    kw = f"새말{len(self.new_keywords)}"
+                    self.new_keywords.append(kw)
+                else:
+                    kw = self._keyword(rnd)
+                mine.append((guild, kw))
+            self.fresh += 1
+            return "teach", self.make_teach(guild, kw, user, f"soak-{self.args.seed}-{self.fresh}")
+        self.sessions += 1
+        session = Session(rnd.choice(self.users), self._guild(rnd), random.Random(self.args.seed * 1_000_003 + self.sessions))
+        return "open", self.make_open(session, by_user=rnd.random() < self.args.own_view)
+
+    def think(self, session: Session) -> float:
+        return session.rnd.expovariate(1.0 / self.args.think)
+
+    # 작업: 각 make_* 는 (다음 단계 또는 None) 을 돌려주는 코루틴 함수
+
+    def make_trigger(self, guild: FakeGuild, kw: str, user: FakeUser):
+        async def op():
+            gid = str(guild.id)
+            channel = NetChannel(int(gid) % 1000 * 10 + user.id % 4)  # 길드마다 채널 4개 (채널별 최근 대답 고리 공유)
+            start = self.tick()
+            await self.bot.on_message(FakeMessage(f"호시노야 {kw}", user, guild, channel))
+            self.tick()
+            if not channel.sent:
+                if self.shadow.stable(gid, kw, None, start):
+                    self.violation("lost_trigger", f"trigger {gid}/{kw}: 답장 없음")
+                self.outcome("trigger_miss")
+                return None
+            resp, _, footer = channel.sent[-1].partition("\n-# ")
+            teacher = footer.removesuffix("님이 가르쳐 주셨어요!")
+            self.check_seen("trigger", gid, kw, teacher, resp, start)
+            self.outcome("trigger_hit")
+            return None
+        return op
+
+    def make_chatter(self, guild: FakeGuild, user: FakeUser):
+        async def op():
+            channel = NetChannel(guild.id % 1000 * 10)
+            await self.bot.on_message(FakeMessage("오늘 점심 뭐 먹지 ㅋㅋ", user, guild, channel))
+            if channel.sent:
+                self.violation("ghost_chatter", f"일반 대화에 답장: {channel.sent[-1]!r}")
+            return None
+        return op
+
+    def make_teach(self, guild: FakeGuild, kw: str, user: FakeUser, resp: str):
+        async def op():
+            inter = NetInteraction(user, guild)
+            self.tick()
+            self.shadow.teaching(str(guild.id), kw, user.name, resp)
+            await self.bot.teach.callback(inter, kw, resp)
+            seq = self.tick()
+            if inter.content().startswith("✅"):
+                self.shadow.taught(str(guild.id), kw, user.name, resp, seq)
+                self.outcome("teach_ok")
+            else:
+                self.outcome("teach_refused")
+            return None
+        return op
+
+    def make_open(self, session: Session, by_user: bool):
+        async def op():
+            inter = NetInteraction(session.user, session.guild)
+            start = self.tick()
+            await self.bot.show_knowledge_command.callback(inter, session.user.name if by_user else None)
+            self.tick()
+            session.view = inter.last("view")
+            if session.view is None:
+                self.outcome("open_empty")
+                return None
+            self.check_page("open", session.view, start)
+            return self.next_step(session)
+        return op
+
+    def next_step(self, session: Session) -> Optional[Tuple[float, str, Callable]]:
+        session.steps += 1
+        if session.steps > self.args.session_steps:
+            return None
+        x = session.rnd.random()
+        if x < 0.45:
+            return self.think(session), "page_next", self.make_page(session, "next")
+        if x < 0.6:
+            return self.think(session), "page_prev", self.make_page(session, "previous")
+        if x < 0.95:
+            return self.think(session), "delete", self.make_delete(session)
+        return None
+
+    def make_page(self, session: Session, button: str):
+        async def op():
+            view = session.view
+            inter = NetInteraction(session.user, None)
+            start = self.tick()
+            await getattr(view, button).callback(inter)
+            self.tick()
+            if inter.log:  # 첫/마지막 페이지에서는 아무것도 안 함 (이전 페이지 그대로)
+                self.check_page(button, view, start)
+            return self.next_step(session)
+        return op
+
+    def _deletable(self, entry: Dict[str, Any], user: FakeUser) -> bool:
+        return user.name in self.bot.privileged_users or entry["teacher"] == user.name
+
+    async def _remove_entry(self, session: Session, inter: NetInteraction, call: Callable, entry: Optional[Dict[str, Any]]):
+        """delete_entry 로 이어지는 호출. 대답이 하나인 항목이면 바로 지워짐 -> 그림자에 반영, 아니면 멀티 삭제 메뉴"""
+        single = entry is not None and len(entry["responses"]) == 1
+        start = self.tick()
+        if single:
+            self.shadow.killing(entry["responses"], start)
+        await call()
+        seq = self.tick()
+        if inter.content().startswith("🗑️"):
+            self.shadow.killed(entry["guild_id"], entry["keyword"], entry["responses"][:1], seq)
+            self.outcome("delete_single")
+            self.check_page("delete", session.view, start)
+            return self.next_step(session)
+        menu = inter.last("view")
+        if menu is None:
+            self.outcome("delete_refused")
+            return self.next_step(session)
+        session.menu = menu
+        if isinstance(menu, self.bot.EntryPickView):
+            return self.think(session), "delete_pick", self.make_pick(session)
+        return self.think(session), "delete_confirm", self.make_confirm(session)
+
+    def make_delete(self, session: Session):
+        async def op():
+            view = session.view
+            inter = NetInteraction(session.user, session.guild)
+            # 핸들러가 볼 페이지 그대로 (호출 전에 await 없음)
+            mine = [e for e, _ in view.page if self._deletable(e, session.user)]
+            entry = mine[0] if len(view.page) == 1 and mine else None
+            return await self._remove_entry(session, inter, lambda: view.delete.callback(inter), entry)
+        return op
+
+    def make_pick(self, session: Session):
+        async def op():
+            picker = session.menu
+            inter = NetInteraction(session.user, session.guild)
+            i = session.rnd.randrange(len(picker.entries))
+            picker.select._values = [str(i)]
+            return await self._remove_entry(session, inter, lambda: picker._on_select(inter), picker.entries[i])
+        return op
+
+    def make_confirm(self, session: Session):
+        async def op():
+            menu = session.menu
+            values = [o.value for o in menu.select.options]
+            chosen = session.rnd.sample(values, session.rnd.randint(1, len(values)))
+            pick = NetInteraction(session.user, session.guild)
+            menu.select._values = chosen
+            await menu._on_select(pick)
+            inter = NetInteraction(session.user, session.guild)
+            start = self.tick()
+            self.shadow.killing(chosen, start)
+            await menu._on_confirm(inter)
+            seq = self.tick()
+            if inter.content().startswith("✅"):
+                self.shadow.killed(menu.guild_id_str, menu.keyword, chosen, seq)
+                self.outcome("delete_multi")
+            else:
+                self.outcome("delete_refused")
+            self.check_page("confirm", session.view, start)
+            return self.next_step(session)
+        return op
+
+    # 실행
+
+    async def _run(self, name: str, op: Callable):
+        t = time.perf_counter_ns()
+        try:
+            follow = await op()
+        except Exception as e:
+            self.violation("exception", f"{name}: {type(e).__name__}: {e}")
+            follow = None
+        us = (time.perf_counter_ns() - t) / 1000.0
+        self.latencies.setdefault(name, []).append(us)
+        self.window.append(us)
+        if follow is not None:
+            delay, next_name, next_op = follow
+            self.schedule(self.clock.now + delay, (next_name, next_op))
+
+    def sample(self, real_start: float, last: Dict[str, float]):
+        gc.collect()
+        now = time.perf_counter()
+        window = sorted(self.window)
+        row = {
+            "sim_minutes": self.clock.now / 60.0,
+            "real_seconds": now - real_start,
+            "ops": len(window),
+            "ops_per_s": len(window) / max(1e-9, now - last["real"]),
+            "p50_us": percentile(window, 50),
+            "p99_us": percentile(window, 99),
+            "rss_mb": rss_bytes() / 1e6,
+            "traced_mb": bot_heap_bytes(self.bot) / 1e6 if tracemalloc.is_tracing() else None,
+            "responses": self.shadow.count(),
+            "render_cache": len(self.bot._render_cache),
+            "open_views": len(self.bot._open_views),
+            "recent_channels": len(self.bot.recent_replies),
+            "violations": sum(len(v) for v in self.violations.values()),
+        }
+        self.timeline.append(row)
+        self.window = []
+        last["real"] = now
+        if self.args.progress:
+            print_row(row)
+
+    async def run(self):
+        duration = self.args.hours * 3600.0
+        report = self.args.report_minutes * 60.0
+        inflight: set = set()
+        self.schedule(self.rnd.expovariate(self.args.rate), None)  # None = 다음 도착
+        real_start = time.perf_counter()
+        last = {"real": real_start}
+        next_report = report
+        while self.heap:
+            at, _, step = heapq.heappop(self.heap)
+            if at > duration:
+                break
+            while at >= next_report:
+                self.clock.now = next_report
+                self.sample(real_start, last)
+                next_report += report
+            self.clock.now = at
+            if step is None:
+                step = self.arrival()
+                self.schedule(at + self.rnd.expovariate(self.args.rate), None)
+            while len(inflight) >= self.args.concurrency:
+                await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            task = asyncio.ensure_future(self._run(*step))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+            await asyncio.sleep(0)
+        if inflight:
+            await asyncio.wait(inflight)
+        self.clock.now = duration
+        self.sample(real_start, last)
+
+
+async def dump_store(bot, guild_ids: List[str]) -> List[Tuple[str, str, str, str]]:
+    rows = []
+    for gid in guild_ids:
+        async for batch in bot.store.export_rows(gid):
+            rows.extend(batch)
+    return sorted(rows)
+
+
+def diff_rows(expected: List[Tuple[str, str, str, str]], actual: List[Tuple[str, str, str, str]]) -> Optional[str]:
+    exp, act = set(expected), set(actual)
+    if exp == act and len(expected) == len(actual):
+        return None
+    return (f"기대 {len(expected)} / 실제 {len(actual)}행, 없는 행 {sorted(exp - act)[:3]} "
+            f"남은 행 {sorted(act - exp)[:3]}, 중복 {len(actual) - len(act)}")
+
+
+def print_row(row: Dict[str, Any]):
+    traced = f"{row['traced_mb']:>9.1f}" if row["traced_mb"] is not None else f"{'-':>9}"
+    print(f"{row['sim_minutes']:>7.0f}{row['real_seconds']:>9.1f}{row['ops']:>8}{row['ops_per_s']:>9.0f}"
+          f"{row['p50_us']:>9.1f}{row['p99_us']:>9.1f}{row['rss_mb']:>8.1f}{traced}{row['responses']:>10}"
+          f"{row['render_cache']:>7}{row['open_views']:>7}{row['recent_channels']:>8}{row['violations']:>6}")
+
+
+def print_header():
+    print(f"{'sim min':>7}{'real s':>9}{'ops':>8}{'ops/s':>9}{'p50 us':>9}{'p99 us':>9}{'rss MB':>8}{'bot MB':>9}"
+          f"{'responses':>10}{'render':>7}{'views':>7}{'recent':>8}{'viol':>6}")
+
+
+async def run(args) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="hoshino-soak-")
+    data = datasets.generate(args.guilds, args.keywords, args.responses, args.teachers, args.seed)
+    datasets.write(os.path.join(workdir, "knowledge.json"), data)
+    env = {"KNOWLEDGE_STORAGE": args.storage, "KNOWLEDGE_SAVE_INTERVAL": str(args.save_interval),
+           "KNOWLEDGE_GUILD_CACHE_MB": str(args.guild_cache_mb), "HOSHINO_SELECT": args.select,
+           "HOSHINO_SELECT_NO_REPEAT": str(args.no_repeat), "KNOWLEDGE_VIEW_PER_PAGE": str(args.per_page)}
+    # 한도/속도 제한에 걸린 작업은 그림자 모델과 맞출 수 없으므로 끔 (가르치기 거절은 답장으로 구분해 무시)
+    env.update({name: "0" for name in ("HOSHINO_QUOTA_GUILD_KEYWORDS", "HOSHINO_QUOTA_KEYWORD_RESPONSES",
+                                       "HOSHINO_QUOTA_TEACHER_RESPONSES", "HOSHINO_RATE_REPLY_USER",
+                                       "HOSHINO_RATE_REPLY_CHANNEL", "HOSHINO_RATE_REPLY_GUILD",
+                                       "HOSHINO_RATE_TEACH_USER", "HOSHINO_RATE_TEACH_GUILD")})
+    bot = load_bot(workdir, env)
+    clock = SimTime()
+    bot.time = clock
+    if args.tracemalloc:
+        tracemalloc.start()
+    await bot.load_knowledge_store()
+
+    soak = Soak(bot, clock, data, args)
+    if args.progress:
+        print_header()
+    await soak.run()
+
+    checks: Dict[str, Optional[str]] = {}
+    expected = soak.shadow.rows()
+    checks["store_vs_shadow"] = diff_rows(expected, await dump_store(bot, soak.guild_ids))
+    await bot.flush_persistence()
+    bot.store.shutdown()
+    if bot.STORAGE_MODE == "snapshot":
+        with open(bot.DATA_FILE, encoding="utf-8") as f:
+            saved = json.load(f)
+        checks["knowledge_json_vs_shadow"] = diff_rows(expected, sorted(
+            (gid, kw, item["teacher"], item["response"]) for gid, kw_map in saved.items()
+            for kw, items in kw_map.items() for item in items))
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    # 재시작: 같은 작업 디렉터리에서 모듈을 새로 불러와 다시 로드
+    restarted = load_bot(workdir, env)
+    t = time.perf_counter()
+    await restarted.load_knowledge_store()
+    reload_seconds = time.perf_counter() - t
+    checks["restart_vs_shadow"] = diff_rows(expected, await dump_store(restarted, soak.guild_ids))
+    restarted.store.shutdown()
+    for name, problem in checks.items():
+        if problem is not None:
+            soak.violation(name, problem)
+
+    first, last = soak.timeline[0], soak.timeline[-1]
+    hours = max(1e-9, (last["sim_minutes"] - first["sim_minutes"]) / 60.0)
+    return {
+        "dataset": {"guilds": args.guilds, "keywords": args.keywords, "responses": args.responses, "teachers": args.teachers},
+        "storage": args.storage,
+        "seed": args.seed,
+        "hours": args.hours,
+        "rate": args.rate,
+        "concurrency": args.concurrency,
+        "reload_seconds": reload_seconds,
+        "ops": {name: {"n": len(s), "p50_us": percentile(sorted(s), 50), "p99_us": percentile(sorted(s), 99)}
+                for name, s in sorted(soak.latencies.items())},
+        "outcomes": dict(sorted(soak.outcomes.items())),
+        "timeline": soak.timeline,
+        "memory": {"rss_start_mb": first["rss_mb"], "rss_end_mb": last["rss_mb"],
+                   "rss_mb_per_hour": (last["rss_mb"] - first["rss_mb"]) / hours,
+                   "responses_start": first["responses"], "responses_end": last["responses"]},
+        "checks": {name: problem or "ok" for name, problem in checks.items()},
+        "violations": soak.violations,
+    }
+
+
+def print_result(result: Dict[str, Any]):
+    d = result["dataset"]
+    print(f"dataset: {d['guilds']} guilds x {d['keywords']} keywords x {d['responses']} responses, {d['teachers']} users / "
+          f"storage={result['storage']} / seed {result['seed']} / {result['hours']}h at {result['rate']}/s, "
+          f"concurrency {result['concurrency']}")
+    print(f"{'op':<16}{'n':>8}{'p50 us':>10}{'p99 us':>10}")
+    for name, o in result["ops"].items():
+        print(f"{name:<16}{o['n']:>8}{o['p50_us']:>10.1f}{o['p99_us']:>10.1f}")
+    print("outcomes: " + ", ".join(f"{k}={v}" for k, v in result["outcomes"].items()))
+    m = result["memory"]
+    print(f"memory: rss {m['rss_start_mb']:.1f} -> {m['rss_end_mb']:.1f} MB ({m['rss_mb_per_hour']:+.2f} MB/h), "
+          f"responses {m['responses_start']} -> {m['responses_end']}, reload {result['reload_seconds']:.2f}s")
+    print("checks: " + ", ".join(f"{k}={v}" for k, v in result["checks"].items()))
+    for kind, items in sorted(result["violations"].items()):
+        print(f"VIOLATION {kind} x{len(items)}")
+        for item in items[:5]:
+            print(f"  {item}")
+    if not result["violations"]:
+        print("invariants: ok")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--hours", type=float, default=4.0, help="가상 시간 길이")
+    ap.add_argument("--rate", type=float, default=2.0, help="가상 1초당 새 작업 수 (포아송 도착)")
+    ap.add_argument("--concurrency", type=int, default=32, help="동시에 진행 중인 작업 상한")
+    ap.add_argument("--mix", type=float, nargs=4, default=(0.6, 0.15, 0.15, 0.1), metavar=("TRIGGER", "CHATTER", "TEACH", "BROWSE"),
+                    help="새 작업 비율 (/배운내용 세션은 이어서 이전/다음/삭제 단계가 따라옴)")
+    ap.add_argument("--think", type=float, default=20.0, help="세션 단계 사이 평균 가상 시간(초)")
+    ap.add_argument("--session-steps", type=int, default=6)
+    ap.add_argument("--own-view", type=float, default=0.7, help="/배운내용 을 자기 이름으로 여는 비율 (나머지는 서버 전체)")
+    ap.add_argument("--guilds", type=int, default=8)
+    ap.add_argument("--keywords", type=int, default=300)
+    ap.add_argument("--responses", type=int, default=2)
+    ap.add_argument("--teachers", type=int, default=40, help="사용자 수 (데이터셋의 가르친 사람과 같은 이름)")
+    ap.add_argument("--storage", choices=("snapshot", "journal", "sqlite", "guilds"), default="snapshot")
+    ap.add_argument("--guild-cache-mb", type=float, default=64, help="guilds 모드 메모리 예산")
+    ap.add_argument("--save-interval", type=float, default=0.05, help="저장 타이머 (실제 초)")
+    ap.add_argument("--select", choices=("teacher", "response", "recent"), default="teacher")
+    ap.add_argument("--no-repeat", type=int, default=0)
+    ap.add_argument("--per-page", type=int, default=5)
+    ap.add_argument("--report-minutes", type=float, default=15.0, help="기록 구간 (가상 분)")
+    ap.add_argument("--tracemalloc", action="store_true", help="봇 모듈이 잡고 있는 파이썬 힙도 기록 (느려짐)")
+    ap.add_argument("--progress", action="store_true", help="구간마다 바로 출력")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="결과를 JSON 으로도 저장할 경로")
+    args = ap.parse_args()
+    total = sum(args.mix)
+    args.mix = [x / total for x in args.mix]
+
+    result = asyncio.run(run(args))
+    if not args.progress:
+        print_header()
+        for row in result["timeline"]:
+            print_row(row)
+    print_result(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    raise SystemExit(1 if result["violations"] else 0)
+
+
+if __name__ == "__main__":
+    main()
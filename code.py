@@ -1,10 +1,28 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from typing import Union, Optional, List, Dict, Any, Tuple
+from typing import Union, Optional, List, Dict, Any, Tuple, Iterable, Iterator, AsyncIterator, Literal
+from collections import OrderedDict, deque
+import abc
 import random
+import bisect
+import unicodedata
+import sys
+from array import array
 import os
+import io
+import csv
 import json
+import tempfile
+import urllib.parse
+import asyncio
+import time
+import threading
+import traceback
+import signal
+import sqlite3
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 
@@ -16,6 +34,77 @@ TOKEN = os.getenv("DISCORD_TOKEN")
 GUILD_ID: Optional[int] = None  # 테스트용 길드(서버) ID 넣으면 빠르게 동기화됨 기본값 : None
 DATA_FILE = "knowledge.json"
 
+# 저장 방식: "snapshot" (JSON 전체 저장, 기존 방식) / "journal" (추가 전용 로그 + 주기적 압축) / "sqlite"
+#           / "guilds" (길드별 파일, 쓰는 길드만 메모리에 올리고 오래 안 쓴 길드는 내림)
+STORAGE_MODE = os.getenv("KNOWLEDGE_STORAGE", "snapshot")
+JOURNAL_FILE = "knowledge.journal"
+SQLITE_FILE = "knowledge.db"
+GUILD_DIR = "knowledge.d"  # guilds 모드: <guild_id>.json 파일들 + index.jsonl (길드별 요약)
+GUILD_CACHE_BYTES = int(float(os.getenv("KNOWLEDGE_GUILD_CACHE_MB", "64")) * 1024 * 1024)  # guilds 모드: 메모리에 둘 길드 지식 예산
+JOURNAL_COMPACT_EVERY = int(os.getenv("KNOWLEDGE_JOURNAL_COMPACT_EVERY", "1000"))  # 이 개수만큼 쌓이면 스냅샷으로 압축
+SAVE_INTERVAL = float(os.getenv("KNOWLEDGE_SAVE_INTERVAL", "2.0"))  # snapshot 모드: 변경을 모아서 최대 이 주기(초)마다 한 번 저장
+VIEW_TIMEOUT = float(os.getenv("KNOWLEDGE_VIEW_TIMEOUT", "900"))  # /배운내용 페이지 뷰 수명(초)
+MAX_OPEN_VIEWS = int(os.getenv("KNOWLEDGE_MAX_OPEN_VIEWS", "500"))  # 동시에 살아 있는 페이지 뷰 최대 개수 (넘으면 오래된 것부터 닫음)
+VIEW_PER_PAGE = int(os.getenv("KNOWLEDGE_VIEW_PER_PAGE", "1"))  # /배운내용 한 페이지 최대 항목 수 (1 이면 예전처럼 한 항목씩)
+
+# 메시지 트리거: "<호출어> <키워드>" 형태만 처리 (쉼표로 여러 개, 예: "호시노야,호시노")
+TRIGGER_WORDS: Tuple[str, ...] = tuple(w.strip() for w in os.getenv("HOSHINO_TRIGGERS", "호시노야").split(",") if w.strip())
+COMMAND_PREFIX = "!"  # 접두사 명령어 (process_commands 로 넘기는 메시지)
+
+# 키워드 감지 (/키워드감지 로 길드마다 켬): 호출어 없는 일반 메시지 안에 배운 키워드가 들어 있어도 대답
+SPOT_GUILDS_FILE = "spot_guilds.json"  # 켠 길드 목록
+SPOT_COOLDOWN = float(os.getenv("HOSHINO_SPOT_COOLDOWN", "30"))   # 같은 채널에서 감지 대답 사이 최소 간격(초)
+SPOT_MIN_LENGTH = int(os.getenv("HOSHINO_SPOT_MIN_LENGTH", "2"))  # 이보다 짧은 키워드는 감지 안 함 ("ㅋ" 같은 말에 매번 반응하지 않게)
+
+# 키워드 매칭: "exact" (그대로 일치, 기존 방식) / "normalized" (대소문자·공백·문장부호·한글 자모 정규화 후 일치)
+#            / "fuzzy" (normalized + 자모 단위 편집 거리 FUZZY_MAX_DISTANCE 이하 중 가장 가까운 키워드)
+MATCH_MODE = os.getenv("HOSHINO_MATCH", "exact")
+FUZZY_MAX_DISTANCE = int(os.getenv("HOSHINO_FUZZY_MAX_DISTANCE", "1"))
+
+# 대답 고르기: "teacher" (가르친 사람 균등 -> 그 사람의 대답 균등, 기존 방식) / "response" (대답마다 균등)
+#            / "recent" (최근에 가르친 대답일수록 자주, SELECT_HALF_LIFE 개 더 새 대답이 생길 때마다 확률 절반)
+SELECT_POLICY = os.getenv("HOSHINO_SELECT", "teacher")
+SELECT_HALF_LIFE = float(os.getenv("HOSHINO_SELECT_HALF_LIFE", "20"))
+SELECT_NO_REPEAT = int(os.getenv("HOSHINO_SELECT_NO_REPEAT", "0"))  # 채널별로 최근 이 개수의 대답은 (다른 대답이 있으면) 다시 안 고름. 0 이면 끔
+
+# 샤딩: 프로세스 하나 = 게이트웨이 샤드 하나 ('python code.py shards' 가 SHARD_COUNT 개를 띄움)
+# 길드는 디스코드와 같은 규칙 ((guild_id >> 22) % SHARD_COUNT) 으로 샤드에 속하고, 지식도 그 샤드만 가진다
+# 샤드마다 파일이 따로 (knowledge.shard0.json ...). 처음 한 번은 기존 knowledge.json 에서 자기 길드만 가져옴
+SHARD_COUNT = int(os.getenv("HOSHINO_SHARD_COUNT", "1"))
+SHARD_ID = int(os.getenv("HOSHINO_SHARD_ID", "0"))
+SHARD_BUS_FILE = os.getenv("HOSHINO_SHARD_BUS", "shard_bus.db")  # 샤드 간 요청/응답을 주고받는 SQLite 파일
+SHARD_BUS_POLL = float(os.getenv("HOSHINO_SHARD_BUS_POLL", "0.05"))  # 받은 편지함 확인 주기(초)
+SHARD_BUS_TIMEOUT = float(os.getenv("HOSHINO_SHARD_BUS_TIMEOUT", "2.0"))  # 다른 샤드 응답 대기(초). 상호작용 응답 기한(3초)보다 짧게
+UNSHARDED_DATA_FILE = DATA_FILE
+UNSHARDED_JOURNAL_FILE = JOURNAL_FILE
+if SHARD_COUNT > 1:
+    DATA_FILE = f"knowledge.shard{SHARD_ID}.json"
+    JOURNAL_FILE = f"knowledge.shard{SHARD_ID}.journal"
+    SQLITE_FILE = f"knowledge.shard{SHARD_ID}.db"
+    GUILD_DIR = f"knowledge.shard{SHARD_ID}.d"
+    SPOT_GUILDS_FILE = f"spot_guilds.shard{SHARD_ID}.json"
+
+# 속도 제한 (토큰 버킷): "초당 충전 개수/최대 몰아쓰기 개수", 초당 개수가 0 이면 끔
+# 답장: 사용자/길드 한도를 넘으면 버리고, 채널 한도를 넘으면 채널 대기열에서 모아 보냄
+RATE_REPLY_USER = os.getenv("HOSHINO_RATE_REPLY_USER", "0.5/3")
+RATE_REPLY_CHANNEL = os.getenv("HOSHINO_RATE_REPLY_CHANNEL", "1/5")  # 디스코드 채널 한도(5초 5개)에 맞춤
+RATE_REPLY_GUILD = os.getenv("HOSHINO_RATE_REPLY_GUILD", "5/20")
+RATE_TEACH_USER = os.getenv("HOSHINO_RATE_TEACH_USER", "0.2/5")
+RATE_TEACH_GUILD = os.getenv("HOSHINO_RATE_TEACH_GUILD", "2/30")
+OUTBOX_MAX = int(os.getenv("HOSHINO_OUTBOX_MAX", "5"))  # 채널별 대기열 길이. 차면 마지막 메시지에 합치고, 못 합치면 버림
+
+# 한도 (0 이면 제한 없음, 기본은 모두 꺼짐 -> 운영자가 환경 변수로 켬. 예: 5000 / 50 / 2000 / 1000)
+# 켜도 이미 넘은 데이터는 그대로 두고 새로 가르치는 것만 막음 (넘은 길드/사람은 python code.py dedupe 가 알려 줌)
+QUOTA_GUILD_KEYWORDS = int(os.getenv("HOSHINO_QUOTA_GUILD_KEYWORDS", "0"))        # 길드당 키워드 수
+QUOTA_KEYWORD_RESPONSES = int(os.getenv("HOSHINO_QUOTA_KEYWORD_RESPONSES", "0"))  # 키워드당 대답 수
+QUOTA_TEACHER_RESPONSES = int(os.getenv("HOSHINO_QUOTA_TEACHER_RESPONSES", "0"))  # 한 사람이 가르친 대답 수 (모든 서버 합계)
+MAX_RESPONSE_LENGTH = int(os.getenv("HOSHINO_MAX_RESPONSE_LENGTH", "0"))          # 대답 길이(글자)
+
+# 일괄 가져오기 / 내보내기 (/가져오기, /내보내기)
+IMPORT_MAX_BYTES = int(os.getenv("HOSHINO_IMPORT_MAX_BYTES", str(1 << 20)))  # 가져올 첨부 파일 최대 크기
+IMPORT_MAX_PAIRS = int(os.getenv("HOSHINO_IMPORT_MAX_PAIRS", "5000"))        # 한 번에 가져올 (키워드, 대답) 최대 개수
+EXPORT_SPOOL_BYTES = 1 << 20  # 내보내기 파일을 이 크기까지만 메모리에, 넘으면 임시 파일로
+
 # 권한 추가 (interaction.user.name)
 privileged_users: List[str] = ["adminstrator","discord_name"] # 자기 디스코드 사용자명 넣기
 
@@ -29,6 +118,96 @@ default_knowledge: Dict[str, str] = {
 }
 
 
+# 계측 (metrics)
+# 단계별 지연 히스토그램 + 카운터, 길드별 태그. 관측 1회 = perf_counter 2번 + 이분 탐색 + 잠금 1번 (운영 중 켜 둬도 됨)
+# 저장 스레드에서도 관측하므로 잠금 사용
+# 노출: HOSHINO_METRICS_PORT 를 주면 127.0.0.1:<port>/metrics (Prometheus 텍스트), 관리자용 /상태 명령
+
+METRICS_PORT = int(os.getenv("HOSHINO_METRICS_PORT", "0"))  # 0 이면 HTTP 엔드포인트 끔
+LOOP_LAG_INTERVAL = float(os.getenv("HOSHINO_LOOP_LAG_INTERVAL", "0.5"))  # 이벤트 루프 지연 샘플링 주기(초)
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                                      0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # 마지막 칸 = +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def quantile(self, q: float) -> float:
+        """버킷 상한 기준 근사 백분위수"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}  # (stage, guild) -> Histogram
+        self.counters: Dict[Tuple[str, str], float] = {}        # (name, guild) -> 값
+
+    def observe(self, stage: str, seconds: float, guild: str = ""):
+        i = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            h = self.histograms.get((stage, guild))
+            if h is None:
+                h = self.histograms[(stage, guild)] = Histogram()
+            h.counts[i] += 1
+            h.total += seconds
+            h.count += 1
+
+    def inc(self, name: str, guild: str = "", n: float = 1):
+        with self._lock:
+            self.counters[(name, guild)] = self.counters.get((name, guild), 0) + n
+
+    def stage_summary(self, stage: str) -> Histogram:
+        """길드 구분 없이 합친 히스토그램"""
+        merged = Histogram()
+        with self._lock:
+            for (s, _), h in self.histograms.items():
+                if s != stage:
+                    continue
+                for i, c in enumerate(h.counts):
+                    merged.counts[i] += c
+                merged.total += h.total
+                merged.count += h.count
+        return merged
+
+    def render_prometheus(self, gauges: List[Tuple[str, str, float]]) -> str:
+        lines: List[str] = ["# TYPE hoshino_stage_seconds histogram"]
+        with self._lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+        for (stage, guild), h in histograms:
+            labels = f'stage="{stage}",guild="{guild}"'
+            acc = 0
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                acc += h.counts[i]
+                lines.append(f'hoshino_stage_seconds_bucket{{{labels},le="{bound}"}} {acc}')
+            lines.append(f'hoshino_stage_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f"hoshino_stage_seconds_sum{{{labels}}} {h.total}")
+            lines.append(f"hoshino_stage_seconds_count{{{labels}}} {h.count}")
+        lines.append("# TYPE hoshino_events_total counter")
+        for (name, guild), v in counters:
+            lines.append(f'hoshino_events_total{{name="{name}",guild="{guild}"}} {v}')
+        lines.append("# TYPE hoshino_gauge gauge")
+        for name, guild, v in gauges:
+            lines.append(f'hoshino_gauge{{name="{name}",guild="{guild}"}} {v}')
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+
+
 # 데이터 파일 입출력 & 정규화 (길드별 저장)
 # 데이터 표준 형식 (새 포맷):
 # {
@@ -48,17 +227,6 @@ def ensure_data_file():
         with open(DATA_FILE, "w", encoding="utf-8") as f:
             json.dump({}, f, ensure_ascii=False, indent=2)
 
-def _is_new_format(obj: Any) -> bool:
-    # 새 포맷은 최상위가 dict이고 값이 dict(=길드 맵)이어야 함
-    if not isinstance(obj, dict):
-        return False
-    # 비어있으면 새 포맷 간주
-    if len(obj) == 0:
-        return True
-    # 임의의 하나를 검사
-    any_val = next(iter(obj.values()))
-    return isinstance(any_val, dict)
-
 def _normalize_legacy_value_to_list_of_dict(val: Any, default_teacher: str = "unknown") -> List[Dict[str, str]]:
     out: List[Dict[str, str]] = []
     if isinstance(val, list):
@@ -115,164 +283,3033 @@ def _migrate_any_legacy_structure(raw: Dict[str, Any]) -> Dict[str, Dict[str, Li
                 migrated[LEGACY_GID].setdefault(key, []).extend(normalized_list)
     return migrated
 
-def _adopt_legacy_into_guild(new_format_data: Dict[str, Dict[str, List[Dict[str, str]]]], guild_id_str: str) -> bool:
+class LoadReport:
+    """로드하면서 확인한 내용 (부팅 경고 / migrate 명령에서 사용)"""
+    __slots__ = ("guilds", "keywords", "responses", "fixed", "dropped", "legacy", "corrupt", "snapshot_seq", "journal_records",
+                 "split_from")
+
+    def __init__(self):
+        self.guilds = 0
+        self.keywords = 0
+        self.responses = 0
+        self.fixed = 0            # 표준 형식이 아니어서 보정한 키워드 수
+        self.dropped = 0          # 버린 키워드/길드 수 (빈 값, 잘못된 타입)
+        self.legacy = False       # 레거시(전역) 포맷 파일
+        self.corrupt = False      # JSON 파싱 실패 (읽은 데까지만 사용)
+        self.snapshot_seq = 0     # 스냅샷에 반영된 마지막 저널 번호
+        self.journal_records = 0  # 재생한 저널 기록 수
+        self.split_from: Optional[str] = None  # 샤드 파일이 없어 샤딩 전 파일에서 자기 길드만 가져왔으면 그 경로
+
+    @property
+    def needs_rewrite(self) -> bool:
+        return bool(self.fixed or self.dropped or self.legacy)
+
+def _iter_json_object(path: str, chunk_size: int = 1 << 20) -> Iterator[Tuple[str, Any]]:
+    """
+    최상위 JSON 객체를 (키, 값) 단위로 차례로 읽음.
+    파일 전체가 아니라 값 하나(= 길드 하나) 분량만 버퍼에 올린다.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            # 버퍼가 모자라면 더 읽음 (큰 값은 읽는 양을 두 배씩 늘려 재시도 횟수 제한)
+            nonlocal buf, pos, eof
+            chunk = f.read(max(chunk_size, len(buf) - pos))
+            if not chunk:
+                eof = True
+            buf = buf[pos:] + chunk
+            pos = 0
+
+        def skip_ws() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return buf[pos] if pos < len(buf) else ""
+                fill()
+
+        def decode() -> Any:
+            nonlocal pos
+            while True:
+                try:
+                    val, end = decoder.raw_decode(buf, pos)
+                    # 버퍼 끝에서 끝난 값(숫자 등)은 잘렸을 수 있으니 더 읽고 다시
+                    if end < len(buf) or eof:
+                        pos = end
+                        return val
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        if skip_ws() != "{":
+            if pos >= len(buf):
+                return  # 빈 파일
+            raise json.JSONDecodeError("최상위가 객체가 아님", buf, pos)
+        pos += 1
+        while True:
+            c = skip_ws()
+            if c == "}":
+                return
+            if c == ",":
+                pos += 1
+                skip_ws()
+            key = decode()
+            if skip_ws() != ":":
+                raise json.JSONDecodeError("':' 없음", buf, pos)
+            pos += 1
+            skip_ws()
+            yield key, decode()
+
+def _is_standard_entry(e: Any) -> bool:
+    return (isinstance(e, dict) and len(e) == 2 and isinstance(e.get("response"), str) and e["response"] != ""
+            and isinstance(e.get("teacher"), str))
+
+def _records_from_kw_map(kw_map: Any, report: LoadReport) -> Dict[str, "KeywordRecord"]:
+    """길드 하나의 키워드 맵 -> 메모리 형식. 표준 형식이 아닌 값만 정규화"""
+    recs: Dict[str, KeywordRecord] = {}
+    if not isinstance(kw_map, dict):
+        report.dropped += 1
+        return recs
+    for kw, val in kw_map.items():
+        if isinstance(val, list) and all(_is_standard_entry(e) for e in val):
+            entries = val
+        else:
+            report.fixed += 1
+            entries = _normalize_legacy_value_to_list_of_dict(val)
+        if not entries:
+            report.dropped += 1
+            continue
+        rec = KeywordRecord()
+        for e in entries:
+            rec.append(e["response"], teacher_table.id_of(e["teacher"]))
+        recs[kw] = rec
+    return recs
+
+def shard_of(guild_id_str: str) -> int:
+    """길드를 가진 샤드 번호. 숫자가 아닌 가상 길드(___LEGACY___)는 0번"""
+    if SHARD_COUNT <= 1 or not guild_id_str.isdigit():
+        return 0
+    return (int(guild_id_str) >> 22) % SHARD_COUNT
+
+def owns_guild(guild_id_str: str) -> bool:
+    return SHARD_COUNT <= 1 or shard_of(guild_id_str) == SHARD_ID
+
+def knowledge_source_file() -> str:
+    """읽을 파일: 보통 DATA_FILE. 샤드 파일이 아직 없으면 샤딩 전 knowledge.json (자기 길드만 골라 읽음)"""
+    if SHARD_COUNT > 1 and not os.path.exists(DATA_FILE) and os.path.exists(UNSHARDED_DATA_FILE):
+        return UNSHARDED_DATA_FILE
+    return DATA_FILE
+
+def iter_knowledge_records(path: str, report: LoadReport) -> Iterator[Tuple[str, Dict[str, "KeywordRecord"]]]:
+    """
+    knowledge.json 을 길드 단위로 읽으면서 바로 메모리 형식으로 바꿔 돌려줌.
+    레거시 포맷(첫 값이 dict 가 아님)이면 항목마다 ___LEGACY___ 로 변환해서 돌려줌.
+    """
+    legacy: Optional[bool] = None
+    for key, val in _iter_json_object(path):
+        if key == META_GID:
+            if isinstance(val, dict):
+                report.snapshot_seq = int(val.get("journal_seq", 0))
+            continue
+        if legacy is None:
+            legacy = not isinstance(val, dict)
+            report.legacy = legacy
+        if legacy:
+            if not owns_guild("___LEGACY___"):
+                continue
+            for gid, kw_map in _migrate_any_legacy_structure({key: val}).items():
+                recs = _records_from_kw_map(kw_map, report)
+                if recs:
+                    yield gid, recs
+            continue
+        if not owns_guild(key):
+            # 다른 샤드 길드 (샤딩 전 파일에서 가져올 때만 해당). 디코드는 했지만 변환하지 않고 버림
+            continue
+        recs = _records_from_kw_map(val, report)
+        if recs:
+            yield key, recs
+        else:
+            report.dropped += 1
+
+def load_knowledge(report: Optional[LoadReport] = None) -> Dict[str, Dict[str, "KeywordRecord"]]:
+    """
+    knowledge.json (+ journal 모드면 저널) 을 스트리밍으로 읽어 메모리 형식으로 돌려줌.
+    정규화는 메모리에서만 하고 파일은 다시 쓰지 않는다 (파일 정리는 'python code.py migrate').
+    """
+    global _journal_seq
+    t = time.perf_counter()
+    source = knowledge_source_file()
+    ensure_data_file()
+    report = report if report is not None else LoadReport()
+    report.split_from = source if source != DATA_FILE else None
+    data: Dict[str, Dict[str, KeywordRecord]] = {}
+    try:
+        for gid, recs in iter_knowledge_records(source, report):
+            target = data.get(gid)
+            if target is None:
+                data[sys.intern(gid)] = recs
+                continue
+            # 레거시 항목 병합
+            for kw, rec in recs.items():
+                if kw in target:
+                    target[kw].extend(rec)
+                else:
+                    target[kw] = rec
+    except json.JSONDecodeError as e:
+        report.corrupt = True
+        print(f"❌ {source} 파싱 실패 (읽은 데까지만 사용): {e}")
+    _journal_seq = report.snapshot_seq
+    if STORAGE_MODE == "journal":
+        # 샤딩 전 파일에서 가져오는 중이면 샤딩 전 저널도 (자기 길드 기록만) 재생
+        _replay_journal(data, report, (UNSHARDED_JOURNAL_FILE + ".old", UNSHARDED_JOURNAL_FILE) if report.split_from else None)
+    report.guilds = len(data)
+    report.keywords = sum(len(recs) for recs in data.values())
+    report.responses = sum(len(rec) for recs in data.values() for rec in recs.values())
+    metrics.observe("load", time.perf_counter() - t)
+    return data
+
+def load_learned_data(report: Optional[LoadReport] = None) -> Dict[str, Dict[str, "KeywordRecord"]]:
+    """부팅 시 로드: 파일 정리가 필요하면 경고만 남김"""
+    report = report if report is not None else LoadReport()
+    data = load_knowledge(report)
+    if report.needs_rewrite:
+        print(f"⚠️ {DATA_FILE} 에 정리가 필요한 항목이 있어 메모리에서만 보정했습니다 "
+              f"(보정 {report.fixed}, 버림 {report.dropped}, 레거시 {report.legacy}). "
+              f"봇을 끈 상태에서 'python code.py migrate' 로 파일을 정리하세요.")
+    return data
+
+def migrate_knowledge_file(check_only: bool = False) -> int:
+    """
+    오프라인 마이그레이션/검증 (봇을 끈 상태에서 실행).
+    check_only 면 검사만 하고 정리가 필요하면 1 반환.
+    """
+    report = LoadReport()
+    data = load_knowledge(report)
+    print(f"길드 {report.guilds}개, 키워드 {report.keywords}개, 대답 {report.responses}개")
+    print(f"보정 {report.fixed}건, 버림 {report.dropped}건, 레거시 포맷: {'예' if report.legacy else '아니오'}, "
+          f"파싱 실패: {'예' if report.corrupt else '아니오'}, 재생한 저널 {report.journal_records}건")
+    if check_only:
+        return 1 if (report.needs_rewrite or report.corrupt) else 0
+    if not report.needs_rewrite and not report.journal_records:
+        print("변경 없음")
+        return 0
+    _rewrite_knowledge_file(data)
+    print(f"✅ {DATA_FILE} 정리 완료")
+    return 0
+
+def _rewrite_knowledge_file(data: Dict[str, Dict[str, "KeywordRecord"]]):
+    """오프라인 명령 공통: data 를 스냅샷으로 다시 쓰고 journal 모드면 저널 파일 정리"""
+    global learned_data
+    learned_data = data
+    save_data(_snapshot_copy())
+    if STORAGE_MODE == "journal":
+        # 스냅샷에 저널 번호까지 반영했으므로 저널 파일은 정리
+        for path in (JOURNAL_OLD_FILE, JOURNAL_FILE):
+            if os.path.exists(path):
+                os.remove(path)
+
+def dedupe_knowledge_file() -> int:
+    """
+    오프라인 중복 정리 (봇을 끈 상태에서 실행): 같은 (키워드, 가르친 사람, 대답) 은 처음 것만 남김.
+    journal 모드면 저널까지 스냅샷으로 합쳐서(압축) 다시 쓴다. 한도를 넘은 길드/사람도 알려줌 (지우지는 않음).
+    """
+    if STORAGE_MODE == "sqlite":
+        db = SqliteKnowledgeStore()
+        removed = db.dedupe()
+        db.shutdown()
+        print(f"✅ {SQLITE_FILE}: 중복 {removed}건 삭제")
+        return 0
+    if STORAGE_MODE == "guilds":
+        # 길드 파일을 하나씩 읽고 중복이 있는 파일만 다시 씀
+        open_guild_dir()
+        removed = 0
+        for gid in list(guild_manifest):
+            recs = _records_from_kw_map(_read_guild_file(gid), LoadReport())
+            n = dedupe_records({gid: recs})
+            if n:
+                removed += n
+                _write_guild_files({gid: {kw: (rec.teacher_ids, rec.responses) for kw, rec in recs.items()}}, teacher_table.names)
+        print(f"✅ {GUILD_DIR}: 중복 {removed}건 삭제")
+        return 0
+    report = LoadReport()
+    data = load_knowledge(report)
+    removed = dedupe_records(data)
+    if removed or report.needs_rewrite or report.journal_records:
+        _rewrite_knowledge_file(data)
+    print(f"✅ {DATA_FILE}: 중복 {removed}건 삭제, 저널 {report.journal_records}건 합침")
+    for gid, recs in data.items():
+        if QUOTA_GUILD_KEYWORDS and len(recs) > QUOTA_GUILD_KEYWORDS:
+            print(f"⚠️ 길드 {gid}: 키워드 {len(recs)}개 (한도 {QUOTA_GUILD_KEYWORDS})")
+        over = sum(1 for rec in recs.values() if QUOTA_KEYWORD_RESPONSES and len(rec) > QUOTA_KEYWORD_RESPONSES)
+        if over:
+            print(f"⚠️ 길드 {gid}: 대답 한도({QUOTA_KEYWORD_RESPONSES})를 넘은 키워드 {over}개")
+    if QUOTA_TEACHER_RESPONSES:
+        per_teacher: Dict[int, int] = {}
+        for recs in data.values():
+            for rec in recs.values():
+                for tid in rec.teacher_ids:
+                    per_teacher[tid] = per_teacher.get(tid, 0) + 1
+        for tid, n in per_teacher.items():
+            if n > QUOTA_TEACHER_RESPONSES:
+                print(f"⚠️ {teacher_table.names[tid]}: 대답 {n}개 (한도 {QUOTA_TEACHER_RESPONSES})")
+    return 0
+
+guild_disk_bytes: Dict[str, int] = {}  # 마지막으로 쓴 스냅샷에서 길드가 차지한 바이트 (사용량 보고용)
+
+def _write_knowledge_file(guild_items: Iterable[Tuple[str, Dict[str, List[Dict[str, str]]]]], journal_seq: Optional[int]):
+    # 길드 하나당 한 줄로 기록 (길드 단위로만 직렬화 -> 전체 문서를 메모리에 만들지 않음)
+    # 임시 파일에 다 쓴 뒤 교체 -> 중간에 죽어도 기존 파일은 온전함
+    t = time.perf_counter()
+    tmp = DATA_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        sep = "\n"
+        f.write("{")
+        if journal_seq is not None:
+            f.write(f'{sep}  "{META_GID}": {{"journal_seq": {journal_seq}}}')
+            sep = ",\n"
+        sizes: Dict[str, int] = {}
+        for gid, kw_map in guild_items:
+            start = f.tell()
+            f.write(f"{sep}  {json.dumps(gid, ensure_ascii=False)}: {json.dumps(kw_map, ensure_ascii=False)}")
+            sizes[gid] = f.tell() - start
+            sep = ",\n"
+        f.write("\n}\n")
+        f.flush()
+        os.fsync(f.fileno())
+        written = f.tell()
+    os.replace(tmp, DATA_FILE)
+    guild_disk_bytes.clear()
+    guild_disk_bytes.update(sizes)
+    metrics.observe("save", time.perf_counter() - t)
+    metrics.inc("save_bytes", n=written)
+
+def _snapshot_copy() -> Tuple[Dict[str, Dict[str, Tuple[array, List[str]]]], List[str]]:
+    # 루프 스레드에서 배열/리스트만 복사 (문자열은 공유). 저장 형식 변환은 저장 스레드에서
+    # guilds 모드는 바뀐 길드만 (비어서 없어진 길드는 빈 맵 -> 파일 삭제)
+    gids = list(dirty_guilds) if STORAGE_MODE == "guilds" else list(learned_data)
+    dirty_guilds.clear()
+    snap = {gid: {kw: (array("I", rec.teacher_ids), list(rec.responses)) for kw, rec in learned_data.get(gid, {}).items()}
+            for gid in gids}
+    return snap, list(teacher_table.names)
+
+def save_data(snapshot: Tuple[Dict[str, Dict[str, Tuple[array, List[str]]]], List[str]]):
+    snap, names = snapshot
+    if STORAGE_MODE == "guilds":
+        _write_guild_files(snap, names)
+        return
+    _write_knowledge_file(_iter_json_guilds(snap, names), _journal_seq if STORAGE_MODE == "journal" else None)
+
+
+
+# 저장 스케줄러 (STORAGE_MODE == "snapshot" / "guilds")
+# 변경 시 dirty 표시만 하고, SAVE_INTERVAL 뒤에 한 번만 저장 (그 사이 변경은 합쳐짐)
+# 직렬화 + 파일 쓰기는 스레드 풀에서 실행 -> 이벤트 루프는 막히지 않음
+# 저장은 늘 _flush_future 하나로 차례대로 (두 저장이 같은 파일/임시 파일을 동시에 쓰거나, 오래된 스냅샷이 나중에 끝나 덮어쓰지 않게)
+# 종료 시 flush_persistence_sync() 로 남은 변경 저장
+
+_dirty = False
+_flush_handle: Optional[asyncio.TimerHandle] = None
+_flush_future: Optional[asyncio.Future] = None
+dirty_guilds: set = set()  # 마지막 저장 이후 바뀐 길드 (guilds 모드는 이 길드 파일만 다시 씀)
+saving_guilds: set = set()  # 마지막으로 시작한 저장에 든 길드 (guilds 모드는 그 저장이 끝날 때까지 내리지 않음)
+
+def mark_dirty(guild_id_str: Optional[str] = None):
+    global _dirty, _flush_handle
+    _dirty = True
+    if guild_id_str is not None:
+        dirty_guilds.add(guild_id_str)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # 루프 밖(스크립트/종료 처리)에서는 바로 저장
+        flush_persistence_sync()
+        return
+    if _flush_handle is None:
+        _flush_handle = loop.call_later(SAVE_INTERVAL, _start_flush)
+
+def _start_flush():
+    global _dirty, _flush_handle, _flush_future
+    _flush_handle = None
+    if not _dirty:
+        return
+    loop = asyncio.get_running_loop()
+    if _flush_future is not None and not _flush_future.done():
+        # 이전 쓰기가 아직 진행 중 -> 다음 주기로 미룸
+        _flush_handle = loop.call_later(SAVE_INTERVAL, _start_flush)
+        return
+    _begin_flush()
+
+def _begin_flush() -> asyncio.Future:
+    # 진행 중인 저장이 없을 때만 호출
+    global _dirty, _flush_future
+    _dirty = False
+    snapshot = _snapshot_copy()
+    saving_guilds.clear()
+    saving_guilds.update(snapshot[0])
+    _flush_future = asyncio.get_running_loop().run_in_executor(None, save_data, snapshot)
+    _flush_future.add_done_callback(lambda fut: _on_flush_done(fut, snapshot))
+    return _flush_future
+
+def guild_save_pending(guild_id_str: str) -> bool:
+    """이 길드의 변경이 아직 파일에 다 쓰이지 않았는지 (dirty 이거나, 쓰는 중인 저장에 들어 있음)"""
+    return guild_id_str in dirty_guilds or (guild_id_str in saving_guilds and _flush_future is not None and not _flush_future.done())
+
+def _redirty(snapshot: Tuple[Dict[str, Any], List[str]]):
+    # 저장 실패: 그 스냅샷에 들어간 길드를 다시 dirty 로
+    global _dirty
+    _dirty = True
+    dirty_guilds.update(snapshot[0])
+
+def _on_flush_done(fut: asyncio.Future, snapshot: Tuple[Dict[str, Any], List[str]]):
+    # saving_guilds 는 여기서 비우지 않음: 이 콜백이 돌기 전에 다음 저장이 이미 시작됐을 수 있음
+    if fut.cancelled():
+        return
+    e = fut.exception()
+    if e is not None:
+        print(f"❌ 데이터 저장 실패: {e}")
+        _redirty(snapshot)
+        mark_dirty()  # 다음 주기에 다시 시도
+
+async def flush_persistence():
+    """대기 중인 저장을 즉시 수행하고 끝날 때까지 기다림 (실패하면 예외, 다시 시도는 스케줄러가)"""
+    global _flush_handle
+    if _flush_handle is not None:
+        _flush_handle.cancel()
+        _flush_handle = None
+    # 기다리는 동안 다른 코루틴이 새 저장을 시작했을 수 있으므로 빌 때까지 반복.
+    # shield: 기다리던 쪽이 취소돼도 스레드의 저장은 계속 진행 중으로 보이게
+    while _flush_future is not None and not _flush_future.done():
+        try:
+            await asyncio.shield(_flush_future)
+        except Exception:
+            pass  # 실패한 저장은 done 콜백이 다시 dirty 로 표시 -> 아래에서 다시 시도
+    if _dirty:
+        await asyncio.shield(_begin_flush())
+
+def flush_persistence_sync():
+    global _dirty, _flush_handle, _journal_fp
+    if _flush_handle is not None:
+        _flush_handle.cancel()
+        _flush_handle = None
+    if _dirty:
+        _dirty = False
+        save_data(_snapshot_copy())
+    if _journal_fp is not None:
+        _journal_fp.close()
+        _journal_fp = None
+
+
+
+# 추가 전용 저널 (STORAGE_MODE == "journal")
+# 한 줄 = 한 건의 변경 (JSON), seq 는 단조 증가
+#   {"seq": n, "op": "add",   "g": gid, "k": keyword, "r": response, "t": teacher}
+#   {"seq": n, "op": "del",   "g": gid, "k": keyword, "t": teacher, "r": [response, ...]}
+#   {"seq": n, "op": "adopt", "g": gid}   (레거시 이관)
+#   {"seq": n, "op": "bulk",  "g": gid, "t": teacher, "p": [[keyword, response], ...]}   (일괄 가져오기, 한 줄 = 전부 또는 없음)
+#   {"seq": n, "op": "purge", "t": teacher} / {"op": "purge", "g": gid, "k": keyword} / {"op": "purge", "g": gid}   (일괄 삭제)
+# 압축: 현재 저널을 .old 로 돌려놓고 새 저널을 연 다음, 스냅샷(+ 마지막 seq)을 백그라운드에서 기록
+# 로드: 스냅샷 -> .old -> 저널 순서로 재생 (스냅샷 seq 이하 기록은 건너뜀)
+# 압축이 끝나지 못해 .old 가 남으면: 로드 때 새 스냅샷으로 합치고 정리, 실행 중이면 회전 없이 다시 압축
+
+META_GID = "___META___"
+JOURNAL_OLD_FILE = JOURNAL_FILE + ".old"
+
+_journal_seq = 0
+_journal_pending = 0  # 마지막 압축 이후 쌓인 기록 수
+_journal_fp = None
+_compaction_future: Optional[asyncio.Future] = None
+JOURNAL_COMPACT_RETRY = 30.0  # 압축(스냅샷 쓰기) 실패 시 다시 시도할 때까지(초)
+
+def _apply_journal_record(data: Dict[str, Dict[str, "KeywordRecord"]], rec: Dict[str, Any]):
+    op = rec.get("op")
+    gid = rec.get("g")
+    if op == "add":
+        _records_add(data, gid, rec["k"], rec["r"], teacher_table.id_of(rec["t"]))
+    elif op == "del":
+        _records_remove(data, gid, rec["k"], teacher_table.id_of(rec.get("t", "unknown")), set(rec.get("r", [])))
+    elif op == "adopt":
+        _records_adopt(data, gid)
+    elif op == "bulk":
+        tid = teacher_table.id_of(rec["t"])
+        for kw, r in rec["p"]:
+            _records_add(data, gid, kw, r, tid)
+    elif op == "purge":
+        _records_purge(data, gid, rec.get("k"), teacher_table.id_of(rec["t"]) if "t" in rec else None)
+
+def _replay_journal(data: Dict[str, Dict[str, "KeywordRecord"]], report: LoadReport,
+                    paths: Optional[Tuple[str, str]] = None):
+    global _journal_seq, _journal_pending
+    for path in paths or (JOURNAL_OLD_FILE, JOURNAL_FILE):
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    # 마지막 줄이 잘린 경우(비정상 종료) 무시
+                    continue
+                seq = int(rec.get("seq", 0))
+                # 길드가 없는 기록(사람 단위 삭제)은 모든 샤드에 해당
+                if seq <= report.snapshot_seq or ("g" in rec and not owns_guild(rec["g"] or "")):
+                    continue
+                _apply_journal_record(data, rec)
+                _journal_seq = max(_journal_seq, seq)
+                _journal_pending += len(rec["p"]) if rec.get("op") == "bulk" else 1
+                report.journal_records += 1
+
+def _journal_append(rec: Dict[str, Any], weight: int = 1):
+    """weight: 압축 주기 계산에 셀 변경 건수 (일괄 기록은 그 안의 항목 수)"""
+    global _journal_seq, _journal_pending, _journal_fp
+    t = time.perf_counter()
+    _journal_seq += 1
+    rec["seq"] = _journal_seq
+    if _journal_fp is None:
+        _journal_fp = open(JOURNAL_FILE, "a", encoding="utf-8")
+    line = json.dumps(rec, ensure_ascii=False) + "\n"
+    _journal_fp.write(line)
+    _journal_fp.flush()
+    _journal_pending += weight
+    metrics.observe("journal_append", time.perf_counter() - t)
+    metrics.inc("journal_bytes", n=len(line))
+    if _journal_pending >= JOURNAL_COMPACT_EVERY:
+        compact_journal()
+
+def _write_snapshot_file(snapshot: Tuple[Dict[str, Dict[str, Tuple[array, List[str]]]], List[str]], seq: int):
+    # 압축 스레드에서 실행: 임시 파일에 쓰고 교체한 뒤 이전 저널 삭제
+    snap, names = snapshot
+    _write_knowledge_file(_iter_json_guilds(snap, names), seq)
+    if os.path.exists(JOURNAL_OLD_FILE):
+        os.remove(JOURNAL_OLD_FILE)
+
+def compact_journal():
+    """저널을 스냅샷으로 압축. 이벤트 루프 안이면 파일 쓰기는 스레드 풀에서 처리"""
+    global _journal_fp, _journal_pending, _compaction_future
+    if _compaction_future is not None and not _compaction_future.done():
+        return
+    snap = _snapshot_copy()
+    seq = _journal_seq
+    # .old 가 남아 있으면 (이전 압축 실패) 회전하지 않음: 이번 스냅샷이 .old 와 지금 저널(seq 까지)을 모두 덮음
+    if not os.path.exists(JOURNAL_OLD_FILE):
+        if _journal_fp is not None:
+            _journal_fp.close()
+            _journal_fp = None
+        if os.path.exists(JOURNAL_FILE):
+            os.replace(JOURNAL_FILE, JOURNAL_OLD_FILE)
+    _journal_pending = 0
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _write_snapshot_file(snap, seq)
+        return
+    _compaction_future = loop.run_in_executor(None, _write_snapshot_file, snap, seq)
+    _compaction_future.add_done_callback(_on_compaction_done)
+
+def _on_compaction_done(fut: asyncio.Future):
+    if fut.cancelled():
+        return
+    e = fut.exception()
+    if e is not None:
+        # .old 는 그대로 둠 (로드 때 재생됨) -> 잠시 뒤 다시 압축
+        print(f"❌ 저널 압축 실패 ({JOURNAL_COMPACT_RETRY:.0f}초 뒤 다시 시도): {e}")
+        metrics.inc("journal_compact_failed")
+        asyncio.get_running_loop().call_later(JOURNAL_COMPACT_RETRY, compact_journal)
+
+# 변경 기록 (명령어/뷰에서 호출)
+# snapshot 모드는 dirty 표시 후 모아서 저장, journal 모드는 한 줄 추가
+
+def record_add(guild_id_str: str, keyword: str, response: str, teacher: str):
+    bump_guild_version(guild_id_str)
+    if STORAGE_MODE == "journal":
+        _journal_append({"op": "add", "g": guild_id_str, "k": keyword, "r": response, "t": teacher})
+    else:
+        mark_dirty(guild_id_str)
+
+def record_delete(guild_id_str: str, keyword: str, teacher: str, responses: List[str]):
+    bump_guild_version(guild_id_str)
+    if STORAGE_MODE == "journal":
+        _journal_append({"op": "del", "g": guild_id_str, "k": keyword, "t": teacher, "r": list(responses)})
+    else:
+        mark_dirty(guild_id_str)
+
+def record_bulk_add(guild_id_str: str, teacher: str, pairs: List[Tuple[str, str]]):
+    bump_guild_version(guild_id_str)
+    if STORAGE_MODE == "journal":
+        _journal_append({"op": "bulk", "g": guild_id_str, "t": teacher, "p": [list(p) for p in pairs]}, weight=len(pairs))
+    else:
+        mark_dirty(guild_id_str)
+
+def record_purge(removed: Dict[str, int], teacher: Optional[str] = None, guild_id_str: Optional[str] = None,
+                 keyword: Optional[str] = None):
+    """일괄 삭제 한 건 = 저널 한 줄 (snapshot/guilds 모드는 바뀐 길드만 dirty)"""
+    for gid in removed:
+        bump_guild_version(gid)
+    if STORAGE_MODE == "journal":
+        rec: Dict[str, Any] = {"op": "purge"}
+        if teacher is not None:
+            rec["t"] = teacher
+        else:
+            rec["g"] = guild_id_str
+            if keyword is not None:
+                rec["k"] = keyword
+        _journal_append(rec, weight=sum(removed.values()))
+    else:
+        for gid in removed:
+            mark_dirty(gid)
+
+def record_adopt(guild_id_str: str):
+    bump_guild_version(guild_id_str)
+    bump_guild_version("___LEGACY___")
+    if STORAGE_MODE == "journal":
+        _journal_append({"op": "adopt", "g": guild_id_str})
+    else:
+        mark_dirty(guild_id_str)
+        mark_dirty("___LEGACY___")  # guilds 모드: 비워진 레거시 파일 삭제
+
+# 길드별 파일 (STORAGE_MODE == "guilds")
+# GUILD_DIR/<guild_id>.json : 그 길드의 키워드 맵 (knowledge.json 의 길드 값과 같은 형식)
+# GUILD_DIR/index.jsonl     : 길드 요약 {"g": gid, "e": {keywords, responses, bytes, mtime, teachers: {이름: 대답 수}}}
+#   추가 전용 (같은 길드는 마지막 줄이 유효, "e": null 은 삭제). 줄이 길드 수의 2배를 넘으면 다시 씀
+#   메모리에 없는 길드의 사용량 / 가르친 사람 한도 / /배운내용 유저: 의 대상 길드 찾기에 씀
+#   시작할 때 파일 크기·수정 시각이 요약과 다른 길드만 다시 읽어 맞춤 (요약을 쓰기 전에 죽은 경우)
+# 처음 시작하면 knowledge.json 을 길드별 파일로 나눔. 어떤 길드를 메모리에 둘지는 GuildFileKnowledgeStore 가 정함
+
+GUILD_INDEX_FILE = "index.jsonl"
+guild_manifest: Dict[str, Dict[str, Any]] = {}
+offline_teacher_responses: Dict[str, int] = {}  # 메모리에 없는 길드에서 가르친 대답 수 (이름 -> 개수, 한도 계산용)
+_manifest_lines = 0
+
+def _guild_path(guild_id_str: str) -> str:
+    return os.path.join(GUILD_DIR, urllib.parse.quote(guild_id_str, safe="") + ".json")
+
+def _read_guild_file(guild_id_str: str) -> Dict[str, Any]:
+    """길드 파일의 키워드 맵 (없으면 빈 맵). 깨진 파일은 경고하고 빈 맵"""
+    try:
+        with open(_guild_path(guild_id_str), "r", encoding="utf-8") as f:
+            kw_map = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError as e:
+        print(f"❌ {_guild_path(guild_id_str)} 파싱 실패 (이 길드는 빈 것으로 취급): {e}")
+        return {}
+    return kw_map if isinstance(kw_map, dict) else {}
+
+def _guild_summary(kw_map: Dict[str, Tuple[array, List[str]]], names: List[str], path: str) -> Dict[str, Any]:
+    teachers: Dict[str, int] = {}
+    responses = 0
+    for tids, resps in kw_map.values():
+        responses += len(resps)
+        for tid in tids:
+            teachers[names[tid]] = teachers.get(names[tid], 0) + 1
+    st = os.stat(path)
+    return {"keywords": len(kw_map), "responses": responses, "bytes": st.st_size, "mtime": st.st_mtime_ns, "teachers": teachers}
+
+def _manifest_update(entries: Dict[str, Optional[Dict[str, Any]]]):
+    """저장 스레드에서 호출. 요약 반영 후 index.jsonl 에 추가 (너무 길어지면 다시 씀)"""
+    global _manifest_lines
+    for gid, e in entries.items():
+        if e is None:
+            guild_manifest.pop(gid, None)
+            guild_disk_bytes.pop(gid, None)
+        else:
+            guild_manifest[gid] = e
+            guild_disk_bytes[gid] = e["bytes"]
+    path = os.path.join(GUILD_DIR, GUILD_INDEX_FILE)
+    if _manifest_lines + len(entries) > 2 * len(guild_manifest) + 64:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for gid, e in list(guild_manifest.items()):
+                f.write(json.dumps({"g": gid, "e": e}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _manifest_lines = len(guild_manifest)
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        for gid, e in entries.items():
+            f.write(json.dumps({"g": gid, "e": e}, ensure_ascii=False) + "\n")
+    _manifest_lines += len(entries)
+
+def _write_guild_files(snap: Dict[str, Dict[str, Tuple[array, List[str]]]], names: List[str]):
+    # 길드마다 임시 파일에 쓰고 교체 (비어 있으면 파일 삭제). 요약은 다 쓴 다음 한 번에
+    t = time.perf_counter()
+    os.makedirs(GUILD_DIR, exist_ok=True)
+    entries: Dict[str, Optional[Dict[str, Any]]] = {}
+    written = 0
+    for gid, kw_map in _iter_json_guilds(snap, names):
+        path = _guild_path(gid)
+        if not kw_map:
+            if os.path.exists(path):
+                os.remove(path)
+            entries[gid] = None
+            continue
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(kw_map, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+            written += f.tell()
+        os.replace(tmp, path)
+        entries[gid] = _guild_summary(snap[gid], names, path)
+    _manifest_update(entries)
+    metrics.observe("save", time.perf_counter() - t)
+    metrics.inc("save_bytes", n=written)
+
+def _split_knowledge_file(source: str):
+    # 처음 한 번: 스트리밍으로 길드 하나씩 읽어 길드 파일로 (같은 길드가 또 나오면 합침)
+    report = LoadReport()
+    seen = set()
+    for gid, recs in iter_knowledge_records(source, report):
+        if gid in seen:
+            prev = _records_from_kw_map(_read_guild_file(gid), LoadReport())
+            for kw, rec in recs.items():
+                if kw in prev:
+                    prev[kw].extend(rec)
+                else:
+                    prev[kw] = rec
+            recs = prev
+        seen.add(gid)
+        _write_guild_files({gid: {kw: (rec.teacher_ids, rec.responses) for kw, rec in recs.items()}}, teacher_table.names)
+    print(f"🗂️ {source} 을(를) 길드별 파일 {len(guild_manifest)}개로 나눴습니다 ({GUILD_DIR})")
+    if os.path.exists(JOURNAL_FILE) or os.path.exists(UNSHARDED_JOURNAL_FILE):
+        print(f"⚠️ 저널 파일은 가져오지 않았습니다. journal 모드에서 'python code.py dedupe' 로 먼저 합친 뒤 {GUILD_DIR} 를 지우고 다시 시작하세요.")
+
+def open_guild_dir():
+    """guilds 모드 시작 (스레드에서): 처음이면 나누고, 아니면 요약을 읽고 파일과 맞춤"""
+    global _manifest_lines
+    os.makedirs(GUILD_DIR, exist_ok=True)
+    index_path = os.path.join(GUILD_DIR, GUILD_INDEX_FILE)
+    names = [n for n in os.listdir(GUILD_DIR) if n.endswith(".json")]
+    source = knowledge_source_file()
+    if not names and not os.path.exists(index_path) and os.path.exists(source):
+        _split_knowledge_file(source)
+        return
+    guild_manifest.clear()
+    _manifest_lines = 0
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 마지막 줄이 잘린 경우 (아래에서 파일과 맞춤)
+                _manifest_lines += 1
+                if rec.get("e") is None:
+                    guild_manifest.pop(rec.get("g"), None)
+                else:
+                    guild_manifest[rec["g"]] = rec["e"]
+    fixed: Dict[str, Optional[Dict[str, Any]]] = {}
+    on_disk = set()
+    for name in names:
+        gid = urllib.parse.unquote(name[:-len(".json")])
+        on_disk.add(gid)
+        path = _guild_path(gid)
+        st = os.stat(path)
+        e = guild_manifest.get(gid)
+        if e is None or e["bytes"] != st.st_size or e["mtime"] != st.st_mtime_ns:
+            recs = _records_from_kw_map(_read_guild_file(gid), LoadReport())
+            fixed[gid] = _guild_summary({kw: (rec.teacher_ids, rec.responses) for kw, rec in recs.items()}, teacher_table.names, path)
+    for gid in guild_manifest:
+        if gid not in on_disk:
+            fixed[gid] = None
+    for gid, e in guild_manifest.items():
+        guild_disk_bytes[gid] = e["bytes"]
+    if fixed:
+        print(f"🗂️ {GUILD_DIR}: 요약과 다른 길드 {len(fixed)}개를 다시 맞췄습니다")
+        _manifest_update(fixed)
+
+def _add_teacher_counts(target: Dict[str, int], counts: Dict[str, int], sign: int):
+    for name, n in counts.items():
+        left = target.get(name, 0) + sign * n
+        if left > 0:
+            target[name] = left
+        else:
+            target.pop(name, None)
+
+# 메모리 표현 (압축)
+# JSON 의 {"response", "teacher"} dict 는 저장 형식으로만 쓰고, 메모리에는 키워드별 병렬 배열로 보관
+#   learned_data[guild_id_str][keyword] -> KeywordRecord
+#   KeywordRecord.responses[i] 를 가르친 사람 = teacher_table.names[KeywordRecord.teacher_ids[i]]
+# 가르친 사람 이름은 teacher_table 에 한 번만 저장 (정수 id 로 참조)
+
+class TeacherTable:
+    """가르친 사람 이름 <-> 정수 id (추가 전용)"""
+    __slots__ = ("names", "ids")
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def id_of(self, name: str) -> int:
+        tid = self.ids.get(name)
+        if tid is None:
+            name = sys.intern(name)
+            tid = len(self.names)
+            self.names.append(name)
+            self.ids[name] = tid
+        return tid
+
+teacher_table = TeacherTable()
+
+SELECT_RETRIES = 4  # 최근에 보낸 대답이 뽑혔을 때 다시 뽑는 최대 횟수 (대답이 적으면 결국 겹쳐도 보냄)
+
+def selection_weights(teacher_ids: array) -> List[float]:
+    """SELECT_POLICY 에 따른 대답별 (정규화 안 된) 가중치. teacher_ids 는 가르친 순서"""
+    n = len(teacher_ids)
+    if SELECT_POLICY == "response":
+        return [1.0] * n
+    if SELECT_POLICY == "recent":
+        decay = 0.5 ** (1.0 / SELECT_HALF_LIFE)
+        return [decay ** (n - 1 - i) for i in range(n)]
+    counts: Dict[int, int] = {}
+    for tid in teacher_ids:
+        counts[tid] = counts.get(tid, 0) + 1
+    return [1.0 / counts[tid] for tid in teacher_ids]
+
+def build_alias_table(weights: List[float]) -> Tuple[array, array]:
+    """Vose 별칭 표 (prob, alias): 칸 i 를 균등하게 고르고 prob[i] 확률로 i, 아니면 alias[i]. 만들기 O(n), 뽑기 O(1)"""
+    n = len(weights)
+    scale = n / sum(weights)
+    prob = array("d", (w * scale for w in weights))
+    alias = array("I", range(n))
+    small = [i for i in range(n) if prob[i] < 1.0]
+    large = [i for i in range(n) if prob[i] >= 1.0]
+    while small and large:
+        s, l = small.pop(), large[-1]
+        alias[s] = l
+        prob[l] -= 1.0 - prob[s]
+        if prob[l] < 1.0:
+            small.append(large.pop())
+    for i in small + large:  # 부동소수 오차로 남은 칸
+        prob[i] = 1.0
+    return prob, alias
+
+class KeywordRecord:
+    """
+    한 키워드의 대답들 (가르친 순서 유지).
+    선택용 별칭 표는 처음 뽑을 때 만든다 (SELECT_POLICY 가중치).
+    바뀌면 표를 버리되, 뽑힌 적 있는 키워드는 False 로 표시해 두고 refresh() 가 바로 다시 만든다
+    (가르치기/삭제 쪽에서 O(대답 수), 답장 쪽은 계속 O(1)).
+    """
+    __slots__ = ("teacher_ids", "responses", "_alias")
+
+    def __init__(self):
+        self.teacher_ids = array("I")
+        self.responses: List[str] = []
+        self._alias: Union[Tuple[array, array], bool, None] = None
+
+    def _stale(self):
+        if self._alias:
+            self._alias = False
+
+    def refresh(self):
+        if self._alias is False and self.responses:
+            self._alias = build_alias_table(selection_weights(self.teacher_ids))
+
+    def __len__(self) -> int:
+        return len(self.responses)
+
+    def append(self, response: str, teacher_id: int):
+        self.teacher_ids.append(teacher_id)
+        self.responses.append(response)
+        self._stale()
+
+    def extend(self, other: "KeywordRecord"):
+        self.teacher_ids.extend(other.teacher_ids)
+        self.responses.extend(other.responses)
+        self._stale()
+
+    def remove(self, teacher_id: int, targets: Optional[set]) -> int:
+        """teacher_id 가 가르친 대답 중 targets 에 있는 것 (None 이면 전부) 삭제. 삭제 개수 반환"""
+        keep_ids = array("I")
+        keep_responses: List[str] = []
+        for tid, r in zip(self.teacher_ids, self.responses):
+            if tid == teacher_id and (targets is None or r in targets):
+                continue
+            keep_ids.append(tid)
+            keep_responses.append(r)
+        removed = len(self.responses) - len(keep_responses)
+        if removed:
+            self.teacher_ids = keep_ids
+            self.responses = keep_responses
+            self._stale()
+        return removed
+
+    def teacher_order(self) -> List[int]:
+        """처음 가르친 순서대로 중복 없는 teacher id"""
+        return list(dict.fromkeys(self.teacher_ids))
+
+    def responses_of(self, teacher_id: int) -> List[str]:
+        return [r for tid, r in zip(self.teacher_ids, self.responses) if tid == teacher_id]
+
+    def _draw(self) -> int:
+        n = len(self.responses)
+        if n == 1:
+            return 0
+        table = self._alias
+        if not table:
+            table = self._alias = build_alias_table(selection_weights(self.teacher_ids))
+        u = random.random() * n
+        i = min(int(u), n - 1)
+        return i if u - i < table[0][i] else table[1][i]
+
+    def pick(self, recent: Optional[deque] = None) -> Tuple[str, int]:
+        # 대답 수와 상관없이 O(1) (recent 는 채널별 최근 대답 몇 개)
+        i = self._draw()
+        if recent:
+            for _ in range(SELECT_RETRIES):
+                if self.responses[i] not in recent:
+                    break
+                i = self._draw()
+        return self.responses[i], self.teacher_ids[i]
+
+
+
+# 가르친 사람 역인덱스: teacher_id -> {guild_id: {keyword: 그 사람이 가르친 대답 수}}
+# (튜플 키 대신 중첩 dict -> 키 문자열은 learned_data 와 공유, 항목당 튜플 할당 없음)
+# 가르치기/삭제 시 증분 갱신 -> /배운내용 유저: 는 그 사람 항목 수에만 비례
+
+teacher_index: Dict[int, Dict[str, Dict[str, int]]] = {}
+
+def _index_add(teacher_id: int, guild_id_str: str, keyword: str, n: int = 1):
+    by_kw = teacher_index.setdefault(teacher_id, {}).setdefault(guild_id_str, {})
+    by_kw[keyword] = by_kw.get(keyword, 0) + n
+
+def _index_sub(teacher_id: int, guild_id_str: str, keyword: str, n: int):
+    by_gid = teacher_index.get(teacher_id)
+    by_kw = by_gid.get(guild_id_str) if by_gid else None
+    if by_kw is None:
+        return
+    left = by_kw.get(keyword, 0) - n
+    if left > 0:
+        by_kw[keyword] = left
+        return
+    by_kw.pop(keyword, None)
+    if not by_kw:
+        by_gid.pop(guild_id_str, None)
+        if not by_gid:
+            teacher_index.pop(teacher_id, None)
+
+def _index_record(guild_id_str: str, keyword: str, rec: KeywordRecord, sign: int = 1):
+    counts: Dict[int, int] = {}
+    for tid in rec.teacher_ids:
+        counts[tid] = counts.get(tid, 0) + 1
+    for tid, n in counts.items():
+        if sign > 0:
+            _index_add(tid, guild_id_str, keyword, n)
+        else:
+            _index_sub(tid, guild_id_str, keyword, n)
+
+def build_teacher_index(data: Dict[str, Dict[str, KeywordRecord]]) -> Dict[int, Dict[str, Dict[str, int]]]:
+    """data 전체로 역인덱스를 새로 만듦 (전역을 건드리지 않으므로 로드 스레드에서 호출 가능)"""
+    index: Dict[int, Dict[str, Dict[str, int]]] = {}
+    for gid, recs in data.items():
+        for kw, rec in recs.items():
+            counts: Dict[int, int] = {}
+            for tid in rec.teacher_ids:
+                counts[tid] = counts.get(tid, 0) + 1
+            for tid, n in counts.items():
+                index.setdefault(tid, {}).setdefault(gid, {})[kw] = n
+    return index
+
+def rebuild_teacher_index():
+    teacher_index.clear()
+    teacher_index.update(build_teacher_index(learned_data))
+
+# 메모리 형식 변경 (data 인자: learned_data 또는 로드 중인 맵)
+
+def _records_add(data: Dict[str, Dict[str, KeywordRecord]], guild_id_str: str, keyword: str, response: str, teacher_id: int) -> KeywordRecord:
+    recs = data.get(guild_id_str)
+    if recs is None:
+        recs = data[guild_id_str] = {}
+    rec = recs.get(keyword)
+    if rec is None:
+        rec = recs[keyword] = KeywordRecord()
+    rec.append(response, teacher_id)
+    return rec
+
+def _records_remove(data: Dict[str, Dict[str, KeywordRecord]], guild_id_str: str, keyword: str, teacher_id: int, targets: Optional[set]) -> int:
+    recs = data.get(guild_id_str)
+    rec = recs.get(keyword) if recs else None
+    if rec is None:
+        return 0
+    removed = rec.remove(teacher_id, targets)
+    if removed and not rec.responses:
+        recs.pop(keyword, None)
+        if not recs:
+            data.pop(guild_id_str, None)
+    return removed
+
+def _records_purge(data: Dict[str, Dict[str, KeywordRecord]], guild_id_str: Optional[str], keyword: Optional[str],
+                   teacher_id: Optional[int]):
+    """저널 재생용 일괄 삭제 (인덱스 없이): 사람 전부(모든 길드) / 키워드 하나 / 길드 전체"""
+    if teacher_id is not None:
+        for gid in list(data):
+            for kw in list(data.get(gid, ())):
+                _records_remove(data, gid, kw, teacher_id, None)
+    elif keyword is not None:
+        recs = data.get(guild_id_str)
+        if recs is not None:
+            recs.pop(keyword, None)
+            if not recs:
+                data.pop(guild_id_str, None)
+    else:
+        data.pop(guild_id_str, None)
+
+def _records_adopt(data: Dict[str, Dict[str, KeywordRecord]], guild_id_str: str) -> Optional[Dict[str, KeywordRecord]]:
     """
     '___LEGACY___'에 보관된 항목을 최초 접근한 길드로 이관.
-    반환값: 실제로 이관이 일어났는지 여부
+    반환값: 이관한 레거시 맵 (없으면 None)
     """
-    LEGACY_GID = "___LEGACY___"
-    if LEGACY_GID not in new_format_data:
+    legacy = data.pop("___LEGACY___", None)
+    if not legacy:
+        return None
+    target = data.setdefault(guild_id_str, {})
+    for kw, rec in legacy.items():
+        if kw in target:
+            target[kw].extend(rec)
+        else:
+            target[kw] = rec
+    return legacy
+
+# learned_data 변경 (인덱스 같이 갱신). 저장 기록은 호출하는 쪽(store)에서
+
+def add_response(guild_id_str: str, keyword: str, response: str, teacher: str) -> KeywordRecord:
+    tid = teacher_table.id_of(teacher)
+    rec = _records_add(learned_data, guild_id_str, keyword, response, tid)
+    _index_add(tid, guild_id_str, keyword)
+    _matcher_add(guild_id_str, keyword)
+    return rec
+
+def remove_responses(guild_id_str: str, keyword: str, teacher: str, targets: set) -> int:
+    tid = teacher_table.ids.get(teacher)
+    if tid is None:
+        return 0
+    removed = _records_remove(learned_data, guild_id_str, keyword, tid, targets)
+    if removed:
+        _index_sub(tid, guild_id_str, keyword, removed)
+        rec = learned_data.get(guild_id_str, {}).get(keyword)
+        if rec is None:
+            _matcher_discard(guild_id_str, keyword)
+        else:
+            rec.refresh()
+    return removed
+
+def adopt_legacy_records(guild_id_str: str) -> bool:
+    # 인덱스는 이관 전 레코드 기준으로 옮김 (extend 로 합쳐지기 전에 센다)
+    legacy = learned_data.get("___LEGACY___")
+    if not legacy:
+        learned_data.pop("___LEGACY___", None)
         return False
-    legacy_map = new_format_data.get(LEGACY_GID, {})
-    if not legacy_map:
-        # 비어있으면 제거
-        new_format_data.pop(LEGACY_GID, None)
+    for kw, rec in legacy.items():
+        _index_record("___LEGACY___", kw, rec, sign=-1)
+        _index_record(guild_id_str, kw, rec)
+    _records_adopt(learned_data, guild_id_str)
+    _matcher_adopt(guild_id_str)
+    return True
+
+# 일괄 삭제 (관리자). 지울 대상은 인덱스로 바로 찾음 (전체를 훑지 않음)
+# 반환: 길드별 삭제한 대답 수
+
+def purge_teacher_responses(teacher: str, guild_ids: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """teacher 가 가르친 대답 전부 (guild_ids 를 주면 그 길드들에서만)"""
+    tid = teacher_table.ids.get(teacher)
+    removed: Dict[str, int] = {}
+    by_gid = teacher_index.get(tid) if tid is not None else None
+    if not by_gid:
+        return removed
+    for gid in list(by_gid) if guild_ids is None else [g for g in guild_ids if g in by_gid]:
+        for kw in list(by_gid.get(gid, ())):
+            n = _records_remove(learned_data, gid, kw, tid, None)
+            if n:
+                removed[gid] = removed.get(gid, 0) + n
+                _index_sub(tid, gid, kw, n)
+                if kw not in learned_data.get(gid, ()):
+                    _matcher_discard(gid, kw)
+    return removed
+
+def purge_keyword_responses(guild_id_str: str, keyword: str) -> Dict[str, int]:
+    recs = learned_data.get(guild_id_str)
+    rec = recs.pop(keyword, None) if recs else None
+    if rec is None:
+        return {}
+    _index_record(guild_id_str, keyword, rec, sign=-1)
+    _matcher_discard(guild_id_str, keyword)
+    if not recs:
+        learned_data.pop(guild_id_str, None)
+    return {guild_id_str: len(rec)}
+
+def purge_guild_responses(guild_id_str: str) -> Dict[str, int]:
+    recs = learned_data.pop(guild_id_str, None)
+    if not recs:
+        return {}
+    for kw, rec in recs.items():
+        _index_record(guild_id_str, kw, rec, sign=-1)
+    keyword_matchers.pop(guild_id_str, None)
+    spot_invalidate(guild_id_str)
+    return {guild_id_str: sum(len(rec) for rec in recs.values())}
+
+# 한도 / 중복 (가르치기 전에 store 가 확인)
+
+class QuotaExceeded(Exception):
+    """가르치기 한도 초과. str(e) 는 사용자에게 그대로 보여줄 문구"""
+
+def check_response_length(response: str):
+    if MAX_RESPONSE_LENGTH and len(response) > MAX_RESPONSE_LENGTH:
+        raise QuotaExceeded(f"대답은 {MAX_RESPONSE_LENGTH}자까지만 가르칠 수 있어요.")
+
+def check_quota(guild_keywords: int, keyword_is_new: bool, keyword_responses: int, teacher_responses: int):
+    """지금 개수 기준으로 하나 더 넣을 수 있는지 (넘으면 QuotaExceeded)"""
+    if keyword_is_new and QUOTA_GUILD_KEYWORDS and guild_keywords >= QUOTA_GUILD_KEYWORDS:
+        raise QuotaExceeded(f"이 서버는 키워드를 {QUOTA_GUILD_KEYWORDS}개까지만 배울 수 있어요.")
+    if QUOTA_KEYWORD_RESPONSES and keyword_responses >= QUOTA_KEYWORD_RESPONSES:
+        raise QuotaExceeded(f"한 키워드에는 대답을 {QUOTA_KEYWORD_RESPONSES}개까지만 가르칠 수 있어요.")
+    if QUOTA_TEACHER_RESPONSES and teacher_responses >= QUOTA_TEACHER_RESPONSES:
+        raise QuotaExceeded(f"한 사람이 가르칠 수 있는 대답은 {QUOTA_TEACHER_RESPONSES}개까지예요.")
+
+def check_bulk_quota(guild_keywords: int, new_keywords: int, keyword_counts: Iterable[Tuple[str, int, int]],
+                     teacher_responses: int, added: int):
+    """일괄 추가 전체가 한도 안에 드는지. keyword_counts: (키워드, 지금 개수, 추가할 개수)"""
+    if new_keywords and QUOTA_GUILD_KEYWORDS and guild_keywords + new_keywords > QUOTA_GUILD_KEYWORDS:
+        raise QuotaExceeded(f"이 서버는 키워드를 {QUOTA_GUILD_KEYWORDS}개까지만 배울 수 있어요. "
+                            f"(지금 {guild_keywords}개, 새 키워드 {new_keywords}개)")
+    if QUOTA_KEYWORD_RESPONSES:
+        for kw, have, add in keyword_counts:
+            if add and have + add > QUOTA_KEYWORD_RESPONSES:
+                raise QuotaExceeded(f"한 키워드에는 대답을 {QUOTA_KEYWORD_RESPONSES}개까지만 가르칠 수 있어요. "
+                                    f"('{kw}': 지금 {have}개, 추가 {add}개)")
+    if added and QUOTA_TEACHER_RESPONSES and teacher_responses + added > QUOTA_TEACHER_RESPONSES:
+        raise QuotaExceeded(f"한 사람이 가르칠 수 있는 대답은 {QUOTA_TEACHER_RESPONSES}개까지예요. "
+                            f"(지금 {teacher_responses}개, 추가 {added}개)")
+
+def teacher_response_count(teacher_id: int) -> int:
+    # 메모리에 있는 길드는 인덱스로, guilds 모드에서 내려간 길드는 길드 요약으로 셈
+    resident = sum(n for by_kw in teacher_index.get(teacher_id, {}).values() for n in by_kw.values())
+    return resident + offline_teacher_responses.get(teacher_table.names[teacher_id], 0)
+
+def try_add_response(guild_id_str: str, keyword: str, response: str, teacher: str) -> bool:
+    """한도/중복 확인 후 추가. 똑같은 (키워드, 가르친 사람, 대답) 이 이미 있으면 False"""
+    check_response_length(response)
+    recs = learned_data.get(guild_id_str, {})
+    rec = recs.get(keyword)
+    tid = teacher_table.ids.get(teacher)
+    if rec is not None and tid is not None and any(t == tid and r == response for t, r in zip(rec.teacher_ids, rec.responses)):
         return False
-    # 이관
-    target_map = new_format_data.setdefault(guild_id_str, {})
-    for kw, arr in legacy_map.items():
-        target_map.setdefault(kw, []).extend(arr)
-    # 레거시 삭제
-    new_format_data.pop(LEGACY_GID, None)
+    check_quota(len(recs), rec is None, len(rec) if rec is not None else 0,
+                teacher_response_count(tid) if tid is not None else 0)
+    add_response(guild_id_str, keyword, response, teacher).refresh()
     return True
 
-def load_data() -> Dict[str, Dict[str, List[Dict[str, str]]]]:
-    ensure_data_file()
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        try:
-            raw = json.load(f)
-        except json.JSONDecodeError:
-            raw = {}
-
-    # 새 포맷이면 그대로(단, 내부 타입 보정)
-    if _is_new_format(raw):
-        # 내부 값 보정: 리스트 내 원소가 dict로 정규화
-        normalized: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
-        for gid, kw_map in raw.items():
-            if not isinstance(kw_map, dict):
+def try_add_many(guild_id_str: str, teacher: str, pairs: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """
+    검증을 마친 (키워드, 대답) 들을 한꺼번에 추가. 이미 있는 항목은 건너뛰고 실제로 추가한 것만 반환.
+    한도를 넘으면 하나도 넣지 않고 QuotaExceeded.
+    """
+    recs = learned_data.get(guild_id_str, {})
+    tid = teacher_table.ids.get(teacher)
+    existing: Dict[str, set] = {}
+    fresh: List[Tuple[str, str]] = []
+    counts: Dict[str, int] = {}
+    for kw, r in pairs:
+        have = existing.get(kw)
+        if have is None:
+            rec = recs.get(kw)
+            have = existing[kw] = {r2 for t, r2 in zip(rec.teacher_ids, rec.responses) if t == tid} if rec is not None and tid is not None else set()
+        if r in have:
+            continue
+        have.add(r)
+        fresh.append((kw, r))
+        counts[kw] = counts.get(kw, 0) + 1
+    keyword_counts = [(kw, len(recs[kw]) if kw in recs else 0, n) for kw, n in counts.items()]
+    check_bulk_quota(len(recs), sum(1 for kw in counts if kw not in recs), keyword_counts,
+                     teacher_response_count(tid) if tid is not None else 0, len(fresh))
+    touched = {id(rec): rec for rec in (add_response(guild_id_str, kw, r, teacher) for kw, r in fresh)}
+    for rec in touched.values():
+        rec.refresh()
+    return fresh
+
+def dedupe_records(data: Dict[str, Dict[str, KeywordRecord]]) -> int:
+    """같은 키워드 안의 중복 (가르친 사람, 대답) 을 처음 것만 남기고 제거. 제거한 개수 반환"""
+    removed = 0
+    for recs in data.values():
+        for rec in recs.values():
+            seen = set()
+            keep = []
+            for tid, r in zip(rec.teacher_ids, rec.responses):
+                if (tid, r) not in seen:
+                    seen.add((tid, r))
+                    keep.append((tid, r))
+            if len(keep) != len(rec.responses):
+                removed += len(rec.responses) - len(keep)
+                rec.teacher_ids = array("I", (tid for tid, _ in keep))
+                rec.responses = [r for _, r in keep]
+                rec._alias = None
+    return removed
+
+def guild_memory_bytes(recs: Dict[str, KeywordRecord]) -> int:
+    """길드 하나가 메모리에서 차지하는 대략의 바이트 (dict/키/레코드/배열/대답 문자열, 공유 문자열도 각각 셈)"""
+    total = sys.getsizeof(recs)
+    for kw, rec in recs.items():
+        total += sys.getsizeof(kw) + sys.getsizeof(rec) + sys.getsizeof(rec.teacher_ids) + sys.getsizeof(rec.responses)
+        total += sum(sys.getsizeof(r) for r in rec.responses)
+        if rec._alias:
+            total += sys.getsizeof(rec._alias[0]) + sys.getsizeof(rec._alias[1])
+    return total
+
+def guild_json_bytes_estimate(recs: Dict[str, KeywordRecord]) -> int:
+    """아직 스냅샷에 안 쓴 길드(저널에만 있는 변경 등)의 JSON 크기 추정: 문자열 UTF-8 길이 + 항목당 고정 오버헤드"""
+    names = teacher_table.names
+    total = 0
+    for kw, rec in recs.items():
+        total += len(kw.encode("utf-8")) + 8
+        total += sum(len(r.encode("utf-8")) + len(names[tid].encode("utf-8")) + 30 for tid, r in zip(rec.teacher_ids, rec.responses))
+    return total
+
+def pick_response(guild_id_str: str, keyword: str, recent: Optional[deque] = None) -> Optional[Tuple[str, str]]:
+    """(response, teacher) 반환. 없으면 None. 딕셔너리 조회 2번 + 별칭 표"""
+    recs = learned_data.get(guild_id_str)
+    if recs is None:
+        return None
+    rec = recs.get(keyword)
+    if rec is None:
+        return None
+    response, tid = rec.pick(recent)
+    return response, teacher_table.names[tid]
+
+# 채널별 최근 대답 (SELECT_NO_REPEAT 개짜리 고리 버퍼). 오래 안 쓴 채널부터 버림
+RECENT_MAX_CHANNELS = 10000
+recent_replies: "OrderedDict[int, deque]" = OrderedDict()
+
+def recent_for_channel(channel_id: int) -> Optional[deque]:
+    if SELECT_NO_REPEAT <= 0:
+        return None
+    ring = recent_replies.get(channel_id)
+    if ring is None:
+        ring = recent_replies[channel_id] = deque(maxlen=SELECT_NO_REPEAT)
+        if len(recent_replies) > RECENT_MAX_CHANNELS:
+            recent_replies.popitem(last=False)
+    else:
+        recent_replies.move_to_end(channel_id)
+    return ring
+
+# 키워드 매칭 인덱스 (MATCH_MODE != "exact" 일 때만 유지)
+# 길드별 KeywordMatcher: 정규형 -> 원래 키워드, 자모 trigram -> 정규형, 자모 길이 -> 정규형
+#   정규형: NFKC(한글 호환 자모 -> 조합) + casefold + 문장부호/공백/제어문자 제거  ("안녕!" == "안 녕" == "안녕")
+#   퍼지: 정규형을 NFD 로 풀어 자모 단위로 비교 ("안녕" 과 "앙녕" 은 받침 하나 차이 = 거리 1)
+#         편집 1번은 trigram 을 최대 3개 깨뜨림 -> 거리 k 이내면 질의 trigram 중 (개수 - 3k) 개 이상을 공유.
+#         길이 차이 k 이내의 포스팅에서 공유 개수를 세어 후보를 거르고, 남은 후보만 거리 계산 (조기 중단)
+# 가르치기/삭제/이관 때 증분 갱신 (전체 다시 만들지 않음)
+
+_IGNORED_CATEGORIES = frozenset("PZC")  # 문장부호 / 공백 / 제어문자
+
+def normalize_keyword(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] not in _IGNORED_CATEGORIES)
+
+def _jamo(form: str) -> str:
+    return unicodedata.normalize("NFD", form)
+
+def _trigrams(jamo: str) -> set:
+    padded = "\x02\x02" + jamo + "\x03\x03"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _edit_distance_within(a: str, b: str, limit: int) -> Optional[int]:
+    """a, b 의 편집 거리. limit 을 넘으면 None (대각선 ±limit 띠만 계산, 한 줄 최솟값이 limit 을 넘으면 중단)"""
+    la, lb = len(a), len(b)
+    if abs(la - lb) > limit:
+        return None
+    big = limit + 1
+    prev = [j if j <= limit else big for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        lo, hi = max(1, i - limit), min(lb, i + limit)
+        cur = [big] * (lb + 1)
+        if i <= limit:
+            cur[0] = i
+        ca = a[i - 1]
+        row_min = cur[0] if lo == 1 else big
+        for j in range(lo, hi + 1):
+            v = prev[j - 1] + (ca != b[j - 1])
+            if prev[j] + 1 < v:
+                v = prev[j] + 1
+            if cur[j - 1] + 1 < v:
+                v = cur[j - 1] + 1
+            cur[j] = v
+            if v < row_min:
+                row_min = v
+        if row_min > limit:
+            return None
+        prev = cur
+    return prev[lb] if prev[lb] <= limit else None
+
+class KeywordMatcher:
+    __slots__ = ("forms", "jamo_forms", "grams", "by_len")
+
+    def __init__(self):
+        self.forms: Dict[str, List[str]] = {}  # 정규형 -> 원래 키워드들 (가르친 순서)
+        self.jamo_forms: Dict[str, str] = {}   # 자모 분해형 -> 정규형 (fuzzy 모드)
+        self.grams: Dict[Tuple[str, int], set] = {}  # (자모 trigram, 자모 길이) -> 자모 분해형 집합 (fuzzy 모드)
+        self.by_len: Dict[int, int] = {}             # 자모 길이 -> 개수 (fuzzy 모드, 비슷한 길이가 없으면 바로 포기)
+
+    def add(self, keyword: str):
+        form = normalize_keyword(keyword)
+        if not form:
+            return
+        kws = self.forms.get(form)
+        if kws is not None:
+            if keyword not in kws:
+                kws.append(keyword)
+            return
+        self.forms[form] = [keyword]
+        if MATCH_MODE == "fuzzy":
+            jamo = _jamo(form)
+            self.jamo_forms[jamo] = form
+            n = len(jamo)
+            for g in _trigrams(jamo):
+                self.grams.setdefault((g, n), set()).add(jamo)
+            self.by_len[len(jamo)] = self.by_len.get(len(jamo), 0) + 1
+
+    def discard(self, keyword: str):
+        form = normalize_keyword(keyword)
+        kws = self.forms.get(form)
+        if kws is None or keyword not in kws:
+            return
+        kws.remove(keyword)
+        if kws:
+            return
+        del self.forms[form]
+        if MATCH_MODE == "fuzzy":
+            jamo = _jamo(form)
+            self.jamo_forms.pop(jamo, None)
+            n = len(jamo)
+            for g in _trigrams(jamo):
+                posting = self.grams.get((g, n))
+                if posting is not None:
+                    posting.discard(jamo)
+                    if not posting:
+                        del self.grams[(g, n)]
+            left = self.by_len.get(len(jamo), 0) - 1
+            if left > 0:
+                self.by_len[len(jamo)] = left
+            else:
+                self.by_len.pop(len(jamo), None)
+
+    def keywords(self) -> Iterator[str]:
+        for kws in self.forms.values():
+            yield from kws
+
+    def match(self, key: str) -> Optional[str]:
+        """key 에 대응하는 키워드 (정확히 같은 키워드 > 같은 정규형 > 가장 가까운 정규형). 없으면 None"""
+        form = normalize_keyword(key)
+        if not form:
+            return None
+        kws = self.forms.get(form)
+        if kws:
+            return key if key in kws else kws[0]
+        if MATCH_MODE != "fuzzy":
+            return None
+        jamo = _jamo(form)
+        # 짧은 말은 허용 거리도 줄임 (자모 3개당 1) -> "네" 가 아무 한 글자에나 걸리지 않게
+        limit = min(FUZZY_MAX_DISTANCE, len(jamo) // 3)
+        if limit <= 0:
+            return None
+        best = self._nearest(jamo, limit)
+        return self.forms[self.jamo_forms[best]][0] if best is not None else None
+
+    def _nearest(self, jamo: str, limit: int) -> Optional[str]:
+        n = len(jamo)
+        lengths = [length for length in range(n - limit, n + limit + 1) if length in self.by_len]
+        if not lengths:
+            return None
+        # 포스팅은 길이별로 나뉘어 있음 -> 길이가 비슷한 키워드만 본다
+        postings = [[p for p in (self.grams.get((g, length)) for length in lengths) if p] for g in _trigrams(jamo)]
+        postings.sort(key=lambda ps: sum(len(p) for p in ps))
+        # limit <= len // 3 이므로 need 는 항상 1 이상
+        need = len(postings) - 3 * limit
+        prefix = 3 * limit + 1
+        # 1) 가장 드문 3k+1 개 포스팅에서 후보 수집 (거리 k 이내면 이 중 하나는 반드시 공유)
+        shared: Dict[str, int] = {}
+        for ps in postings[:prefix]:
+            for p in ps:
+                for cand in p:
+                    shared[cand] = shared.get(cand, 0) + 1
+        # 2) 나머지 trigram 은 후보 쪽에서 포함 여부만 확인
+        for ps in postings[prefix:]:
+            for cand in shared:
+                if any(cand in p for p in ps):
+                    shared[cand] += 1
+        candidates = [cand for cand, c in shared.items() if c >= need]
+        best: Optional[Tuple[int, str]] = None
+        for cand in candidates:
+            d = _edit_distance_within(jamo, cand, limit if best is None else best[0])
+            if d is not None and (best is None or (d, cand) < best):
+                best = (d, cand)
+        return best[1] if best is not None else None
+
+keyword_matchers: Dict[str, KeywordMatcher] = {}
+
+def build_keyword_matchers(pairs: Iterable[Tuple[str, str]]) -> Dict[str, KeywordMatcher]:
+    """(guild_id, keyword) 들로 새로 만듦 (전역을 건드리지 않으므로 로드 스레드에서 호출 가능)"""
+    matchers: Dict[str, KeywordMatcher] = {}
+    if MATCH_MODE == "exact":
+        return matchers
+    for gid, kw in pairs:
+        m = matchers.get(gid)
+        if m is None:
+            m = matchers[gid] = KeywordMatcher()
+        m.add(kw)
+    return matchers
+
+def _matcher_add(guild_id_str: str, keyword: str):
+    spot_keyword_added(guild_id_str, keyword)
+    if MATCH_MODE == "exact":
+        return
+    m = keyword_matchers.get(guild_id_str)
+    if m is None:
+        m = keyword_matchers[guild_id_str] = KeywordMatcher()
+    m.add(keyword)
+
+def _matcher_discard(guild_id_str: str, keyword: str):
+    spot_keyword_removed(guild_id_str, keyword)
+    m = keyword_matchers.get(guild_id_str)
+    if m is not None:
+        m.discard(keyword)
+
+def _matcher_adopt(guild_id_str: str):
+    spot_invalidate(guild_id_str)
+    legacy = keyword_matchers.pop("___LEGACY___", None)
+    if legacy is not None:
+        for kw in list(legacy.keywords()):
+            _matcher_add(guild_id_str, kw)
+
+def resolve_keyword(guild_id_str: str, key: str) -> Optional[str]:
+    """정확히 일치하는 키워드가 없을 때 정규형/퍼지로 찾은 키워드 (MATCH_MODE == "exact" 면 항상 None)"""
+    m = keyword_matchers.get(guild_id_str)
+    if m is None:
+        return None
+    kw = m.match(key)
+    if kw is not None and kw != key:
+        metrics.inc("trigger_resolved", guild_id_str)
+    return kw
+
+# 키워드 감지 (켠 길드만)
+# 길드 키워드 전부로 Aho-Corasick 오토마톤을 만들어 메시지를 한 글자씩 한 번만 훑음 (키워드 수와 상관없이 메시지 길이에 비례)
+# 키워드가 새로 생기거나 없어지면 그 길드 오토마톤을 '낡음' 으로 표시하고, 다음 메시지 때 store 의 키워드로 다시 만듦
+#   만드는 건 스레드 풀에서 (키워드 수만 개면 수백 ms) 길드당 하나만. 새 것이 준비될 때까지는 낡은 것으로 감지
+#   (지워진 키워드에 걸리면 store.pick 이 None -> 대답 안 함, 새 키워드는 조금 늦게 감지될 뿐)
+# 비교는 casefold 기준, 여러 개가 들어 있으면 가장 긴 키워드 (길이가 같으면 먼저 끝나는 것)
+
+class KeywordAutomaton:
+    """
+    goto[상태] = {글자: 다음 상태}, fail[상태] = 실패 링크,
+    out[상태] = 그 위치에서 끝나는 가장 긴 키워드 (자기가 키워드면 자기, 아니면 실패 링크 쪽 것)
+    """
+    __slots__ = ("goto", "fail", "out", "keywords")
+
+    def __init__(self, keywords: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.out: List[Optional[str]] = [None]
+        self.keywords: Dict[str, str] = {}  # casefold 형 -> 원래 키워드 (처음 것)
+        for kw in keywords:
+            folded = kw.casefold()
+            if len(folded) < SPOT_MIN_LENGTH or folded in self.keywords:
+                continue
+            self.keywords[folded] = kw
+            state = 0
+            for ch in folded:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = self.goto[state][ch] = len(self.goto)
+                    self.goto.append({})
+                    self.out.append(None)
+                state = nxt
+            self.out[state] = folded
+        # 너비 우선으로 실패 링크 (얕은 상태가 먼저 끝나므로 out 도 같이 채움)
+        self.fail = array("I", [0]) * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                f = self.goto[f].get(ch, 0) if state else 0
+                self.fail[nxt] = f
+                if self.out[nxt] is None:
+                    self.out[nxt] = self.out[f]
+
+    def find(self, text: str) -> Optional[str]:
+        if not self.keywords:
+            return None
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        best: Optional[str] = None
+        for ch in text.casefold():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = out[state]
+            if hit is not None and (best is None or len(hit) > len(best)):
+                best = hit
+        return self.keywords[best] if best is not None else None
+
+spot_guilds: set = set()
+spot_guild_ids: set = set()  # spot_guilds 의 int 사본 (on_message 에서 str() 없이 바로 확인)
+spot_automata: Dict[str, KeywordAutomaton] = {}
+spot_last_reply: "OrderedDict[int, float]" = OrderedDict()  # 채널 id -> 마지막 감지 대답 시각 (monotonic)
+_spot_generation: Dict[str, int] = {}  # 오토마톤을 만드는 동안 키워드가 바뀌었는지 확인용
+_spot_stale: set = set()  # 키워드가 바뀌어 다시 만들어야 하는 길드 (그동안 spot_automata 의 낡은 것을 씀)
+_spot_builds: Dict[str, "asyncio.Future[KeywordAutomaton]"] = {}  # 길드별 만드는 중인 작업 (하나만)
+
+def load_spot_guilds():
+    if os.path.exists(SPOT_GUILDS_FILE):
+        with open(SPOT_GUILDS_FILE, "r", encoding="utf-8") as f:
+            spot_guilds.update(str(gid) for gid in json.load(f))
+    spot_guild_ids.update(int(gid) for gid in spot_guilds)
+
+def save_spot_guilds():
+    tmp = SPOT_GUILDS_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(sorted(spot_guilds), f)
+    os.replace(tmp, SPOT_GUILDS_FILE)
+
+def spot_invalidate(guild_id_str: str):
+    """
+    키워드가 바뀜: 다음 메시지 때 다시 만들도록 표시 (그때까지는 지금 것을 씀).
+    만드는 중인 것도 낡음 -> 세대를 올려 두면 _spot_build 가 끝나고 낡음 표시를 남김
+    """
+    if guild_id_str in spot_guilds:
+        _spot_generation[guild_id_str] = _spot_generation.get(guild_id_str, 0) + 1
+        if guild_id_str in spot_automata or guild_id_str in _spot_builds:
+            _spot_stale.add(guild_id_str)
+
+def spot_forget(guild_id_str: str):
+    """감지를 끔: 오토마톤을 버림 (만드는 중인 것은 끝나도 넣지 않음)"""
+    _spot_generation[guild_id_str] = _spot_generation.get(guild_id_str, 0) + 1
+    spot_automata.pop(guild_id_str, None)
+    _spot_stale.discard(guild_id_str)
+
+def spot_keyword_added(guild_id_str: str, keyword: str):
+    # 처음 만드는 중이면 그 작업이 이 키워드를 읽었는지 알 수 없음 -> 무조건 낡음
+    a = spot_automata.get(guild_id_str)
+    folded = keyword.casefold()
+    if len(folded) >= SPOT_MIN_LENGTH and (guild_id_str in _spot_builds or (a is not None and folded not in a.keywords)):
+        spot_invalidate(guild_id_str)
+
+def spot_keyword_removed(guild_id_str: str, keyword: str):
+    a = spot_automata.get(guild_id_str)
+    if guild_id_str in _spot_builds or (a is not None and a.keywords.get(keyword.casefold()) == keyword):
+        spot_invalidate(guild_id_str)
+
+async def _spot_build(guild_id_str: str) -> KeywordAutomaton:
+    try:
+        generation = _spot_generation.get(guild_id_str, 0)
+        keywords = await store.keywords_for_guild(guild_id_str)  # 새 리스트 -> 스레드에서 읽어도 안전
+        t = time.perf_counter()
+        a = await asyncio.get_running_loop().run_in_executor(None, KeywordAutomaton, keywords)
+        metrics.observe("spot_build", time.perf_counter() - t, guild_id_str)
+        if guild_id_str in spot_guilds:
+            # 만드는 동안 세대가 바뀌었으면 (키워드 변경) 넣되 낡음으로 -> 다음 메시지가 한 번 더 만듦
+            spot_automata[guild_id_str] = a
+            if _spot_generation.get(guild_id_str, 0) == generation:
+                _spot_stale.discard(guild_id_str)
+            else:
+                _spot_stale.add(guild_id_str)
+        return a
+    finally:
+        _spot_builds.pop(guild_id_str, None)
+
+async def spot_automaton(guild_id_str: str) -> KeywordAutomaton:
+    a = spot_automata.get(guild_id_str)
+    if a is not None and guild_id_str not in _spot_stale:
+        return a
+    build = _spot_builds.get(guild_id_str)
+    if build is None:
+        build = _spot_builds[guild_id_str] = asyncio.ensure_future(_spot_build(guild_id_str))
+    if a is not None:
+        return a  # 새 것이 준비될 때까지 낡은 것으로
+    # 처음 만드는 중: 동시에 온 메시지들이 같은 작업을 기다림 (한 메시지가 취소돼도 만들기는 계속)
+    return await asyncio.shield(build)
+
+# 메모리 (봇 시작 시 load_knowledge_store() 가 백그라운드 스레드에서 한 번만 채움)
+# sqlite 모드는 전체를 메모리에 올리지 않음
+learned_data: Dict[str, Dict[str, KeywordRecord]] = {}
+
+def _iter_json_guilds(snap: Dict[str, Dict[str, Tuple[array, List[str]]]], names: List[str]):
+    # 저장 스레드에서 길드 하나씩 저장 형식으로 변환 (전체 JSON 객체를 한 번에 만들지 않음)
+    for gid, kw_map in snap.items():
+        yield gid, {kw: [{"response": r, "teacher": names[tid]} for tid, r in zip(tids, responses)]
+                    for kw, (tids, responses) in kw_map.items()}
+
+
+
+# 봇 초기화
+
+
+intents = discord.Intents.default()
+intents.message_content = True
+bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents,
+                   **({"shard_id": SHARD_ID, "shard_count": SHARD_COUNT} if SHARD_COUNT > 1 else {}))
+tree = bot.tree
+
+
+# 헬퍼
+
+def gid_str_from_guild(guild: Optional[discord.Guild]) -> Optional[str]:
+    return str(guild.id) if guild else None
+
+# 페이지 키: (guild_id, keyword, teacher)
+# /배운내용 은 키 목록만 먼저 만들고, 실제 대답 목록은 보고 있는 페이지만 꺼낸다
+EntryKey = Tuple[str, str, str]
+
+# 내보내기 한 행: (guild_id, keyword, teacher, response). store 는 EXPORT_BATCH 행씩 묶어서 넘겨줌
+ExportRow = Tuple[str, str, str, str]
+EXPORT_BATCH = 500
+
+def entry_keys_for_guild(guild_id_str: str, filter_user: Optional[str] = None) -> List[EntryKey]:
+    """해당 길드 안의 페이지 키 목록 (옵션: 특정 teacher 필터)"""
+    if filter_user is not None:
+        # 역인덱스 사용: 그 사람이 가르친 항목만 훑음
+        tid = teacher_table.ids.get(filter_user)
+        return [(guild_id_str, kw, filter_user) for kw in teacher_index.get(tid, {}).get(guild_id_str, {})]
+    names = teacher_table.names
+    return [(guild_id_str, kw, names[tid])
+            for kw, rec in learned_data.get(guild_id_str, {}).items() for tid in rec.teacher_order()]
+
+def entry_keys_for_user_all_guilds(username: str) -> List[EntryKey]:
+    """모든 길드에서 해당 유저가 가르친 페이지 키 목록 (역인덱스 조회)"""
+    tid = teacher_table.ids.get(username)
+    return [(gid, kw, username) for gid, by_kw in teacher_index.get(tid, {}).items() for kw in by_kw]
+
+def get_entry(guild_id_str: str, keyword: str, teacher: str) -> Optional[Dict[str, Any]]:
+    """
+    페이지 항목 하나 구성. 그 사이 삭제됐으면 None
+    항목 구조: { "guild_id": str, "keyword": str, "teacher": str, "responses": List[str] }
+    """
+    rec = learned_data.get(guild_id_str, {}).get(keyword)
+    tid = teacher_table.ids.get(teacher)
+    if rec is None or tid is None:
+        return None
+    responses = rec.responses_of(tid)
+    if not responses:
+        return None
+    return {"guild_id": guild_id_str, "keyword": keyword, "teacher": teacher, "responses": responses}
+
+
+
+# 지식 저장소 (KnowledgeStore)
+# 명령어/뷰는 learned_data 를 직접 건드리지 않고 store 를 통해 읽고 쓴다.
+#   - JsonKnowledgeStore: 메모리(learned_data) + knowledge.json (snapshot/journal 모드)
+#   - SqliteKnowledgeStore: knowledge.db, 필요한 행만 조회 (전체를 메모리에 올리지 않음)
+
+class KnowledgeStore(abc.ABC):
+    @abc.abstractmethod
+    async def open(self):
+        """봇 준비 시 호출 (여러 번 호출돼도 됨)"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def shutdown(self):
+        """봇 종료 후 호출 (동기). 남은 변경 저장/연결 정리"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def adopt_legacy(self, guild_id_str: str) -> bool:
+        """___LEGACY___ 데이터를 이 길드로 이관. 실제로 이관했으면 True"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def add(self, guild_id_str: str, keyword: str, response: str, teacher: str) -> bool:
+        """한도를 넘으면 QuotaExceeded. 똑같은 항목이 이미 있으면 추가하지 않고 False"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def add_many(self, guild_id_str: str, teacher: str, pairs: List[Tuple[str, str]]) -> int:
+        """
+        검증을 마친 (키워드, 대답) 들을 한 트랜잭션으로 추가 (저장도 한 번). 이미 있는 항목은 건너뜀.
+        한도를 넘으면 하나도 넣지 않고 QuotaExceeded. 실제로 추가한 개수 반환
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def remove(self, guild_id_str: str, keyword: str, teacher: str, responses: List[str]) -> int:
+        """teacher 가 가르친 responses 삭제. 삭제된 개수 반환"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def pick(self, guild_id_str: str, keyword: str, recent: Optional[deque] = None) -> Optional[Tuple[str, str]]:
+        """(response, teacher) 하나 선택 (recent 에 있는 대답은 되도록 피함). 없으면 None"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def purge_teacher(self, teacher: str) -> int:
+        """teacher 가 모든 길드에서 가르친 대답 전부 삭제 (저장 한 번). 삭제된 개수 반환"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def purge_keyword(self, guild_id_str: str, keyword: str) -> int:
+        """길드의 키워드 하나를 가르친 사람 상관없이 삭제"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def purge_guild(self, guild_id_str: str) -> int:
+        """길드가 배운 것 전부 삭제"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def keys_for_guild(self, guild_id_str: str, filter_user: Optional[str] = None) -> List[EntryKey]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def keywords_for_guild(self, guild_id_str: str) -> List[str]:
+        """길드의 키워드 (중복 없이)"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def keys_for_teacher(self, teacher: str) -> List[EntryKey]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_entry(self, guild_id_str: str, keyword: str, teacher: str) -> Optional[Dict[str, Any]]:
+        """페이지 하나 분량의 항목. 없으면 None"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def usage(self) -> List[Dict[str, Any]]:
+        """길드별 사용량 [{guild_id, keywords, responses, memory_bytes, disk_bytes}, ...]"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def export_rows(self, guild_id_str: Optional[str] = None, teacher: Optional[str] = None) -> AsyncIterator[List[ExportRow]]:
+        """한 길드(또는 한 사람이 가르친) 전체를 EXPORT_BATCH 행씩 (길드, 키워드) 순으로 묶어서 내줌"""
+        raise NotImplementedError
+
+
+class JsonKnowledgeStore(KnowledgeStore):
+    def __init__(self):
+        self._opened = False
+
+    async def open(self):
+        # 한 번만 로드 (재접속 시에는 메모리 상태 그대로 사용)
+        global learned_data
+        if self._opened:
+            return
+        data, index, matchers = await asyncio.get_running_loop().run_in_executor(None, _load_in_thread)
+        learned_data = data
+        teacher_index.clear()
+        teacher_index.update(index)
+        keyword_matchers.clear()
+        keyword_matchers.update(matchers)
+        self._opened = True
+
+    def shutdown(self):
+        flush_persistence_sync()
+
+    async def adopt_legacy(self, guild_id_str: str) -> bool:
+        if not adopt_legacy_records(guild_id_str):
+            return False
+        record_adopt(guild_id_str)
+        return True
+
+    async def add(self, guild_id_str: str, keyword: str, response: str, teacher: str) -> bool:
+        if not try_add_response(guild_id_str, keyword, response, teacher):
+            return False
+        record_add(guild_id_str, keyword, response, teacher)
+        return True
+
+    async def add_many(self, guild_id_str: str, teacher: str, pairs: List[Tuple[str, str]]) -> int:
+        fresh = try_add_many(guild_id_str, teacher, pairs)
+        if fresh:
+            record_bulk_add(guild_id_str, teacher, fresh)
+        return len(fresh)
+
+    async def remove(self, guild_id_str: str, keyword: str, teacher: str, responses: List[str]) -> int:
+        targets = set(responses)
+        removed = remove_responses(guild_id_str, keyword, teacher, targets)
+        if removed:
+            record_delete(guild_id_str, keyword, teacher, list(targets))
+        return removed
+
+    async def purge_teacher(self, teacher: str) -> int:
+        removed = purge_teacher_responses(teacher)
+        if removed:
+            record_purge(removed, teacher=teacher)
+        return sum(removed.values())
+
+    async def purge_keyword(self, guild_id_str: str, keyword: str) -> int:
+        removed = purge_keyword_responses(guild_id_str, keyword)
+        if removed:
+            record_purge(removed, guild_id_str=guild_id_str, keyword=keyword)
+        return sum(removed.values())
+
+    async def purge_guild(self, guild_id_str: str) -> int:
+        removed = purge_guild_responses(guild_id_str)
+        if removed:
+            record_purge(removed, guild_id_str=guild_id_str)
+        return sum(removed.values())
+
+    async def pick(self, guild_id_str: str, keyword: str, recent: Optional[deque] = None) -> Optional[Tuple[str, str]]:
+        picked = pick_response(guild_id_str, keyword, recent)
+        if picked is None and MATCH_MODE != "exact":
+            kw = resolve_keyword(guild_id_str, keyword)
+            if kw is not None:
+                picked = pick_response(guild_id_str, kw, recent)
+        return picked
+
+    async def keys_for_guild(self, guild_id_str: str, filter_user: Optional[str] = None) -> List[EntryKey]:
+        return entry_keys_for_guild(guild_id_str, filter_user=filter_user)
+
+    async def keywords_for_guild(self, guild_id_str: str) -> List[str]:
+        return list(learned_data.get(guild_id_str, ()))
+
+    async def keys_for_teacher(self, teacher: str) -> List[EntryKey]:
+        return entry_keys_for_user_all_guilds(teacher)
+
+    async def get_entry(self, guild_id_str: str, keyword: str, teacher: str) -> Optional[Dict[str, Any]]:
+        return get_entry(guild_id_str, keyword, teacher)
+
+    async def usage(self) -> List[Dict[str, Any]]:
+        out = []
+        for gid in list(learned_data):
+            recs = learned_data.get(gid)
+            if recs is None:
+                continue
+            out.append({"guild_id": gid, "keywords": len(recs), "responses": sum(len(rec) for rec in recs.values()),
+                        "memory_bytes": guild_memory_bytes(recs),
+                        "disk_bytes": guild_disk_bytes.get(gid) or guild_json_bytes_estimate(recs)})
+            await asyncio.sleep(0)  # 큰 데이터에서도 이벤트 루프를 오래 막지 않게 길드마다 양보
+        return out
+
+    async def export_rows(self, guild_id_str: Optional[str] = None, teacher: Optional[str] = None) -> AsyncIterator[List[ExportRow]]:
+        # 키워드 목록만 먼저 복사하고, 레코드는 꺼낼 때마다 다시 찾음 (배치 사이에 바뀌어도 안전)
+        names = teacher_table.names
+        if teacher is None:
+            plan = [(guild_id_str, list(learned_data.get(guild_id_str, ())))]
+            tid = None
+        else:
+            tid = teacher_table.ids.get(teacher)
+            by_guild = teacher_index.get(tid, {}) if tid is not None else {}
+            plan = [(gid, list(by_kw)) for gid, by_kw in list(by_guild.items())]
+        batch: List[ExportRow] = []
+        for gid, kws in plan:
+            for kw in kws:
+                rec = learned_data.get(gid, {}).get(kw)
+                if rec is None:
+                    continue
+                batch.extend((gid, kw, names[t], r) for t, r in zip(rec.teacher_ids, rec.responses) if tid is None or t == tid)
+                if len(batch) >= EXPORT_BATCH:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+
+def _load_in_thread() -> Tuple[Dict[str, Dict[str, KeywordRecord]], Dict[int, Dict[str, Dict[str, int]]], Dict[str, KeywordMatcher]]:
+    global _journal_pending
+    report = LoadReport()
+    data = load_learned_data(report)
+    # 지난번 압축이 끝나지 못함 (도중 종료 / 쓰기 실패): 스냅샷 + .old + 저널을 새 스냅샷으로 합치고 저널 정리
+    unfinished = STORAGE_MODE == "journal" and os.path.exists(JOURNAL_OLD_FILE) and not report.corrupt
+    if report.split_from or unfinished:
+        # 아직 아무도 data 를 건드리지 않으므로 복사 없이 바로 기록
+        snap = {gid: {kw: (rec.teacher_ids, rec.responses) for kw, rec in recs.items()} for gid, recs in data.items()}
+        _write_knowledge_file(_iter_json_guilds(snap, teacher_table.names), _journal_seq if STORAGE_MODE == "journal" else None)
+        _journal_pending = 0  # 재생한 저널은 방금 쓴 스냅샷에 들어감
+        if report.split_from:
+            print(f"🧩 샤드 {SHARD_ID}: {report.split_from} 에서 길드 {len(data)}개를 {DATA_FILE} 로 가져왔습니다")
+        if unfinished:
+            for path in (JOURNAL_OLD_FILE, JOURNAL_FILE):
+                if os.path.exists(path):
+                    os.remove(path)
+            print(f"🧹 끝나지 못한 저널 압축을 마무리했습니다 (저널 {report.journal_records}건을 {DATA_FILE} 에 합침)")
+    pairs = ((gid, kw) for gid, recs in data.items() for kw in recs)
+    return data, build_teacher_index(data), build_keyword_matchers(pairs)
+
+
+EMPTY_RECORD_BYTES = sys.getsizeof(KeywordRecord()) + sys.getsizeof(array("I")) + sys.getsizeof([]) + 100  # 새 키워드 하나 (dict 슬롯 포함 대략)
+
+class GuildFileKnowledgeStore(JsonKnowledgeStore):
+    """
+    STORAGE_MODE == "guilds": 길드 지식은 처음 쓸 때(트리거/가르치기/배운내용) 그 길드 파일에서 올리고,
+    메모리 예산(budget)을 넘으면 가장 오래 안 쓴 길드부터 내린다. 바뀐 길드는 저장을 먼저 끝낸 뒤에 내림.
+    메모리에 올라온 길드에 대한 동작은 JsonKnowledgeStore 와 같고, 저장은 바뀐 길드 파일만 다시 씀.
+    """
+
+    def __init__(self, budget: int = GUILD_CACHE_BYTES):
+        super().__init__()
+        self.budget = budget
+        self.resident_bytes = 0
+        self._lru: "OrderedDict[str, int]" = OrderedDict()  # 메모리에 있는 길드 -> 크기 추정 (비어 있어도 저장 전까지는 여기 있음)
+        self._stale: set = set()                            # 크게 바뀌어서 크기를 다시 재야 하는 길드
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    async def open(self):
+        if self._opened:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, open_guild_dir)
+        offline_teacher_responses.clear()
+        for e in list(guild_manifest.values()):
+            _add_teacher_counts(offline_teacher_responses, e["teachers"], 1)
+        self._opened = True
+
+    async def _ensure(self, guild_id_str: str, keep: Tuple[str, ...] = ()):
+        """
+        길드를 메모리에 올림 (이미 있으면 최근 사용으로 표시만).
+        돌아온 뒤 await 없이 바로 쓰면 그 사이 내려가지 않음 -> 기다리는 동안 다른 코루틴이 내렸으면 다시 올림
+        """
+        while guild_id_str not in self._lru:
+            if guild_id_str not in guild_manifest:
+                return  # 파일이 없는 길드 (아직 배운 게 없음)
+            fut = self._loading.get(guild_id_str)
+            if fut is None:
+                fut = self._loading[guild_id_str] = asyncio.ensure_future(self._load(guild_id_str, keep))
+            await fut
+        self._lru.move_to_end(guild_id_str)
+
+    async def _load(self, guild_id_str: str, keep: Tuple[str, ...]):
+        t = time.perf_counter()
+        try:
+            kw_map = await asyncio.get_running_loop().run_in_executor(None, _read_guild_file, guild_id_str)
+            if guild_id_str in self._lru:
+                return  # 읽는 동안 _merge_file 로 이미 올라옴
+            self._install(guild_id_str, _records_from_kw_map(kw_map, LoadReport()))
+            metrics.observe("guild_load", time.perf_counter() - t, guild_id_str)
+        finally:
+            # 끝나기 전에 빼 둠: _ensure 가 다시 돌 때 이미 끝난 작업을 (양보 없이) 또 기다리지 않게
+            self._loading.pop(guild_id_str, None)
+        await self._enforce_budget(keep + (guild_id_str,))
+
+    def _install(self, guild_id_str: str, recs: Dict[str, KeywordRecord]):
+        if recs:
+            learned_data[guild_id_str] = recs
+        for kw, rec in recs.items():
+            _index_record(guild_id_str, kw, rec)
+        if MATCH_MODE != "exact":
+            keyword_matchers.update(build_keyword_matchers((guild_id_str, kw) for kw in recs))
+        e = guild_manifest.get(guild_id_str)
+        if e is not None:
+            _add_teacher_counts(offline_teacher_responses, e["teachers"], -1)
+        self._lru[guild_id_str] = size = guild_memory_bytes(recs)
+        self.resident_bytes += size
+
+    def _merge_file(self, guild_id_str: str):
+        """
+        메모리에 없는 길드가 바뀐 경우 (올린 뒤 쓰기 전에 내려감): 메모리 쪽은 이번에 추가한 것뿐이므로
+        파일 내용에 합쳐서 올림. 일부만 든 맵으로 길드 파일을 덮어쓰지 않게 저장 전에 (await 없이) 처리
+        """
+        partial = learned_data.pop(guild_id_str, None) or {}
+        for kw, rec in partial.items():
+            _index_record(guild_id_str, kw, rec, sign=-1)
+        keyword_matchers.pop(guild_id_str, None)
+        recs = _records_from_kw_map(_read_guild_file(guild_id_str), LoadReport())
+        for kw, rec in partial.items():
+            have = recs.get(kw)
+            if have is None:
+                recs[kw] = rec
+                continue
+            seen = set(zip(have.teacher_ids, have.responses))
+            for tid, r in zip(rec.teacher_ids, rec.responses):
+                if (tid, r) not in seen:
+                    have.append(r, tid)
+        self._install(guild_id_str, recs)
+        metrics.inc("guild_merge", guild_id_str)
+
+    def _evict(self, guild_id_str: str):
+        self.resident_bytes -= self._lru.pop(guild_id_str)
+        self._stale.discard(guild_id_str)
+        for kw, rec in (learned_data.pop(guild_id_str, None) or {}).items():
+            _index_record(guild_id_str, kw, rec, sign=-1)
+        keyword_matchers.pop(guild_id_str, None)
+        e = guild_manifest.get(guild_id_str)
+        if e is not None:
+            _add_teacher_counts(offline_teacher_responses, e["teachers"], 1)
+        metrics.inc("guild_evict", guild_id_str)
+
+    async def _enforce_budget(self, keep: Tuple[str, ...]):
+        for gid in list(self._stale):
+            self._stale.discard(gid)
+            if gid in self._lru:
+                size = guild_memory_bytes(learned_data.get(gid, {}))
+                self.resident_bytes += size - self._lru[gid]
+                self._lru[gid] = size
+        while self.resident_bytes > self.budget:
+            victim = next((gid for gid in self._lru if gid not in keep), None)
+            if victim is None:
+                return
+            if guild_save_pending(victim):
+                # 내리기 전에 저장. 이 길드가 든 저장이 진행 중이면 끝까지 기다림 (쓰는 중인 파일을
+                # 다시 읽거나 옛 스냅샷이 나중에 덮어쓰는 일이 없게). 확인과 내리기 사이에는 await 가 없음
+                try:
+                    await flush_persistence()
+                except Exception as e:
+                    print(f"❌ 길드를 내리기 전 저장 실패 (내리지 않음): {e}")
+                    return
+                continue
+            self._evict(victim)
+
+    async def _changed(self, guild_id_str: str, delta: Optional[int] = None):
+        """delta: 크기 변화 추정 (가르치기/삭제 한 건). None 이면 다음 예산 확인 때 다시 잼 (길드 크기에 비례)"""
+        if guild_id_str not in self._lru:
+            if guild_id_str in guild_manifest:
+                self._merge_file(guild_id_str)
+            else:
+                self._lru[guild_id_str] = 0  # 새 길드
+        self._lru.move_to_end(guild_id_str)
+        if delta is None:
+            self._stale.add(guild_id_str)
+        else:
+            self._lru[guild_id_str] += delta
+            self.resident_bytes += delta
+        await self._enforce_budget((guild_id_str,))
+
+    async def _peek(self, guild_id_str: str) -> Dict[str, KeywordRecord]:
+        """메모리에 올리지 않고 읽기 (사람 기준 조회처럼 여러 길드를 한 번씩만 훑을 때)"""
+        if guild_id_str in self._lru:
+            return learned_data.get(guild_id_str, {})
+        kw_map = await asyncio.get_running_loop().run_in_executor(None, _read_guild_file, guild_id_str)
+        return _records_from_kw_map(kw_map, LoadReport())
+
+    def _teacher_guilds(self, teacher: str) -> List[str]:
+        # 메모리에 있는 길드는 인덱스에서, 나머지는 요약에서
+        tid = teacher_table.ids.get(teacher)
+        gids = list(teacher_index.get(tid, {})) if tid is not None else []
+        gids.extend(gid for gid, e in list(guild_manifest.items()) if gid not in self._lru and teacher in e["teachers"])
+        return gids
+
+    async def adopt_legacy(self, guild_id_str: str) -> bool:
+        if "___LEGACY___" not in self._lru and "___LEGACY___" not in guild_manifest:
+            return False
+        while True:
+            await self._ensure("___LEGACY___")
+            await self._ensure(guild_id_str, keep=("___LEGACY___",))
+            if "___LEGACY___" in self._lru or "___LEGACY___" not in guild_manifest:
+                break  # 두 번째 길드를 올리는 동안 레거시가 내려갔으면 다시
+        if not await super().adopt_legacy(guild_id_str):
+            return False
+        await self._changed("___LEGACY___")
+        await self._changed(guild_id_str)
+        return True
+
+    async def add(self, guild_id_str: str, keyword: str, response: str, teacher: str) -> bool:
+        await self._ensure(guild_id_str)
+        new_keyword = keyword not in learned_data.get(guild_id_str, ())
+        added = await super().add(guild_id_str, keyword, response, teacher)
+        if added:
+            delta = sys.getsizeof(response) + 8
+            if new_keyword:
+                delta += sys.getsizeof(keyword) + EMPTY_RECORD_BYTES
+            await self._changed(guild_id_str, delta)
+        return added
+
+    async def add_many(self, guild_id_str: str, teacher: str, pairs: List[Tuple[str, str]]) -> int:
+        await self._ensure(guild_id_str)
+        added = await super().add_many(guild_id_str, teacher, pairs)
+        if added:
+            await self._changed(guild_id_str)
+        return added
+
+    async def remove(self, guild_id_str: str, keyword: str, teacher: str, responses: List[str]) -> int:
+        await self._ensure(guild_id_str)
+        removed = await super().remove(guild_id_str, keyword, teacher, responses)
+        if removed:
+            await self._changed(guild_id_str, -min(self._lru.get(guild_id_str, 0),
+                                                   removed * (8 + max(sys.getsizeof(r) for r in responses))))
+        return removed
+
+    async def purge_teacher(self, teacher: str) -> int:
+        # 길드마다 올려서 지움 (예산 때문에 한꺼번에 다 올리지 않음). 저장은 스케줄러가 한 번에
+        total = 0
+        for gid in self._teacher_guilds(teacher):
+            await self._ensure(gid)
+            removed = purge_teacher_responses(teacher, (gid,))
+            if removed:
+                record_purge(removed, teacher=teacher)
+                total += removed[gid]
+                await self._changed(gid)
+        return total
+
+    async def purge_keyword(self, guild_id_str: str, keyword: str) -> int:
+        await self._ensure(guild_id_str)
+        removed = await super().purge_keyword(guild_id_str, keyword)
+        if removed:
+            await self._changed(guild_id_str)
+        return removed
+
+    async def purge_guild(self, guild_id_str: str) -> int:
+        await self._ensure(guild_id_str)  # 올려야 요약 쪽 가르친 사람 수도 같이 빠짐
+        removed = await super().purge_guild(guild_id_str)
+        if removed:
+            await self._changed(guild_id_str)
+        return removed
+
+    async def pick(self, guild_id_str: str, keyword: str, recent: Optional[deque] = None) -> Optional[Tuple[str, str]]:
+        await self._ensure(guild_id_str)
+        return await super().pick(guild_id_str, keyword, recent)
+
+    async def keys_for_guild(self, guild_id_str: str, filter_user: Optional[str] = None) -> List[EntryKey]:
+        await self._ensure(guild_id_str)
+        return await super().keys_for_guild(guild_id_str, filter_user)
+
+    async def keywords_for_guild(self, guild_id_str: str) -> List[str]:
+        await self._ensure(guild_id_str)
+        return await super().keywords_for_guild(guild_id_str)
+
+    async def keys_for_teacher(self, teacher: str) -> List[EntryKey]:
+        # 메모리에 있는 길드는 인덱스로, 나머지 길드 파일만 읽음
+        keys = entry_keys_for_user_all_guilds(teacher)
+        for gid, e in list(guild_manifest.items()):
+            if gid in self._lru or teacher not in e["teachers"]:
+                continue
+            recs = await self._peek(gid)
+            tid = teacher_table.ids.get(teacher)  # 읽어 온 파일에서 처음 나온 이름일 수도 있음
+            if tid is None:
+                continue
+            keys.extend((gid, kw, teacher) for kw, rec in recs.items() if tid in rec.teacher_ids)
+        return keys
+
+    async def get_entry(self, guild_id_str: str, keyword: str, teacher: str) -> Optional[Dict[str, Any]]:
+        await self._ensure(guild_id_str)
+        return await super().get_entry(guild_id_str, keyword, teacher)
+
+    async def usage(self) -> List[Dict[str, Any]]:
+        out = await super().usage()
+        out.extend({"guild_id": gid, "keywords": e["keywords"], "responses": e["responses"], "memory_bytes": 0, "disk_bytes": e["bytes"]}
+                   for gid, e in list(guild_manifest.items()) if gid not in self._lru)
+        return out
+
+    async def export_rows(self, guild_id_str: Optional[str] = None, teacher: Optional[str] = None) -> AsyncIterator[List[ExportRow]]:
+        if teacher is None:
+            await self._ensure(guild_id_str)
+            async for batch in super().export_rows(guild_id_str):
+                yield batch
+            return
+        for gid in self._teacher_guilds(teacher):
+            recs = await self._peek(gid)
+            tid = teacher_table.ids.get(teacher)
+            rows = [(gid, kw, teacher, r) for kw, rec in recs.items() for t, r in zip(rec.teacher_ids, rec.responses) if t == tid]
+            if rows:
+                yield rows
+
+
+class SqliteKnowledgeStore(KnowledgeStore):
+    """
+    knowledge(guild_id, keyword, teacher, response) 한 행 = 대답 하나.
+    (guild_id, keyword, teacher) / (teacher) 인덱스, WAL 모드.
+    모든 쿼리는 전용 스레드 1개에서 실행 (이벤트 루프를 막지 않음, 커넥션은 그 스레드 전용).
+    SQL 문은 상수 문자열이라 sqlite3 의 statement cache 로 재사용된다.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS knowledge ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " guild_id TEXT NOT NULL,"
+        " keyword TEXT NOT NULL,"
+        " teacher TEXT NOT NULL,"
+        " response TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_knowledge_guild_kw ON knowledge(guild_id, keyword, teacher)",
+        "CREATE INDEX IF NOT EXISTS idx_knowledge_teacher ON knowledge(teacher)",
+    )
+    SQL_INSERT = "INSERT INTO knowledge (guild_id, keyword, teacher, response) VALUES (?, ?, ?, ?)"
+    SQL_DELETE = "DELETE FROM knowledge WHERE guild_id = ? AND keyword = ? AND teacher = ? AND response = ?"
+    SQL_RECORD = "SELECT teacher, response FROM knowledge WHERE guild_id = ? AND keyword = ? ORDER BY id"
+    SQL_KEYS_BY_GUILD = ("SELECT keyword, teacher FROM knowledge WHERE guild_id = ?"
+                         " GROUP BY keyword, teacher ORDER BY MIN(id)")
+    SQL_KEYS_BY_GUILD_TEACHER = ("SELECT keyword FROM knowledge WHERE guild_id = ? AND teacher = ?"
+                                 " GROUP BY keyword ORDER BY MIN(id)")
+    SQL_KEYS_BY_TEACHER = "SELECT guild_id, keyword FROM knowledge WHERE teacher = ? GROUP BY guild_id, keyword ORDER BY MIN(id)"
+    SQL_ENTRY = "SELECT response FROM knowledge WHERE guild_id = ? AND keyword = ? AND teacher = ? ORDER BY id"
+    SQL_ADOPT = "UPDATE knowledge SET guild_id = ? WHERE guild_id = '___LEGACY___'"
+    SQL_KEYWORD_EXISTS = "SELECT 1 FROM knowledge WHERE guild_id = ? AND keyword = ? LIMIT 1"
+    SQL_DUPLICATE = "SELECT 1 FROM knowledge WHERE guild_id = ? AND keyword = ? AND teacher = ? AND response = ? LIMIT 1"
+    SQL_COUNT_GUILD_KEYWORDS = "SELECT COUNT(DISTINCT keyword) FROM knowledge WHERE guild_id = ?"
+    SQL_COUNT_KEYWORD = "SELECT COUNT(*) FROM knowledge WHERE guild_id = ? AND keyword = ?"
+    SQL_COUNT_TEACHER = "SELECT COUNT(*) FROM knowledge WHERE teacher = ?"
+    SQL_USAGE = ("SELECT guild_id, COUNT(DISTINCT keyword), COUNT(*),"
+                 " SUM(LENGTH(CAST(keyword AS BLOB)) + LENGTH(CAST(teacher AS BLOB)) + LENGTH(CAST(response AS BLOB)))"
+                 " FROM knowledge GROUP BY guild_id")
+    SQL_DEDUPE = ("DELETE FROM knowledge WHERE id NOT IN"
+                  " (SELECT MIN(id) FROM knowledge GROUP BY guild_id, keyword, teacher, response)")
+    SQL_ALL_KEYWORDS = "SELECT DISTINCT guild_id, keyword FROM knowledge"
+    SQL_GUILD_KEYWORDS = "SELECT DISTINCT keyword FROM knowledge WHERE guild_id = ?"
+    SQL_TEACHER_KEYWORDS = "SELECT DISTINCT guild_id, keyword FROM knowledge WHERE teacher = ?"
+    SQL_PURGE_TEACHER = "DELETE FROM knowledge WHERE teacher = ?"
+    SQL_PURGE_KEYWORD = "DELETE FROM knowledge WHERE guild_id = ? AND keyword = ?"
+    SQL_PURGE_GUILD = "DELETE FROM knowledge WHERE guild_id = ?"
+    SQL_EXPORT_GUILD = ("SELECT guild_id, keyword, teacher, response FROM knowledge WHERE guild_id = ?"
+                        " ORDER BY keyword, teacher, id")
+    SQL_EXPORT_TEACHER = ("SELECT guild_id, keyword, teacher, response FROM knowledge WHERE teacher = ?"
+                          " ORDER BY guild_id, keyword, id")
+
+    RECORD_CACHE_KEYS = 4096  # 대답 고르기용으로 메모리에 둘 키워드 수 (별칭 표 포함, 오래 안 쓴 것부터 버림)
+
+    def __init__(self, path: str = SQLITE_FILE):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="knowledge-sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+        # (guild_id, keyword) -> KeywordRecord. 가르치기/삭제는 캐시에도 그대로 반영, 나머지 쓰기는 해당 키를 버림
+        # (DB 스레드는 작업 순서대로, 완료 콜백도 그 순서대로 실행 -> 오래된 값이 남지 않음)
+        self._records: "OrderedDict[Tuple[str, str], KeywordRecord]" = OrderedDict()
+
+    def _forget(self, guild_id_str: str, keywords: Optional[Iterable[str]] = None):
+        if keywords is None:
+            for key in [key for key in self._records if key[0] == guild_id_str]:
+                del self._records[key]
+        else:
+            for kw in keywords:
+                self._records.pop((guild_id_str, kw), None)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _connect(self):
+        if self._conn is not None:
+            return
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in self.SCHEMA:
+            conn.execute(stmt)
+        self._conn = conn
+        # 최초 1회: DB가 비어 있고 knowledge.json 이 있으면 길드 단위로 읽으며 가져오기
+        source = knowledge_source_file()
+        if conn.execute("SELECT 1 FROM knowledge LIMIT 1").fetchone() is None and os.path.exists(source):
+            self._import_json(source)
+
+    def _import_json(self, source: str):
+        # 샤딩 중이면 iter_knowledge_records 가 자기 길드만 돌려줌
+        names = teacher_table.names
+        with self._conn:
+            self._conn.execute("BEGIN")
+            for gid, recs in iter_knowledge_records(source, LoadReport()):
+                rows = ((gid, kw, names[tid], r) for kw, rec in recs.items() for tid, r in zip(rec.teacher_ids, rec.responses))
+                self._conn.executemany(self.SQL_INSERT, rows)
+
+    def _all_keywords(self) -> List[Tuple[str, str]]:
+        return self._conn.execute(self.SQL_ALL_KEYWORDS).fetchall()
+
+    async def open(self):
+        await self._run(self._connect)
+        if MATCH_MODE != "exact" and not keyword_matchers:
+            # 매칭 인덱스는 키워드만 메모리에 (대답은 DB 에 그대로)
+            pairs = await self._run(self._all_keywords)
+            keyword_matchers.update(build_keyword_matchers(pairs))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _adopt(self, guild_id_str: str) -> bool:
+        return self._conn.execute(self.SQL_ADOPT, (guild_id_str,)).rowcount > 0
+
+    async def adopt_legacy(self, guild_id_str: str) -> bool:
+        adopted = await self._run(self._adopt, guild_id_str)
+        if adopted:
+            bump_guild_version(guild_id_str)
+            bump_guild_version("___LEGACY___")
+            self._forget(guild_id_str)
+            self._forget("___LEGACY___")
+            _matcher_adopt(guild_id_str)
+        return adopted
+
+    def _add(self, guild_id_str: str, keyword: str, response: str, teacher: str) -> bool:
+        # 확인과 추가가 같은 스레드에서 이어서 실행되므로 사이에 다른 쓰기가 끼지 않음
+        conn = self._conn
+        if conn.execute(self.SQL_DUPLICATE, (guild_id_str, keyword, teacher, response)).fetchone():
+            return False
+        keyword_responses = conn.execute(self.SQL_COUNT_KEYWORD, (guild_id_str, keyword)).fetchone()[0]
+        guild_keywords = conn.execute(self.SQL_COUNT_GUILD_KEYWORDS, (guild_id_str,)).fetchone()[0] if keyword_responses == 0 else 0
+        check_quota(guild_keywords, keyword_responses == 0, keyword_responses,
+                    conn.execute(self.SQL_COUNT_TEACHER, (teacher,)).fetchone()[0])
+        conn.execute(self.SQL_INSERT, (guild_id_str, keyword, teacher, response))
+        return True
+
+    async def add(self, guild_id_str: str, keyword: str, response: str, teacher: str) -> bool:
+        check_response_length(response)
+        added = await self._run(self._add, guild_id_str, keyword, response, teacher)
+        if added:
+            bump_guild_version(guild_id_str)
+            rec = self._records.get((guild_id_str, keyword))
+            if rec is not None:
+                rec.append(response, teacher_table.id_of(teacher))
+                rec.refresh()
+            _matcher_add(guild_id_str, keyword)
+        return added
+
+    def _add_many(self, guild_id_str: str, teacher: str, pairs: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        conn = self._conn
+        with conn:
+            conn.execute("BEGIN")
+            fresh = [(kw, r) for kw, r in pairs if not conn.execute(self.SQL_DUPLICATE, (guild_id_str, kw, teacher, r)).fetchone()]
+            counts: Dict[str, int] = {}
+            for kw, _ in fresh:
+                counts[kw] = counts.get(kw, 0) + 1
+            have = {kw: conn.execute(self.SQL_COUNT_KEYWORD, (guild_id_str, kw)).fetchone()[0] for kw in counts}
+            new_keywords = sum(1 for n in have.values() if n == 0)
+            guild_keywords = conn.execute(self.SQL_COUNT_GUILD_KEYWORDS, (guild_id_str,)).fetchone()[0] if new_keywords else 0
+            check_bulk_quota(guild_keywords, new_keywords, [(kw, have[kw], n) for kw, n in counts.items()],
+                             conn.execute(self.SQL_COUNT_TEACHER, (teacher,)).fetchone()[0], len(fresh))
+            conn.executemany(self.SQL_INSERT, ((guild_id_str, kw, teacher, r) for kw, r in fresh))
+        return fresh
+
+    async def add_many(self, guild_id_str: str, teacher: str, pairs: List[Tuple[str, str]]) -> int:
+        fresh = await self._run(self._add_many, guild_id_str, teacher, pairs)
+        keywords = {kw for kw, _ in fresh}
+        if fresh:
+            bump_guild_version(guild_id_str)
+        self._forget(guild_id_str, keywords)
+        for kw in keywords:
+            _matcher_add(guild_id_str, kw)
+        return len(fresh)
+
+    def _remove(self, guild_id_str: str, keyword: str, teacher: str, responses: List[str]) -> Tuple[int, bool]:
+        """(삭제된 개수, 키워드가 길드에서 없어졌는지)"""
+        removed = 0
+        with self._conn:
+            self._conn.execute("BEGIN")
+            for r in set(responses):
+                removed += self._conn.execute(self.SQL_DELETE, (guild_id_str, keyword, teacher, r)).rowcount
+        gone = removed > 0 and self._conn.execute(self.SQL_KEYWORD_EXISTS, (guild_id_str, keyword)).fetchone() is None
+        return removed, gone
+
+    async def remove(self, guild_id_str: str, keyword: str, teacher: str, responses: List[str]) -> int:
+        removed, gone = await self._run(self._remove, guild_id_str, keyword, teacher, responses)
+        if removed:
+            bump_guild_version(guild_id_str)
+        rec = self._records.get((guild_id_str, keyword)) if removed else None
+        if rec is not None and teacher in teacher_table.ids:
+            rec.remove(teacher_table.ids[teacher], set(responses))
+            rec.refresh()
+        if gone:
+            self._records.pop((guild_id_str, keyword), None)
+            _matcher_discard(guild_id_str, keyword)
+        return removed
+
+    def _purge_teacher(self, teacher: str) -> Tuple[int, List[Tuple[str, str]], List[Tuple[str, str]]]:
+        """(삭제된 개수, 바뀐 (길드, 키워드), 그중 길드에서 없어진 것)"""
+        conn = self._conn
+        with conn:
+            conn.execute("BEGIN")
+            keys = conn.execute(self.SQL_TEACHER_KEYWORDS, (teacher,)).fetchall()
+            removed = conn.execute(self.SQL_PURGE_TEACHER, (teacher,)).rowcount
+            gone = [(gid, kw) for gid, kw in keys if conn.execute(self.SQL_KEYWORD_EXISTS, (gid, kw)).fetchone() is None]
+        return removed, keys, gone
+
+    async def purge_teacher(self, teacher: str) -> int:
+        removed, keys, gone = await self._run(self._purge_teacher, teacher)
+        for gid, kw in keys:
+            bump_guild_version(gid)
+            self._records.pop((gid, kw), None)
+        for gid, kw in gone:
+            _matcher_discard(gid, kw)
+        return removed
+
+    def _execute_count(self, sql: str, *params) -> int:
+        return self._conn.execute(sql, params).rowcount
+
+    async def purge_keyword(self, guild_id_str: str, keyword: str) -> int:
+        removed = await self._run(self._execute_count, self.SQL_PURGE_KEYWORD, guild_id_str, keyword)
+        bump_guild_version(guild_id_str)
+        self._forget(guild_id_str, (keyword,))
+        _matcher_discard(guild_id_str, keyword)
+        return removed
+
+    async def purge_guild(self, guild_id_str: str) -> int:
+        removed = await self._run(self._execute_count, self.SQL_PURGE_GUILD, guild_id_str)
+        bump_guild_version(guild_id_str)
+        self._forget(guild_id_str)
+        keyword_matchers.pop(guild_id_str, None)
+        spot_invalidate(guild_id_str)
+        return removed
+
+    def _record_rows(self, guild_id_str: str, keyword: str) -> List[Tuple[str, str]]:
+        return self._conn.execute(self.SQL_RECORD, (guild_id_str, keyword)).fetchall()
+
+    async def pick(self, guild_id_str: str, keyword: str, recent: Optional[deque] = None) -> Optional[Tuple[str, str]]:
+        if MATCH_MODE != "exact":
+            # 인덱스에 키워드가 전부 있으므로 DB 에 묻기 전에 대상 키워드를 정함 (못 찾으면 그대로 조회)
+            keyword = resolve_keyword(guild_id_str, keyword) or keyword
+        key = (guild_id_str, keyword)
+        rec = self._records.get(key)
+        if rec is None:
+            # 처음 (또는 바뀐 뒤 처음) 고를 때만 DB 에서 읽음. 이후엔 DB 스레드를 거치지 않고 O(1)
+            rows = await self._run(self._record_rows, guild_id_str, keyword)
+            if not rows:
+                return None
+            rec = KeywordRecord()
+            for teacher, r in rows:
+                rec.append(r, teacher_table.id_of(teacher))
+            self._records[key] = rec
+            if len(self._records) > self.RECORD_CACHE_KEYS:
+                self._records.popitem(last=False)
+        else:
+            self._records.move_to_end(key)
+        response, tid = rec.pick(recent)
+        return response, teacher_table.names[tid]
+
+    def _keys_for_guild(self, guild_id_str: str, filter_user: Optional[str]) -> List[EntryKey]:
+        if filter_user is None:
+            return [(guild_id_str, kw, teacher) for kw, teacher in self._conn.execute(self.SQL_KEYS_BY_GUILD, (guild_id_str,))]
+        return [(guild_id_str, kw, filter_user)
+                for (kw,) in self._conn.execute(self.SQL_KEYS_BY_GUILD_TEACHER, (guild_id_str, filter_user))]
+
+    async def keys_for_guild(self, guild_id_str: str, filter_user: Optional[str] = None) -> List[EntryKey]:
+        return await self._run(self._keys_for_guild, guild_id_str, filter_user)
+
+    def _keywords_for_guild(self, guild_id_str: str) -> List[str]:
+        return [kw for (kw,) in self._conn.execute(self.SQL_GUILD_KEYWORDS, (guild_id_str,))]
+
+    async def keywords_for_guild(self, guild_id_str: str) -> List[str]:
+        return await self._run(self._keywords_for_guild, guild_id_str)
+
+    def _keys_for_teacher(self, teacher: str) -> List[EntryKey]:
+        return [(gid, kw, teacher) for gid, kw in self._conn.execute(self.SQL_KEYS_BY_TEACHER, (teacher,))]
+
+    async def keys_for_teacher(self, teacher: str) -> List[EntryKey]:
+        return await self._run(self._keys_for_teacher, teacher)
+
+    def _get_entry(self, guild_id_str: str, keyword: str, teacher: str) -> Optional[Dict[str, Any]]:
+        responses = [r for (r,) in self._conn.execute(self.SQL_ENTRY, (guild_id_str, keyword, teacher))]
+        if not responses:
+            return None
+        return {"guild_id": guild_id_str, "keyword": keyword, "teacher": teacher, "responses": responses}
+
+    async def get_entry(self, guild_id_str: str, keyword: str, teacher: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get_entry, guild_id_str, keyword, teacher)
+
+    def _usage(self) -> List[Dict[str, Any]]:
+        # sqlite 는 대답을 메모리에 올리지 않음 -> disk_bytes 는 행 내용 크기 (인덱스/페이지 여유 공간 제외)
+        return [{"guild_id": gid, "keywords": kws, "responses": n, "memory_bytes": 0, "disk_bytes": size or 0}
+                for gid, kws, n, size in self._conn.execute(self.SQL_USAGE)]
+
+    async def usage(self) -> List[Dict[str, Any]]:
+        return await self._run(self._usage)
+
+    def _export_open(self, guild_id_str: Optional[str], teacher: Optional[str]) -> sqlite3.Cursor:
+        if teacher is None:
+            return self._conn.execute(self.SQL_EXPORT_GUILD, (guild_id_str,))
+        return self._conn.execute(self.SQL_EXPORT_TEACHER, (teacher,))
+
+    async def export_rows(self, guild_id_str: Optional[str] = None, teacher: Optional[str] = None) -> AsyncIterator[List[ExportRow]]:
+        # 커서는 DB 스레드에서만 씀. 한 번에 EXPORT_BATCH 행씩만 꺼냄
+        cur = await self._run(self._export_open, guild_id_str, teacher)
+        try:
+            while True:
+                rows = await self._run(cur.fetchmany, EXPORT_BATCH)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            await self._run(cur.close)
+
+    def dedupe(self) -> int:
+        """오프라인 정리용 (봇을 끈 상태에서): 중복 행 삭제 후 VACUUM"""
+        self._connect()
+        removed = self._conn.execute(self.SQL_DEDUPE).rowcount
+        self._conn.execute("VACUUM")
+        return removed
+
+
+# 샤드 간 통신 (SHARD_COUNT > 1)
+# 길드에 묶인 작업(트리거/가르치기/그 길드의 배운내용)은 이벤트를 받은 샤드가 곧 그 길드의 주인이라 로컬에서 끝난다.
+# 다른 샤드로 가는 건 /배운내용 유저: 뿐 -> 키 목록은 모든 샤드에 나눠 묻고 합치고(fan-out),
+# 페이지 항목/삭제는 그 길드를 가진 샤드에 묻는다.
+#   - SqliteShardBus: 같은 기계의 여러 프로세스가 SHARD_BUS_FILE 하나로 요청/응답을 주고받음 (네트워크 없음)
+#   - InProcessBus: 한 프로세스 안의 여러 봇 인스턴스끼리 (benchmarks/shards.py 가 샤드 두 개를 묶어 점검)
+
+class ShardUnavailable(Exception):
+    """다른 샤드가 SHARD_BUS_TIMEOUT 안에 응답하지 않음"""
+
+class ShardBus(abc.ABC):
+    @abc.abstractmethod
+    async def start(self, shard_id: int, handler):
+        """handler(op, args) -> 결과 (JSON 으로 바꿀 수 있는 값) 를 이 샤드의 요청 처리기로 등록"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def request(self, shard_id: int, op: str, args: List[Any]) -> Any:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InProcessBus(ShardBus):
+    def __init__(self):
+        self.handlers: Dict[int, Any] = {}
+
+    async def start(self, shard_id: int, handler):
+        self.handlers[shard_id] = handler
+
+    async def request(self, shard_id: int, op: str, args: List[Any]) -> Any:
+        handler = self.handlers.get(shard_id)
+        if handler is None:
+            raise ShardUnavailable(shard_id)
+        # 프로세스 경계처럼 JSON 을 한 번 거쳐서 돌려줌 (튜플 -> 리스트 등 같은 모양이 되도록)
+        return json.loads(json.dumps(await handler(op, args), ensure_ascii=False))
+
+
+class SqliteShardBus(ShardBus):
+    """
+    shard_bus(target, sender, corr, op, payload) 한 행 = 메시지 하나.
+    요청은 corr 가 NULL, 응답은 corr = 요청 id. 각 샤드는 SHARD_BUS_POLL 마다 자기 앞으로 온 행을 읽고 지운다.
+    SqliteKnowledgeStore 처럼 전용 스레드 1개에서만 커넥션을 쓴다.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS shard_bus ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        " target INTEGER NOT NULL,"
+        " sender INTEGER NOT NULL,"
+        " corr INTEGER,"
+        " op TEXT,"
+        " payload TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_shard_bus_target ON shard_bus(target, id)",
+    )
+    SQL_SEND = "INSERT INTO shard_bus (target, sender, corr, op, payload) VALUES (?, ?, ?, ?, ?)"
+    SQL_INBOX = "SELECT id, sender, corr, op, payload FROM shard_bus WHERE target = ? ORDER BY id"
+    SQL_ACK = "DELETE FROM shard_bus WHERE target = ? AND id <= ?"
+    SQL_CLEAR = "DELETE FROM shard_bus WHERE target = ?"
+
+    def __init__(self, path: str = SHARD_BUS_FILE):
+        self.path = path
+        self.shard_id = -1
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shard-bus")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._handler = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._poll_task: Optional[asyncio.Task] = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=SHARD_BUS_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in self.SCHEMA:
+            conn.execute(stmt)
+        # 지난번 실행에서 남은 내 앞 메시지는 버림 (보낸 쪽은 이미 시간 초과)
+        conn.execute(self.SQL_CLEAR, (self.shard_id,))
+        self._conn = conn
+
+    async def start(self, shard_id: int, handler):
+        self.shard_id = shard_id
+        self._handler = handler
+        await self._run(self._connect)
+        self._poll_task = asyncio.get_running_loop().create_task(self._poll_loop())
+
+    def _send(self, target: int, corr: Optional[int], op: Optional[str], payload: str) -> int:
+        return self._conn.execute(self.SQL_SEND, (target, self.shard_id, corr, op, payload)).lastrowid
+
+    def _take_inbox(self) -> List[Tuple[int, int, Optional[int], Optional[str], str]]:
+        rows = self._conn.execute(self.SQL_INBOX, (self.shard_id,)).fetchall()
+        if rows:
+            self._conn.execute(self.SQL_ACK, (self.shard_id, rows[-1][0]))
+        return rows
+
+    async def _poll_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                rows = await self._run(self._take_inbox)
+            except sqlite3.Error as e:
+                print(f"❌ 샤드 버스 읽기 실패: {e}")
+                rows = []
+            for msg_id, sender, corr, op, payload in rows:
+                if corr is None:
+                    loop.create_task(self._serve(msg_id, sender, op, payload))
+                else:
+                    fut = self._pending.pop(corr, None)
+                    if fut is not None and not fut.done():
+                        fut.set_result(json.loads(payload))
+            await asyncio.sleep(SHARD_BUS_POLL)
+
+    async def _serve(self, msg_id: int, sender: int, op: str, payload: str):
+        try:
+            reply = {"ok": await self._handler(op, json.loads(payload))}
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}"}
+        await self._run(self._send, sender, msg_id, None, json.dumps(reply, ensure_ascii=False))
+
+    async def request(self, shard_id: int, op: str, args: List[Any]) -> Any:
+        fut = asyncio.get_running_loop().create_future()
+        msg_id = await self._run(self._send, shard_id, None, op, json.dumps(args, ensure_ascii=False))
+        self._pending[msg_id] = fut
+        try:
+            reply = await asyncio.wait_for(fut, SHARD_BUS_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ShardUnavailable(shard_id) from None
+        finally:
+            self._pending.pop(msg_id, None)
+        if "error" in reply:
+            raise ShardUnavailable(f"{shard_id}: {reply['error']}")
+        return reply["ok"]
+
+    def close(self):
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class ShardedKnowledgeStore(KnowledgeStore):
+    """자기 길드는 local store 로, 다른 샤드 길드는 bus 로 그 샤드의 store 에 요청"""
+
+    # 다른 샤드가 부를 수 있는 local store 메서드
+    REMOTE_OPS = frozenset(("keys_for_teacher", "get_entry", "remove", "usage", "export_teacher",
+                            "purge_teacher", "purge_keyword", "purge_guild"))
+    EXPORT_REMOTE_KEYS = 200  # 다른 샤드에서 한 번에 가져올 페이지 키 수 (응답 한 번이 너무 커지지 않게)
+
+    def __init__(self, local: KnowledgeStore, bus: ShardBus):
+        self.local = local
+        self.bus = bus
+        self._bus_started = False
+
+    async def open(self):
+        await self.local.open()
+        if not self._bus_started:
+            self._bus_started = True
+            await self.bus.start(SHARD_ID, self._handle)
+
+    def shutdown(self):
+        self.bus.close()
+        self.local.shutdown()
+
+    async def _handle(self, op: str, args: List[Any]) -> Any:
+        if op not in self.REMOTE_OPS:
+            raise ValueError(f"unknown op {op}")
+        if op == "export_teacher":
+            return await self._export_teacher_page(*args)
+        result = await getattr(self.local, op)(*args)
+        if op == "get_entry" and result is not None:
+            # 길드 이름은 그 길드를 가진 샤드 캐시에만 있음
+            g = bot.get_guild(int(result["guild_id"])) if result["guild_id"].isdigit() else None
+            if g is not None:
+                result = dict(result, guild_name=g.name)
+        return result
+
+    async def _remote(self, shard_id: int, op: str, *args) -> Any:
+        t = time.perf_counter()
+        try:
+            return await self.bus.request(shard_id, op, list(args))
+        finally:
+            metrics.observe("shard_bus", time.perf_counter() - t)
+
+    async def adopt_legacy(self, guild_id_str: str) -> bool:
+        # ___LEGACY___ 는 0번 샤드에만 있음 -> 다른 샤드 길드는 이관 대상 아님
+        return await self.local.adopt_legacy(guild_id_str) if owns_guild("___LEGACY___") else False
+
+    async def add(self, guild_id_str: str, keyword: str, response: str, teacher: str) -> bool:
+        return await self.local.add(guild_id_str, keyword, response, teacher)
+
+    async def add_many(self, guild_id_str: str, teacher: str, pairs: List[Tuple[str, str]]) -> int:
+        return await self.local.add_many(guild_id_str, teacher, pairs)
+
+    async def remove(self, guild_id_str: str, keyword: str, teacher: str, responses: List[str]) -> int:
+        if owns_guild(guild_id_str):
+            return await self.local.remove(guild_id_str, keyword, teacher, responses)
+        return await self._remote(shard_of(guild_id_str), "remove", guild_id_str, keyword, teacher, list(responses))
+
+    async def purge_teacher(self, teacher: str) -> int:
+        # 모든 샤드에서. 응답 없는 샤드가 있으면 나머지는 지운 뒤 ShardUnavailable (다시 실행하면 남은 것만 지워짐)
+        others = [sid for sid in range(SHARD_COUNT) if sid != SHARD_ID]
+        results = await asyncio.gather(self.local.purge_teacher(teacher),
+                                       *(self._remote(sid, "purge_teacher", teacher) for sid in others),
+                                       return_exceptions=True)
+        failed = [sid for sid, part in zip([SHARD_ID] + others, results) if isinstance(part, BaseException)]
+        if failed:
+            raise ShardUnavailable(f"{failed}: {sum(part for part in results if not isinstance(part, BaseException))}개는 삭제됨")
+        return sum(results)
+
+    async def purge_keyword(self, guild_id_str: str, keyword: str) -> int:
+        if owns_guild(guild_id_str):
+            return await self.local.purge_keyword(guild_id_str, keyword)
+        return await self._remote(shard_of(guild_id_str), "purge_keyword", guild_id_str, keyword)
+
+    async def purge_guild(self, guild_id_str: str) -> int:
+        if owns_guild(guild_id_str):
+            return await self.local.purge_guild(guild_id_str)
+        return await self._remote(shard_of(guild_id_str), "purge_guild", guild_id_str)
+
+    async def pick(self, guild_id_str: str, keyword: str, recent: Optional[deque] = None) -> Optional[Tuple[str, str]]:
+        return await self.local.pick(guild_id_str, keyword, recent)
+
+    async def keys_for_guild(self, guild_id_str: str, filter_user: Optional[str] = None) -> List[EntryKey]:
+        return await self.local.keys_for_guild(guild_id_str, filter_user)
+
+    async def keywords_for_guild(self, guild_id_str: str) -> List[str]:
+        # 메시지는 그 길드를 가진 샤드로만 옴
+        return await self.local.keywords_for_guild(guild_id_str)
+
+    async def keys_for_teacher(self, teacher: str) -> List[EntryKey]:
+        # 내 샤드 먼저, 그다음 샤드 번호 순. 응답 없는 샤드는 빼고 보여줌
+        others = [sid for sid in range(SHARD_COUNT) if sid != SHARD_ID]
+        results = await asyncio.gather(self.local.keys_for_teacher(teacher),
+                                       *(self._remote(sid, "keys_for_teacher", teacher) for sid in others),
+                                       return_exceptions=True)
+        keys: List[EntryKey] = []
+        for sid, part in zip([SHARD_ID] + others, results):
+            if isinstance(part, BaseException):
+                print(f"⚠️ 샤드 {sid} 의 배운 내용을 가져오지 못했습니다: {part}")
+                continue
+            keys.extend((gid, kw, t) for gid, kw, t in part)
+        return keys
+
+    async def get_entry(self, guild_id_str: str, keyword: str, teacher: str) -> Optional[Dict[str, Any]]:
+        if owns_guild(guild_id_str):
+            return await self.local.get_entry(guild_id_str, keyword, teacher)
+        return await self._remote(shard_of(guild_id_str), "get_entry", guild_id_str, keyword, teacher)
+
+    async def _export_teacher_page(self, teacher: str, start: int, count: int) -> Dict[str, Any]:
+        """키 목록의 [start, start+count) 구간 행들 (다른 샤드의 내보내기 요청용). 더 없으면 next = None"""
+        keys = await self.local.keys_for_teacher(teacher)
+        rows: List[ExportRow] = []
+        for gid, kw, t in keys[start:start + count]:
+            entry = await self.local.get_entry(gid, kw, t)
+            if entry is not None:
+                rows.extend((gid, kw, t, r) for r in entry["responses"])
+        return {"rows": rows, "next": start + count if start + count < len(keys) else None}
+
+    async def export_rows(self, guild_id_str: Optional[str] = None, teacher: Optional[str] = None) -> AsyncIterator[List[ExportRow]]:
+        # 길드 내보내기는 그 길드를 가진 샤드(=명령을 받은 샤드)에서 끝남
+        async for batch in self.local.export_rows(guild_id_str, teacher):
+            yield batch
+        if teacher is None:
+            return
+        # 사람 기준은 다른 샤드에서 페이지 단위로 받아옴. 응답 없는 샤드가 있으면 ShardUnavailable (일부만 내보내지 않음)
+        for sid in range(SHARD_COUNT):
+            if sid == SHARD_ID:
                 continue
-            for kw, val in kw_map.items():
-                lst = _normalize_legacy_value_to_list_of_dict(val)
-                if lst:
-                    normalized.setdefault(gid, {}).setdefault(kw, []).extend(lst)
-        if normalized != raw:
-            save_data(normalized)
-        return normalized
-
-    # 레거시 포맷이면 새 포맷으로 변환(임시 legacy 영역에 저장)
-    migrated = _migrate_any_legacy_structure(raw)
-    save_data(migrated)
-    return migrated
+            start: Optional[int] = 0
+            while start is not None:
+                page = await self._remote(sid, "export_teacher", teacher, start, self.EXPORT_REMOTE_KEYS)
+                if page["rows"]:
+                    yield [tuple(row) for row in page["rows"]]
+                start = page["next"]
 
-def save_data(data: Dict[str, Dict[str, List[Dict[str, str]]]]):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    async def usage(self) -> List[Dict[str, Any]]:
+        others = [sid for sid in range(SHARD_COUNT) if sid != SHARD_ID]
+        results = await asyncio.gather(self.local.usage(), *(self._remote(sid, "usage") for sid in others),
+                                       return_exceptions=True)
+        out: List[Dict[str, Any]] = []
+        for sid, part in zip([SHARD_ID] + others, results):
+            if isinstance(part, BaseException):
+                print(f"⚠️ 샤드 {sid} 의 사용량을 가져오지 못했습니다: {part}")
+                continue
+            out.extend(part)
+        return out
 
-# 메모리 로드
-learned_data: Dict[str, Dict[str, List[Dict[str, str]]]] = load_data()
 
+store: KnowledgeStore
+if STORAGE_MODE == "sqlite":
+    store = SqliteKnowledgeStore()
+elif STORAGE_MODE == "guilds":
+    store = GuildFileKnowledgeStore()
+else:
+    store = JsonKnowledgeStore()
+if SHARD_COUNT > 1:
+    store = ShardedKnowledgeStore(store, SqliteShardBus())
 
 
-# 봇 초기화
 
+# 일괄 가져오기 / 내보내기 파일 형식
+# 가져오기 (JSON 또는 CSV, UTF-8). 가르친 사람은 파일 내용과 상관없이 가져오는 사람으로 기록
+#   JSON: {"키워드": "대답" | ["대답", ...] | [{"response": "대답"}, ...]}
+#         [{"keyword": "키워드", "response": "대답"}, ...]  또는  [["키워드", "대답"], ...]
+#         내보내기 파일 형식 {"guild_id": {"키워드": [...]}} 도 그대로 받음 (모든 길드를 합침)
+#   CSV : keyword,response 열 (가르칠말,대답 도 됨). 머리줄이 없으면 앞의 두 열
+#   전체를 먼저 검증하고, 하나라도 틀리면 아무것도 넣지 않음. 파일 안 중복은 하나로
+# 내보내기: knowledge.json 과 같은 형식의 JSON 또는 guild_id,keyword,teacher,response CSV.
+#   store 에서 묶음 단위로 받아 바로 파일에 씀 (문서 전체를 메모리에 만들지 않음)
 
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
-tree = bot.tree
+class ImportFormatError(ValueError):
+    """가져올 파일이 잘못됨. str(e) 는 사용자에게 그대로 보여줄 문구"""
 
+IMPORT_KEYWORD_COLUMNS = ("keyword", "가르칠말", "키워드")
+IMPORT_RESPONSE_COLUMNS = ("response", "대답")
 
-# 헬퍼
+def _import_pairs_from_json(raw: Any) -> Iterator[Tuple[Any, Any]]:
+    if isinstance(raw, list):
+        for item in raw:
+            if isinstance(item, dict):
+                yield (next((item[c] for c in IMPORT_KEYWORD_COLUMNS if c in item), None),
+                       next((item[c] for c in IMPORT_RESPONSE_COLUMNS if c in item), None))
+            elif isinstance(item, list) and len(item) == 2:
+                yield item[0], item[1]
+            else:
+                yield None, None
+        return
+    if not isinstance(raw, dict):
+        raise ImportFormatError("JSON 은 객체나 배열이어야 해요.")
+    if raw and all(isinstance(v, dict) and "response" not in v for v in raw.values()):
+        # 내보내기 형식 (길드 -> 키워드 맵)
+        kw_maps = list(raw.values())
+    else:
+        kw_maps = [raw]
+    for kw_map in kw_maps:
+        for kw, val in kw_map.items():
+            for e in _normalize_legacy_value_to_list_of_dict(val):
+                yield kw, e["response"]
 
-def gid_str_from_guild(guild: Optional[discord.Guild]) -> Optional[str]:
-    return str(guild.id) if guild else None
+def _import_pairs_from_csv(text: str) -> Iterator[Tuple[Any, Any]]:
+    rows = csv.reader(io.StringIO(text))
+    first = next(rows, None)
+    if first is None:
+        return
+    header = [c.strip().lower() for c in first]
+    kw_col = next((header.index(c) for c in IMPORT_KEYWORD_COLUMNS if c in header), None)
+    resp_col = next((header.index(c) for c in IMPORT_RESPONSE_COLUMNS if c in header), None)
+    if kw_col is None or resp_col is None:
+        kw_col, resp_col = 0, 1
+        rows = iter([first, *rows])
+    for row in rows:
+        if not any(c.strip() for c in row):
+            continue  # 빈 줄
+        yield (row[kw_col] if kw_col < len(row) else None, row[resp_col] if resp_col < len(row) else None)
+
+def parse_import_file(filename: str, data: bytes) -> List[Tuple[str, str]]:
+    """첨부 파일 -> 검증된 (키워드, 대답) 목록 (순서 유지, 중복 제거). 틀리면 ImportFormatError"""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ImportFormatError("UTF-8 로 된 파일만 가져올 수 있어요.") from None
+    if filename.lower().endswith(".csv"):
+        raw_pairs = _import_pairs_from_csv(text)
+    else:
+        try:
+            raw_pairs = _import_pairs_from_json(json.loads(text))
+        except json.JSONDecodeError as e:
+            if filename.lower().endswith(".json"):
+                raise ImportFormatError(f"JSON 을 읽을 수 없어요. ({e.lineno}번째 줄)") from None
+            raw_pairs = _import_pairs_from_csv(text)
+    pairs: List[Tuple[str, str]] = []
+    seen = set()
+    for n, (kw, r) in enumerate(raw_pairs, 1):
+        if not isinstance(kw, str) or not isinstance(r, str) or not kw.strip() or not r.strip():
+            raise ImportFormatError(f"{n}번째 항목에 키워드나 대답이 없어요.")
+        if kw in default_knowledge:
+            raise ImportFormatError(f"{n}번째 항목: '{kw}' 는 수정/가르치기 할 수 없는 키워드예요.")
+        if MAX_RESPONSE_LENGTH and len(r) > MAX_RESPONSE_LENGTH:
+            raise ImportFormatError(f"{n}번째 항목: 대답은 {MAX_RESPONSE_LENGTH}자까지만 가르칠 수 있어요.")
+        if (kw, r) in seen:
+            continue
+        seen.add((kw, r))
+        pairs.append((kw, r))
+        if len(pairs) > IMPORT_MAX_PAIRS:
+            raise ImportFormatError(f"한 번에 {IMPORT_MAX_PAIRS}개까지만 가져올 수 있어요.")
+    if not pairs:
+        raise ImportFormatError("가져올 내용이 없어요.")
+    return pairs
 
-def build_entries_for_guild(guild_id_str: str, filter_user: Optional[str] = None) -> List[Dict[str, Any]]:
+class ExportWriter:
     """
-    해당 길드 안에서 (옵션: 특정 teacher 필터) 페이지 항목 구성
-    항목 구조: { "guild_id": str, "keyword": str, "teacher": str, "responses": List[str] }
+    행 묶음을 받아 바로 fp(바이너리)에 씀.
+    JSON 은 knowledge.json 과 같은 형식이라 행이 (길드, 키워드) 순으로 묶여서 와야 함 (store.export_rows 가 보장)
     """
-    entries: List[Dict[str, Any]] = []
-    kw_map = learned_data.get(guild_id_str, {})
-    for kw, arr in kw_map.items():
-        by_teacher: Dict[str, List[str]] = {}
-        for e in arr:
-            if not isinstance(e, dict):
-                continue
-            t = e.get("teacher", "unknown")
-            r = e.get("response")
-            if r is None:
-                continue
-            by_teacher.setdefault(t, []).append(r)
-        for teacher, responses in by_teacher.items():
-            if filter_user is None or teacher == filter_user:
-                entries.append({"guild_id": guild_id_str, "keyword": kw, "teacher": teacher, "responses": responses})
-    return entries
-
-def build_entries_for_user_all_guilds(username: str) -> List[Dict[str, Any]]:
-    """
-    모든 길드에서 해당 유저가 가르친 항목만 통합 페이지 항목 구성
-    """
-    entries: List[Dict[str, Any]] = []
-    for gid, kw_map in learned_data.items():
-        for kw, arr in kw_map.items():
-            responses: List[str] = []
-            for e in arr:
-                if not isinstance(e, dict):
-                    continue
-                if e.get("teacher", "unknown") == username:
-                    r = e.get("response")
-                    if r is not None:
-                        responses.append(r)
-            if responses:
-                entries.append({"guild_id": gid, "keyword": kw, "teacher": username, "responses": responses})
-    return entries
 
+    def __init__(self, fp, fmt: str):
+        self.fp = fp
+        self.fmt = fmt
+        self.rows = 0
+        self._gid: Optional[str] = None
+        self._kw: Optional[str] = None
+        if fmt == "csv":
+            fp.write("\ufeff".encode("utf-8"))  # 엑셀에서 한글이 깨지지 않게 BOM
+            self._csv_buf = io.StringIO()
+            self._csv = csv.writer(self._csv_buf)
+            self._csv.writerow(("guild_id", "keyword", "teacher", "response"))
+        else:
+            fp.write(b"{")
+
+    def write(self, rows: List[ExportRow]):
+        self.rows += len(rows)
+        if self.fmt == "csv":
+            self._csv.writerows(rows)
+            self.fp.write(self._csv_buf.getvalue().encode("utf-8"))
+            self._csv_buf.seek(0)
+            self._csv_buf.truncate()
+            return
+        dumps = json.dumps
+        parts: List[str] = []
+        for gid, kw, teacher, r in rows:
+            if gid != self._gid:
+                if self._gid is not None:
+                    parts.append("]},")
+                parts.append(f"\n  {dumps(gid)}: {{{dumps(kw, ensure_ascii=False)}: [")
+                self._gid, self._kw = gid, kw
+            elif kw != self._kw:
+                parts.append(f"], {dumps(kw, ensure_ascii=False)}: [")
+                self._kw = kw
+            else:
+                parts.append(", ")
+            parts.append(dumps({"response": r, "teacher": teacher}, ensure_ascii=False))
+        self.fp.write("".join(parts).encode("utf-8"))
+
+    def close(self):
+        if self.fmt == "csv":
+            return
+        self.fp.write(b"]}\n}\n" if self._gid is not None else b"}\n")
+
+
+# 길드 표시 이름 캐시: gid -> "이름 (ID: gid)". 페이지마다 int 변환 + get_guild 를 다시 하지 않음
+# 이름이 바뀌거나 들어가고/나가면 on_guild_update / on_guild_join / on_guild_remove 가 지움 (봇이 모르는 길드는 저장 안 함)
+guild_names: Dict[str, str] = {}
+
+def guild_display_name(guild_id_str: str, fallback_name: Optional[str] = None) -> str:
+    name = guild_names.get(guild_id_str)
+    if name is not None:
+        return name
+    g = bot.get_guild(int(guild_id_str)) if guild_id_str.isdigit() else None
+    if g is not None:
+        name = guild_names[guild_id_str] = f"{g.name} (ID: {guild_id_str})"
+        return name
+    if fallback_name:
+        # 다른 샤드 길드: 그 샤드가 항목과 함께 보내준 이름
+        return f"{fallback_name} (ID: {guild_id_str})"
+    # 레거시 가상/미해결 케이스
+    return f"ID: {guild_id_str}"
+
+@bot.event
+async def on_guild_update(before: discord.Guild, after: discord.Guild):
+    guild_names.pop(str(after.id), None)
+
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    guild_names.pop(str(guild.id), None)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    guild_names.pop(str(guild.id), None)
+
+# 페이지 렌더 캐시: (guild, keyword, teacher) -> (길드 데이터 버전, 항목, 렌더된 본문)
+# 길드 버전은 그 길드를 가르치기/삭제할 때마다 올라감 (record_* / SqliteKnowledgeStore)
+# 버전이 같으면 store 에서 다시 꺼내지도 본문을 다시 만들지도 않음. 다른 샤드 길드는 버전을 모르므로 캐시 안 함
+RENDER_CACHE_ENTRIES = 2048
+EMBED_DESCRIPTION_LIMIT = 4096
+PAGE_ENTRY_OVERHEAD = 200  # 항목 하나당 본문 외에 붙는 것 (서버 줄, 구분 줄바꿈) 상한
+guild_versions: Dict[str, int] = {}
+_render_cache: "OrderedDict[Tuple[str, str, str], Tuple[int, Dict[str, Any], str]]" = OrderedDict()
+
+def bump_guild_version(guild_id_str: str):
+    guild_versions[guild_id_str] = guild_versions.get(guild_id_str, 0) + 1
+
+def render_entry_body(entry: Dict[str, Any]) -> str:
+    body = f"**{entry['keyword']}** (가르친 사람: {entry['teacher']})\n\n" + "\n".join(f"- {r}" for r in entry["responses"])
+    limit = EMBED_DESCRIPTION_LIMIT - PAGE_ENTRY_OVERHEAD
+    return body if len(body) <= limit else body[:limit - 1] + "…"
+
+async def load_rendered_entry(key: Tuple[str, str, str]) -> Optional[Tuple[Dict[str, Any], str]]:
+    """(항목, 본문). 그 사이 삭제됐으면 None"""
+    gid = key[0]
+    version = guild_versions.get(gid, 0)  # 꺼내기 전에 읽음 -> 도중에 바뀌면 다음번엔 버전이 달라 다시 꺼냄
+    hit = _render_cache.get(key)
+    if hit is not None and hit[0] == version:
+        _render_cache.move_to_end(key)
+        metrics.inc("render_cache_hit", gid)
+        return hit[1], hit[2]
+    entry = await store.get_entry(*key)
+    if entry is None:
+        _render_cache.pop(key, None)
+        return None
+    body = render_entry_body(entry)
+    if owns_guild(gid):
+        _render_cache[key] = (version, entry, body)
+        _render_cache.move_to_end(key)
+        if len(_render_cache) > RENDER_CACHE_ENTRIES:
+            _render_cache.popitem(last=False)
+    return entry, body
 
 
 # KnowledgeView: 페이지네이션 + 이전/다음 + 삭제 버튼
-# 한 페이지: 1개의 (guild, keyword, teacher) 항목 (원래 UX 유지)
+# 한 페이지: (guild, keyword, teacher) 항목 최대 per_page 개, 임베드 설명 길이(4096) 안에 들어가는 만큼만
+#   (per_page=1 이면 원래 UX 그대로). 페이지 크기가 제각각이라 이전 페이지 시작 위치는 page_starts 에 쌓아 둠
+# 뷰는 키 목록만 들고 있고, 보고 있는 페이지의 항목만 꺼내온다 (load_page, 렌더 캐시 경유)
+# 수명 제한(VIEW_TIMEOUT) + 개수 제한(MAX_OPEN_VIEWS): 오래된 뷰는 닫고 키 목록도 놓아준다
+
+_open_views: "OrderedDict[int, KnowledgeView]" = OrderedDict()
 
 class KnowledgeView(discord.ui.View):
-    def __init__(self, requester: Union[discord.User, discord.Member], entries: List[Dict[str, Any]], per_page: int = 1):
-        super().__init__(timeout=None)
+    def __init__(self, requester: Union[discord.User, discord.Member], keys: List[EntryKey], per_page: int = 1):
+        super().__init__(timeout=VIEW_TIMEOUT)
         self.requester = requester
-        self.entries = entries
-        self.index = 0
-        self.per_page = per_page
+        self.keys = keys
+        self.index = 0  # 현재 페이지 첫 키
+        self.per_page = min(max(1, per_page), 25)  # 삭제할 항목 고르는 메뉴가 최대 25개
+        self.page_end = 0  # 현재 페이지 = keys[index:page_end]
+        self.page_starts: List[int] = []
+        self.page: List[Tuple[Dict[str, Any], str]] = []  # (항목, 본문) (load_page 로 채움)
+        self.update_buttons()
+        _register_view(self)
+
+    @property
+    def current(self) -> Optional[Dict[str, Any]]:
+        return self.page[0][0] if self.page else None
+
+    async def load_page(self):
+        """index 부터 항목을 꺼내 페이지를 채움. 그 사이 삭제된 키는 건너뛰고 목록에서 뺀다"""
+        while True:
+            self.page = []
+            size = 0
+            i = self.index
+            while i < len(self.keys) and len(self.page) < self.per_page:
+                loaded = await load_rendered_entry(self.keys[i])
+                if loaded is None:
+                    self.keys.pop(i)
+                    continue
+                size += len(loaded[1]) + PAGE_ENTRY_OVERHEAD
+                if self.page and size > EMBED_DESCRIPTION_LIMIT:
+                    break
+                self.page.append(loaded)
+                i += 1
+            self.page_end = i
+            if self.page or self.index == 0:
+                break
+            # 이 페이지 항목이 전부 지워짐 -> 앞 페이지로
+            self.index = self.page_starts.pop() if self.page_starts else 0
         self.update_buttons()
 
+    def release(self):
+        # 키 목록/현재 페이지를 놓아주고 뷰 종료
+        _open_views.pop(id(self), None)
+        self.keys = []
+        self.page = []
+        self.stop()
+
+    async def on_timeout(self):
+        self.release()
+
     def update_buttons(self):
         try:
             self.previous.disabled = (self.index == 0)
-            self.next.disabled = (self.index >= len(self.entries) - 1)
+            self.next.disabled = (self.page_end >= len(self.keys))
         except Exception:
             pass
 
-    def _guild_display_name(self, guild_id_str: str) -> str:
-        try:
-            gid_int = int(guild_id_str) if guild_id_str.isdigit() else None
-        except Exception:
-            gid_int = None
-        if gid_int:
-            g = bot.get_guild(gid_int)
-            if g:
-                return f"{g.name} (ID: {guild_id_str})"
-        # 레거시 가상/미해결 케이스
-        return f"ID: {guild_id_str}"
-
     def get_embed(self) -> discord.Embed:
-        if not self.entries:
+        if not self.page:
             return discord.Embed(title="📘 배운 키워드", description="아직 배운 내용이 없습니다.", color=discord.Color.green())
-        e = self.entries[self.index]
-        kw = e["keyword"]
-        teacher = e["teacher"]
-        responses = e["responses"]
-        gid = e["guild_id"]
-        guild_line = f"**서버**: {self._guild_display_name(gid)}\n"
-        desc = guild_line + f"**{kw}** (가르친 사람: {teacher})\n\n" + "\n".join(f"- {r}" for r in responses)
-        embed = discord.Embed(title=f"📘 배운 키워드 {self.index + 1}/{len(self.entries)}", description=desc, color=discord.Color.green())
-        return embed
+        parts = []
+        last_gid = None
+        for e, body in self.page:
+            gid = e["guild_id"]
+            if gid != last_gid:
+                # 서버가 바뀔 때만 서버 줄
+                body = f"**서버**: {guild_display_name(gid, e.get('guild_name'))}\n" + body
+                last_gid = gid
+            parts.append(body)
+        span = f"{self.index + 1}" if self.page_end - self.index <= 1 else f"{self.index + 1}-{self.page_end}"
+        return discord.Embed(title=f"📘 배운 키워드 {span}/{len(self.keys)}", description="\n\n".join(parts), color=discord.Color.green())
 
     @discord.ui.button(label="⬅️ 이전", style=discord.ButtonStyle.gray, row=0)
     async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -280,56 +3317,40 @@ class KnowledgeView(discord.ui.View):
             await interaction.response.send_message("이건 당신이 조작할 수 없어요!", ephemeral=True)
             return
         if self.index > 0:
-            self.index -= 1
-            self.update_buttons()
+            self.index = self.page_starts.pop() if self.page_starts else max(0, self.index - self.per_page)
+            await self.load_page()
             await interaction.response.edit_message(embed=self.get_embed(), view=self)
 
     @discord.ui.button(label="🗑️ 삭제", style=discord.ButtonStyle.red, row=0)
     async def delete(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if not self.entries:
+        if not self.page:
             await interaction.response.send_message("삭제할 항목이 없습니다.", ephemeral=True)
             return
 
-        entry = self.entries[self.index]
-        kw = entry["keyword"]
-        teacher = entry["teacher"]
-        responses = entry["responses"]
-        gid = entry["guild_id"]
-        requester_name = interaction.user.name  # username
-
         # 권한 체크
+        requester_name = interaction.user.name  # username
         is_privileged = requester_name in privileged_users
-        is_owner = requester_name == teacher
-        if not (is_owner or is_privileged):
+        mine = [e for e, _ in self.page if is_privileged or e["teacher"] == requester_name]
+        if not mine:
             await interaction.response.send_message("이건 당신이 지울 수 없어요!", ephemeral=True)
             return
+        if len(self.page) == 1:
+            await self.delete_entry(interaction, mine[0])
+            return
+        view = EntryPickView(requester_name, mine, self)
+        await interaction.response.send_message("삭제할 키워드를 선택하세요:", view=view, ephemeral=True)
 
-        # 해당 길드 맥락에서 삭제
-        guild_kw_map = learned_data.get(gid, {})
+    async def delete_entry(self, interaction: discord.Interaction, entry: Dict[str, Any]):
+        kw = entry["keyword"]
+        teacher = entry["teacher"]
+        responses = entry["responses"]
+        gid = entry["guild_id"]
 
-        # 하나면 바로 삭제
+        # 하나면 바로 삭제 (다 지워진 키는 load_page 가 목록에서 뺌)
         if len(responses) == 1:
-            resp_to_remove = responses[0]
-            arr = guild_kw_map.get(kw, [])
-            new_arr = [e for e in arr if not (e.get("teacher") == teacher and e.get("response") == resp_to_remove)]
-            if new_arr:
-                guild_kw_map[kw] = new_arr
-            else:
-                guild_kw_map.pop(kw, None)
-
-            # 반영
-            if guild_kw_map:
-                learned_data[gid] = guild_kw_map
-            else:
-                learned_data.pop(gid, None)
-            save_data(learned_data)
-
-            # entries 갱신
-            self.entries.pop(self.index)
-            if self.index >= len(self.entries) and self.index > 0:
-                self.index -= 1
-            self.update_buttons()
-            await interaction.response.send_message(f"🗑️ [{self._guild_display_name(gid)}] '{kw}'의 해당 대답을 삭제했습니다.", ephemeral=True)
+            await store.remove(gid, kw, teacher, [responses[0]])
+            await self.load_page()
+            await interaction.response.send_message(f"🗑️ [{guild_display_name(gid, entry.get('guild_name'))}] '{kw}'의 해당 대답을 삭제했습니다.", ephemeral=True)
             try:
                 await interaction.message.edit(embed=self.get_embed(), view=self)
             except Exception:
@@ -338,7 +3359,7 @@ class KnowledgeView(discord.ui.View):
 
         # 멀티 응답(멀티 삭제 메뉴 표시)
         options = [discord.SelectOption(label=r, value=r) for r in responses]
-        view = MultiDeleteView(requester_name, gid, kw, teacher, options, self)
+        view = MultiDeleteView(interaction.user.name, gid, kw, teacher, options, self)
         await interaction.response.send_message("삭제할 대답을 선택하세요 (여러 개 선택 가능):", view=view, ephemeral=True)
 
     @discord.ui.button(label="➡️ 다음", style=discord.ButtonStyle.gray, row=0)
@@ -346,12 +3367,42 @@ class KnowledgeView(discord.ui.View):
         if interaction.user != self.requester:
             await interaction.response.send_message("이건 당신이 조작할 수 없어요!", ephemeral=True)
             return
-        if self.index < len(self.entries) - 1:
-            self.index += 1
-            self.update_buttons()
+        if self.page_end < len(self.keys):
+            self.page_starts.append(self.index)
+            self.index = self.page_end
+            await self.load_page()
             await interaction.response.edit_message(embed=self.get_embed(), view=self)
 
 
+class EntryPickView(discord.ui.View):
+    """항목이 여러 개인 페이지에서 삭제할 항목 고르기 -> KnowledgeView.delete_entry"""
+
+    def __init__(self, requester_name: str, entries: List[Dict[str, Any]], parent_view: KnowledgeView):
+        super().__init__(timeout=120)
+        self.requester_name = requester_name
+        self.entries = entries
+        self.parent_view = parent_view
+        options = [discord.SelectOption(label=f"{e['keyword']} ({e['teacher']})"[:100], value=str(i)) for i, e in enumerate(entries)]
+        self.select = discord.ui.Select(placeholder="삭제할 키워드 선택", min_values=1, max_values=1, options=options)
+        self.select.callback = self._on_select
+        self.add_item(self.select)
+
+    async def _on_select(self, interaction: discord.Interaction):
+        if interaction.user.name != self.requester_name:
+            await interaction.response.send_message("이 메뉴는 해당 명령어 호출자만 사용할 수 있습니다.", ephemeral=True)
+            return
+        self.stop()
+        await self.parent_view.delete_entry(interaction, self.entries[int(self.select.values[0])])
+
+
+
+def _register_view(view: KnowledgeView):
+    _open_views[id(view)] = view
+    while len(_open_views) > MAX_OPEN_VIEWS:
+        _, oldest = _open_views.popitem(last=False)
+        oldest.release()
+
+
 
 # 멀티 삭제 메뉴 (취소)
 
@@ -394,28 +3445,11 @@ class MultiDeleteView(discord.ui.View):
             await interaction.response.send_message("삭제할 항목을 선택하세요.", ephemeral=True)
             return
 
-        kw_map = learned_data.get(self.guild_id_str, {})
-        arr = kw_map.get(self.keyword, [])
-        new_arr = [e for e in arr if not (e.get("teacher") == self.teacher and e.get("response") in self.selected_values)]
-        if new_arr:
-            kw_map[self.keyword] = new_arr
-        else:
-            kw_map.pop(self.keyword, None)
-
-        if kw_map:
-            learned_data[self.guild_id_str] = kw_map
-        else:
-            learned_data.pop(self.guild_id_str, None)
-
-        save_data(learned_data)
+        await store.remove(self.guild_id_str, self.keyword, self.teacher, self.selected_values)
 
         pv = self.parent_view
-        # parent_view.entries는 다양한 소스일 수 있으니 전체 재구성 시나리오 없음
-        # 대신 현재 페이지의 항목을 갱신/삭제
-        pv.entries = [e for e in pv.entries if not (e["guild_id"] == self.guild_id_str and e["keyword"] == self.keyword and e["teacher"] == self.teacher)]
-        if pv.index >= len(pv.entries) and pv.index > 0:
-            pv.index = len(pv.entries) - 1
-        pv.update_buttons()
+        # 현재 페이지만 다시 꺼내옴 (남은 대답 반영, 다 지워졌으면 그 키는 load_page 가 뺌)
+        await pv.load_page()
 
         await interaction.response.send_message(f"✅ {len(self.selected_values)}개 삭제 완료.", ephemeral=True)
         try:
@@ -435,6 +3469,13 @@ class MultiDeleteView(discord.ui.View):
 
 # /커맨드
 
+NOT_READY_MESSAGE = "⏳ 아직 배운 내용을 불러오는 중이에요. 잠시 후 다시 시도해 주세요."
+LOAD_FAILED_MESSAGE = "❌ 배운 내용을 불러오지 못했어요. 관리자에게 알려 주세요."
+
+def not_ready_message() -> str:
+    return LOAD_FAILED_MESSAGE if knowledge_load_error is not None else NOT_READY_MESSAGE
+RATE_LIMITED_MESSAGE = "⏳ 너무 빨리 가르치고 있어요. 잠시 후 다시 시도해 주세요."
+
 @tree.command(name="가르치기", description="호시노가 대답할 말을 가르칩니다.")
 @app_commands.describe(가르칠말="가르칠 단어(혹은 문장)", 대답="호시노가 말하게 될 대답")
 async def teach(interaction: discord.Interaction, 가르칠말: str, 대답: str):
@@ -447,37 +3488,61 @@ async def teach(interaction: discord.Interaction, 가르칠말: str, 대답: str
         await interaction.response.send_message("❌ 이 명령어는 서버에서만 사용할 수 있어요.", ephemeral=True)
         return
 
+    if not knowledge_ready.is_set():
+        await interaction.response.send_message(not_ready_message(), ephemeral=True)
+        return
+
     gid = gid_str_from_guild(interaction.guild)
     assert gid is not None
 
+    denied = take_all(((teach_user_limiter, interaction.user.id), (teach_guild_limiter, gid)), time.monotonic())
+    if denied is not None:
+        metrics.inc(f"teach_shed_{denied.name}", gid)
+        await interaction.response.send_message(RATE_LIMITED_MESSAGE, ephemeral=True)
+        return
+
     # 레거시 이관: 만약 ___LEGACY___ 데이터가 남아있다면 현재 길드로 1회 이관
     if "_KnowledgeView__" == "_dummy_":  # (lint용, 미사용)
         pass
-    if _adopt_legacy_into_guild(learned_data, gid):
-        save_data(learned_data)
+    await store.adopt_legacy(gid)
 
-    learned_data.setdefault(gid, {}).setdefault(가르칠말, []).append({"response": 대답, "teacher": username})
-    save_data(learned_data)
+    try:
+        added = await store.add(gid, 가르칠말, 대답, username)
+    except QuotaExceeded as e:
+        metrics.inc("teach_quota", gid)
+        await interaction.response.send_message(f"❌ {e}", ephemeral=True)
+        return
+    if not added:
+        await interaction.response.send_message(f"이미 '{가르칠말}'에 '{대답}'라고 배웠어요!", ephemeral=True)
+        return
+    metrics.inc("teach", gid)
     await interaction.response.send_message(f"✅ 이곳에서 '{가르칠말}'을(를) '{대답}'라고 하면 되는거죠? (by {username})", ephemeral=True)
 
 
+def resolve_user_option(interaction: discord.Interaction, 유저: Optional[str]) -> Optional[str]:
+    # resolve user param: accept '@name' or 'name'
+    if not 유저:
+        return None
+    candidate = 유저.lstrip("@")
+    # mention 형태 <@!id> 처리 시도 -> username
+    if interaction.guild and candidate.startswith("<@") and candidate.endswith(">"):
+        try:
+            uid = int(candidate.strip("<@!>"))
+            member = interaction.guild.get_member(uid)
+            if member:
+                candidate = member.name
+        except Exception:
+            pass
+    return candidate
+
 @tree.command(name="배운내용", description="지금까지 배운 말들 보여준다.")
 @app_commands.describe(유저="특정 유저의 가르친 내용만 보기 (없으면 현재 서버에서 배운 것만)")
 async def show_knowledge_command(interaction: discord.Interaction, 유저: Optional[str] = None):
-    # resolve user param: accept '@name' or 'name'
-    filter_user: Optional[str] = None
-    if 유저:
-        candidate = 유저.lstrip("@")
-        # mention 형태 <@!id> 처리 시도 -> username
-        if interaction.guild and candidate.startswith("<@") and candidate.endswith(">"):
-            try:
-                uid = int(candidate.strip("<@!>"))
-                member = interaction.guild.get_member(uid)
-                if member:
-                    candidate = member.name
-            except Exception:
-                pass
-        filter_user = candidate
+    if not knowledge_ready.is_set():
+        await interaction.response.send_message(not_ready_message(), ephemeral=True)
+        return
+
+    filter_user = resolve_user_option(interaction, 유저)
 
     # 유저 미지정 -> 현재 길드에서 배운 내용만
     if not filter_user:
@@ -488,89 +3553,701 @@ async def show_knowledge_command(interaction: discord.Interaction, 유저: Optio
         assert gid is not None
 
         # 레거시 이관 시도
-        if _adopt_legacy_into_guild(learned_data, gid):
-            save_data(learned_data)
+        await store.adopt_legacy(gid)
 
-        entries = build_entries_for_guild(gid, filter_user=None)
-        if not entries:
+        keys = await store.keys_for_guild(gid, filter_user=None)
+        if not keys:
             await interaction.response.send_message("해당 서버에서 배운 내용이 없습니다.", ephemeral=True)
             return
 
-        view = KnowledgeView(interaction.user, entries)
+        view = KnowledgeView(interaction.user, keys, per_page=VIEW_PER_PAGE)
+        await view.load_page()
         await interaction.response.send_message(embed=view.get_embed(), view=view, ephemeral=True)
         return
 
     # 유저 지정 -> 그 유저가 모든 서버에서 가르친 내용 통합
-    entries_all = build_entries_for_user_all_guilds(filter_user)
-    if not entries_all:
+    keys_all = await store.keys_for_teacher(filter_user)
+    if not keys_all:
         await interaction.response.send_message(f"'{filter_user}' 님이 가르친 내용이 없습니다.", ephemeral=True)
         return
 
-    view = KnowledgeView(interaction.user, entries_all)
+    view = KnowledgeView(interaction.user, keys_all, per_page=VIEW_PER_PAGE)
+    await view.load_page()
     await interaction.response.send_message(embed=view.get_embed(), view=view, ephemeral=True)
 
 
+def can_manage_knowledge(interaction: discord.Interaction) -> bool:
+    """관리자 목록에 있거나 그 서버의 '서버 관리' 권한이 있으면 True"""
+    if interaction.user.name in privileged_users:
+        return True
+    perms = getattr(interaction.user, "guild_permissions", None)
+    return bool(perms and perms.manage_guild)
+
+@tree.command(name="가져오기", description="(서버 관리자) JSON/CSV 파일의 키워드/대답을 이 서버에 한꺼번에 가르칩니다.")
+@app_commands.describe(파일="JSON 또는 CSV 파일 (keyword,response)")
+async def import_command(interaction: discord.Interaction, 파일: discord.Attachment):
+    username = interaction.user.name
+    if not interaction.guild:
+        await interaction.response.send_message("❌ 이 명령어는 서버에서만 사용할 수 있어요.", ephemeral=True)
+        return
+    if not can_manage_knowledge(interaction):
+        await interaction.response.send_message("❌ 서버 관리 권한이 있어야 가져올 수 있어요.", ephemeral=True)
+        return
+    if not knowledge_ready.is_set():
+        await interaction.response.send_message(not_ready_message(), ephemeral=True)
+        return
+    if 파일.size > IMPORT_MAX_BYTES:
+        await interaction.response.send_message(f"❌ 파일은 {_format_bytes(IMPORT_MAX_BYTES)}까지만 가져올 수 있어요.", ephemeral=True)
+        return
+
+    gid = gid_str_from_guild(interaction.guild)
+    assert gid is not None
+
+    # 가르치기 한도에서 한 번으로 셈 (내용 개수는 QUOTA_* 가 막음)
+    denied = take_all(((teach_user_limiter, interaction.user.id), (teach_guild_limiter, gid)), time.monotonic())
+    if denied is not None:
+        metrics.inc(f"teach_shed_{denied.name}", gid)
+        await interaction.response.send_message(RATE_LIMITED_MESSAGE, ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    t = time.perf_counter()
+    try:
+        data = await 파일.read()
+        pairs = await asyncio.get_running_loop().run_in_executor(None, parse_import_file, 파일.filename, data)
+        await store.adopt_legacy(gid)
+        added = await store.add_many(gid, username, pairs)
+    except (ImportFormatError, QuotaExceeded) as e:
+        metrics.inc("import_rejected", gid)
+        await interaction.followup.send(f"❌ {e}", ephemeral=True)
+        return
+    except discord.HTTPException:
+        await interaction.followup.send("❌ 파일을 받아오지 못했어요. 잠시 후 다시 시도해 주세요.", ephemeral=True)
+        return
+    metrics.observe("import", time.perf_counter() - t, gid)
+    metrics.inc("teach", gid, n=added)
+    skipped = len(pairs) - added
+    note = f" (이미 배운 {skipped}개는 건너뜀)" if skipped else ""
+    await interaction.followup.send(f"✅ {added}개를 이 서버에 가르쳤어요.{note} (by {username})", ephemeral=True)
+
+
+@tree.command(name="내보내기", description="이 서버(또는 특정 유저)가 배운 내용을 파일로 받습니다.")
+@app_commands.describe(유저="특정 유저가 모든 서버에서 가르친 내용 (없으면 현재 서버에서 배운 것)", 형식="파일 형식 (기본 json)")
+async def export_command(interaction: discord.Interaction, 유저: Optional[str] = None, 형식: Literal["json", "csv"] = "json"):
+    if not knowledge_ready.is_set():
+        await interaction.response.send_message(not_ready_message(), ephemeral=True)
+        return
+    filter_user = resolve_user_option(interaction, 유저)
+    gid = gid_str_from_guild(interaction.guild)
+    if filter_user is None and gid is None:
+        await interaction.response.send_message("이 명령어는 길드(서버)에서만 사용할 수 있어요.", ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+    if filter_user is None:
+        await store.adopt_legacy(gid)
+    limit = interaction.guild.filesize_limit if interaction.guild else 10 * 1024 * 1024
+    t = time.perf_counter()
+    fp = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    try:
+        writer = ExportWriter(fp, 형식)
+        rows = store.export_rows(gid if filter_user is None else None, filter_user)
+        try:
+            async for batch in rows:
+                writer.write(batch)
+                if fp.tell() > limit:
+                    await interaction.followup.send(f"❌ 파일이 너무 커요. (업로드 한도 {_format_bytes(limit)})", ephemeral=True)
+                    return
+        except ShardUnavailable:
+            await interaction.followup.send("❌ 일부 샤드가 응답하지 않아 내보내지 못했어요. 잠시 후 다시 시도해 주세요.", ephemeral=True)
+            return
+        finally:
+            await rows.aclose()
+        if not writer.rows:
+            who = f"'{filter_user}' 님이 가르친" if filter_user else "해당 서버에서 배운"
+            await interaction.followup.send(f"{who} 내용이 없습니다.", ephemeral=True)
+            return
+        writer.close()
+        metrics.observe("export", time.perf_counter() - t, gid or "")
+        metrics.inc("export_rows", gid or "", n=writer.rows)
+        fp.seek(0)
+        name = f"hoshino-{filter_user or gid}.{형식}"
+        await interaction.followup.send(f"📦 {writer.rows}개", file=discord.File(fp, filename=name), ephemeral=True)
+    finally:
+        fp.close()
+
+
+class PurgeConfirmView(discord.ui.View):
+    """일괄 삭제 확인 버튼. 확인을 눌러야 action 실행 (삭제된 개수 반환)"""
+
+    def __init__(self, requester_name: str, description: str, action, metric_guild: str):
+        super().__init__(timeout=60)
+        self.requester_name = requester_name
+        self.description = description
+        self.action = action
+        self.metric_guild = metric_guild
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.name != self.requester_name:
+            await interaction.response.send_message("이 메뉴는 해당 명령어 호출자만 사용할 수 있습니다.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="전부 삭제", style=discord.ButtonStyle.danger)
+    async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()
+        await interaction.response.edit_message(content=f"🗑️ {self.description} 삭제 중...", view=None)
+        t = time.perf_counter()
+        try:
+            removed = await self.action()
+        except ShardUnavailable as e:
+            await interaction.followup.send(f"❌ 일부 샤드가 응답하지 않았어요 ({e}). 다시 실행하면 남은 것만 지워요.", ephemeral=True)
+            return
+        metrics.observe("purge", time.perf_counter() - t, self.metric_guild)
+        metrics.inc("purge", self.metric_guild, n=removed)
+        await interaction.followup.send(f"✅ {self.description}: {removed}개 삭제했어요.", ephemeral=True)
+
+    @discord.ui.button(label="취소", style=discord.ButtonStyle.secondary)
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.stop()
+        await interaction.response.edit_message(content="취소되었습니다.", view=None)
+
+
+@tree.command(name="일괄삭제", description="(관리자) 유저가 가르친 것 전부 / 키워드 하나 / 서버가 배운 것 전부를 한 번에 지웁니다.")
+@app_commands.describe(유저="이 유저가 모든 서버에서 가르친 대답 전부 (봇 관리자만)",
+                       키워드="이 서버의 키워드 하나 (가르친 사람 상관없이)",
+                       서버전체="이 서버가 배운 것 전부",
+                       서버id="다른 서버를 대상으로 할 때 서버 ID (봇 관리자만). 아직 이관 안 된 옛 데이터는 ___LEGACY___")
+async def purge_command(interaction: discord.Interaction, 유저: Optional[str] = None, 키워드: Optional[str] = None,
+                        서버전체: bool = False, 서버id: Optional[str] = None):
+    username = interaction.user.name
+    if sum((bool(유저), bool(키워드), 서버전체)) != 1:
+        await interaction.response.send_message("❌ 유저 / 키워드 / 서버전체 중 하나만 골라 주세요.", ephemeral=True)
+        return
+    if not knowledge_ready.is_set():
+        await interaction.response.send_message(not_ready_message(), ephemeral=True)
+        return
+
+    if 유저 or 서버id:
+        if username not in privileged_users:
+            await interaction.response.send_message("❌ 권한이 없습니다.", ephemeral=True)
+            return
+    elif not interaction.guild or not can_manage_knowledge(interaction):
+        await interaction.response.send_message("❌ 서버 관리 권한이 있어야 지울 수 있어요.", ephemeral=True)
+        return
+
+    if 유저:
+        target = resolve_user_option(interaction, 유저)
+        assert target is not None
+        description = f"'{target}' 님이 모든 서버에서 가르친 대답"
+        metric_guild = ""
+
+        async def action() -> int:
+            return await store.purge_teacher(target)
+    else:
+        gid = 서버id.strip() if 서버id else gid_str_from_guild(interaction.guild)
+        if not gid:
+            await interaction.response.send_message("❌ 대상 서버를 알 수 없어요.", ephemeral=True)
+            return
+        metric_guild = gid
+        # ___LEGACY___ 를 여기서 이관하지 않음: 이관하면 다른 서버 몫인 옛 데이터까지 이 서버로 옮겨져 같이 지워짐
+        if 키워드:
+            keyword = 키워드.strip()
+            description = f"서버 {gid} 의 키워드 '{keyword}'"
+
+            async def action() -> int:
+                return await store.purge_keyword(gid, keyword)
+        else:
+            description = f"서버 {gid} 가 배운 것 전부"
+
+            async def action() -> int:
+                return await store.purge_guild(gid)
+
+    view = PurgeConfirmView(username, description, action, metric_guild)
+    await interaction.response.send_message(f"⚠️ 정말 지울까요? ({description}) 되돌릴 수 없어요.", view=view, ephemeral=True)
+
+
+@tree.command(name="키워드감지", description="(서버 관리자) 호출어 없이도 대화 속 배운 키워드에 대답할지 정합니다.")
+@app_commands.describe(켜기="켜면 메시지에 배운 키워드가 들어 있을 때 대답해요 (채널마다 쿨다운)")
+async def spot_command(interaction: discord.Interaction, 켜기: bool):
+    if not interaction.guild:
+        await interaction.response.send_message("❌ 이 명령어는 서버에서만 사용할 수 있어요.", ephemeral=True)
+        return
+    if not can_manage_knowledge(interaction):
+        await interaction.response.send_message("❌ 서버 관리 권한이 있어야 바꿀 수 있어요.", ephemeral=True)
+        return
+    gid = gid_str_from_guild(interaction.guild)
+    assert gid is not None
+    if 켜기:
+        spot_guilds.add(gid)
+        spot_guild_ids.add(interaction.guild.id)
+    else:
+        spot_forget(gid)
+        spot_guilds.discard(gid)
+        spot_guild_ids.discard(interaction.guild.id)
+    save_spot_guilds()
+    if 켜기:
+        await interaction.response.send_message(
+            f"✅ 키워드 감지를 켰어요. 대화에 배운 키워드가 나오면 대답해요. (채널마다 {SPOT_COOLDOWN:g}초에 한 번)", ephemeral=True)
+    else:
+        await interaction.response.send_message("✅ 키워드 감지를 껐어요.", ephemeral=True)
+
+
+
+# 속도 제한 / 채널별 보내기 대기열
+# RateLimiter: 키(사용자/채널/길드 id)별 토큰 버킷. 버킷은 쓸 때만 충전 계산 (타이머 없음)
+# 답장 순서: 사용자 -> 길드 한도 확인 (넘으면 버림) -> 채널 토큰이 있고 대기열이 비어 있으면 바로 보냄
+#            아니면 채널 대기열에 넣고 채널당 작업 하나가 토큰이 생길 때마다 하나씩 보냄
+# 버린/합친 개수는 metrics 카운터 (reply_shed_*, reply_coalesced, teach_shed_*)
+
+DISCORD_MESSAGE_LIMIT = 2000
+RATE_MAX_KEYS = 50000  # 리미터당 버킷 수 상한 (넘으면 이미 가득 찬 = 기본 상태인 버킷부터 정리)
+
+def _parse_rate(spec: str) -> Tuple[float, float]:
+    rate, _, burst = spec.partition("/")
+    rate_f = float(rate)
+    return rate_f, max(1.0, float(burst) if burst else rate_f)
+
+class TokenBucket:
+    __slots__ = ("tokens", "stamp")
+
+    def __init__(self, tokens: float, stamp: float):
+        self.tokens = tokens
+        self.stamp = stamp
+
+class RateLimiter:
+    def __init__(self, name: str, spec: str):
+        self.name = name
+        self.rate, self.burst = _parse_rate(spec)
+        self.buckets: Dict[Any, TokenBucket] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _bucket(self, key: Any, now: float) -> TokenBucket:
+        b = self.buckets.get(key)
+        if b is None:
+            if len(self.buckets) >= RATE_MAX_KEYS:
+                self._prune(now)
+            b = self.buckets[key] = TokenBucket(self.burst, now)
+        elif now > b.stamp:
+            b.tokens = min(self.burst, b.tokens + (now - b.stamp) * self.rate)
+            b.stamp = now
+        return b
+
+    def _prune(self, now: float):
+        full_after = self.burst / self.rate
+        idle = [k for k, b in self.buckets.items() if now - b.stamp >= full_after]
+        for k in idle or list(self.buckets)[: len(self.buckets) // 10 + 1]:
+            del self.buckets[k]
+
+    def ready(self, key: Any, now: float) -> bool:
+        return not self.enabled or self._bucket(key, now).tokens >= 1.0
+
+    def take(self, key: Any, now: float):
+        if self.enabled:
+            self._bucket(key, now).tokens -= 1.0
+
+    def wait_time(self, key: Any, now: float) -> float:
+        """토큰 하나가 생길 때까지 남은 시간(초)"""
+        if not self.enabled:
+            return 0.0
+        missing = 1.0 - self._bucket(key, now).tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+def take_all(checks: Iterable[Tuple[RateLimiter, Any]], now: float) -> Optional[RateLimiter]:
+    """모든 버킷에 토큰이 있으면 하나씩 쓰고 None, 하나라도 없으면 아무것도 안 쓰고 막은 리미터 반환"""
+    checks = list(checks)
+    for limiter, key in checks:
+        if not limiter.ready(key, now):
+            return limiter
+    for limiter, key in checks:
+        limiter.take(key, now)
+    return None
+
+reply_user_limiter = RateLimiter("user", RATE_REPLY_USER)
+reply_guild_limiter = RateLimiter("guild", RATE_REPLY_GUILD)
+reply_channel_limiter = RateLimiter("channel", RATE_REPLY_CHANNEL)
+teach_user_limiter = RateLimiter("user", RATE_TEACH_USER)
+teach_guild_limiter = RateLimiter("guild", RATE_TEACH_GUILD)
+
+class ChannelOutbox:
+    __slots__ = ("channel", "guild_id", "pending", "task")
+
+    def __init__(self, channel, guild_id: str):
+        self.channel = channel
+        self.guild_id = guild_id
+        self.pending: deque = deque()
+        self.task: Optional[asyncio.Task] = None
+
+_outboxes: Dict[int, ChannelOutbox] = {}
+
+async def _send_now(channel, guild_id: str, text: str):
+    t = time.perf_counter()
+    await channel.send(text)
+    metrics.observe("send", time.perf_counter() - t, guild_id)
+    _note_first_response()
+
+async def _drain_outbox(ob: ChannelOutbox):
+    cid = ob.channel.id
+    try:
+        while ob.pending:
+            wait = reply_channel_limiter.wait_time(cid, time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+            reply_channel_limiter.take(cid, time.monotonic())
+            text = ob.pending.popleft()
+            try:
+                await _send_now(ob.channel, ob.guild_id, text)
+            except discord.HTTPException as e:
+                print(f"❌ 답장 보내기 실패 (채널 {cid}): {e}")
+    finally:
+        _outboxes.pop(cid, None)
+
+async def send_reply(message: discord.Message, text: str):
+    """속도 제한을 거쳐 message 채널에 text 답장 (바로 보내거나, 대기열에 넣거나, 버림)"""
+    gid = gid_str_from_guild(message.guild) or ""
+    now = time.monotonic()
+    checks = [(reply_user_limiter, message.author.id)]
+    if gid:
+        checks.append((reply_guild_limiter, gid))
+    denied = take_all(checks, now)
+    if denied is not None:
+        metrics.inc(f"reply_shed_{denied.name}", gid)
+        return
+    channel = message.channel
+    ob = _outboxes.get(channel.id)
+    if ob is None and reply_channel_limiter.ready(channel.id, now):
+        reply_channel_limiter.take(channel.id, now)
+        await _send_now(channel, gid, text)
+        return
+    if ob is None:
+        ob = _outboxes[channel.id] = ChannelOutbox(channel, gid)
+        ob.task = asyncio.get_running_loop().create_task(_drain_outbox(ob))
+    if len(ob.pending) < OUTBOX_MAX:
+        ob.pending.append(text)
+        metrics.inc("reply_queued", gid)
+    elif len(ob.pending[-1]) + 1 + len(text) <= DISCORD_MESSAGE_LIMIT:
+        ob.pending[-1] = ob.pending[-1] + "\n" + text
+        metrics.inc("reply_coalesced", gid)
+    else:
+        metrics.inc("reply_shed_outbox", gid)
+
 
 # 메시지 처리 (호시노에게 가르친 단어 호출)
+# 대부분의 메시지는 트리거가 아님 -> 맨 앞에서 startswith 한 번으로 거른다 (새 문자열 안 만듦)
+# 거른 메시지는 strip / 길드 id 변환 / process_commands 를 전부 건너뜀
+# 앞 공백이 있는 메시지("  호시노야 ...")만 느린 경로로 원래처럼 strip 후 확인
+# 키워드 감지를 켠 길드는 트리거가 아닌 메시지도 spot_keywords 로 (채널 쿨다운부터 확인)
+
+TRIGGER_PREFIXES: Tuple[str, ...] = tuple(w + " " for w in TRIGGER_WORDS)
+_PREFILTER: Tuple[str, ...] = TRIGGER_PREFIXES + (COMMAND_PREFIX,)
+message_counts: Dict[str, int] = {"seen": 0, "rejected": 0}  # 잠금 없는 카운터 (이벤트 루프에서만 갱신)
 
+def _spot_enabled(message: discord.Message) -> bool:
+    return bool(spot_guild_ids) and message.guild is not None and message.guild.id in spot_guild_ids
+
+async def spot_keywords(message: discord.Message):
+    if message.author.bot or not knowledge_ready.is_set():
+        return
+    now = time.monotonic()
+    last = spot_last_reply.get(message.channel.id)
+    if last is not None and now - last < SPOT_COOLDOWN:
+        return
+    gid = str(message.guild.id)
+    t = time.perf_counter()
+    automaton = await spot_automaton(gid)
+    keyword = automaton.find(message.content)
+    metrics.observe("spot", time.perf_counter() - t, gid)
+    if keyword is None:
+        return
+    recent = recent_for_channel(message.channel.id)
+    picked = await store.pick(gid, keyword, recent)
+    if picked is None:
+        return
+    spot_last_reply[message.channel.id] = now
+    spot_last_reply.move_to_end(message.channel.id)
+    if len(spot_last_reply) > RECENT_MAX_CHANNELS:
+        spot_last_reply.popitem(last=False)
+    metrics.inc("spot_hit", gid)
+    resp, teacher = picked
+    if recent is not None:
+        recent.append(resp)
+    await send_reply(message, f"{resp}\n-# {teacher}님이 가르쳐 주셨어요!")
 
 @bot.event
 async def on_message(message: discord.Message):
+    raw = message.content
+    message_counts["seen"] += 1
+    if not raw.startswith(_PREFILTER) and not (raw and raw[0].isspace()):
+        if _spot_enabled(message):
+            await spot_keywords(message)
+            return
+        message_counts["rejected"] += 1
+        return
     if message.author.bot:
         return
-    content = message.content.strip()
-    if content.startswith("호시노야 "):
-        key = content.removeprefix("호시노야 ").strip()
-        if key in default_knowledge:
-            await message.channel.send(default_knowledge[key])
-        else:
-            # 길드 컨텍스트에서만 길드별 데이터 사용
-            if message.guild:
-                gid = gid_str_from_guild(message.guild)
-                if gid:
-                    kw_map = learned_data.get(gid, {})
-                    matches: List[Tuple[str, str, List[str]]] = []  # (kw, teacher, responses)
-                    for kw, arr in kw_map.items():
-                        if kw == key:
-                            by_teacher: Dict[str, List[str]] = {}
-                            for e in arr:
-                                if not isinstance(e, dict):
-                                    continue
-                                t = e.get("teacher", "unknown")
-                                r = e.get("response")
-                                if r is None:
-                                    continue
-                                by_teacher.setdefault(t, []).append(r)
-                            for teacher, responses in by_teacher.items():
-                                matches.append((kw, teacher, responses))
-                    if matches:
-                        chosen = random.choice(matches)
-                        resp = random.choice(chosen[2])
-                        await message.channel.send(f"{resp}\n-# {chosen[1]}님이 가르쳐 주셨어요!")
-    await bot.process_commands(message)
+    if raw.startswith(COMMAND_PREFIX):
+        await bot.process_commands(message)
+        return
+    metrics.inc("messages")
+    content = raw.strip()
+    prefix = next((p for p in TRIGGER_PREFIXES if content.startswith(p)), None)
+    if prefix is None:
+        if _spot_enabled(message):
+            await spot_keywords(message)
+        return
+    key = content.removeprefix(prefix).strip()
+    reply: Optional[str] = None
+    if key in default_knowledge:
+        reply = default_knowledge[key]
+    elif message.guild and knowledge_ready.is_set():
+        # 길드 컨텍스트에서만 길드별 데이터 사용 (인덱스 조회 1회)
+        # 로드 전에는 기본 지식만 응답 (배운 말은 건너뜀)
+        gid = gid_str_from_guild(message.guild)
+        if gid:
+            t = time.perf_counter()
+            recent = recent_for_channel(message.channel.id)
+            picked = await store.pick(gid, key, recent)
+            metrics.observe("lookup", time.perf_counter() - t, gid)
+            if picked:
+                metrics.inc("trigger_hit", gid)
+                resp, teacher = picked
+                if recent is not None:
+                    recent.append(resp)
+                reply = f"{resp}\n-# {teacher}님이 가르쳐 주셨어요!"
+            else:
+                metrics.inc("trigger_miss", gid)
+    elif message.guild:
+        metrics.inc("trigger_not_ready")
+    if reply is not None:
+        await send_reply(message, reply)
 
 
 # 시작 / sync
+# 지식 로드는 게이트웨이 접속과 동시에 백그라운드에서 한 번만 (setup_hook)
+# 로드가 끝나기 전에는 배운 말 응답/가르치기/배운내용을 잠시 막는다 (knowledge_ready)
+# 로드가 실패하면 knowledge_load_error 에 남기고 명령어는 '불러오지 못함' 으로 답함 (계속 '불러오는 중' 이 아니라)
+# startup_stats: 시작 후 로드 완료 / 게이트웨이 준비 / 첫 응답까지 걸린 시간(초)
+
+_startup_t0 = time.perf_counter()
+startup_stats: Dict[str, float] = {}
+knowledge_ready = asyncio.Event()
+knowledge_load_error: Optional[BaseException] = None
+_background_tasks: List[asyncio.Task] = []  # 참조를 들고 있어야 도중에 GC 되지 않음
+_commands_synced = False
+
+async def load_knowledge_store():
+    if knowledge_ready.is_set():
+        return
+    t = time.perf_counter()
+    await store.open()
+    load_spot_guilds()
+    startup_stats["load_seconds"] = time.perf_counter() - t
+    startup_stats["knowledge_ready_at"] = time.perf_counter() - _startup_t0
+    knowledge_ready.set()
+    print(f"📚 배운 내용 로드 완료 ({startup_stats['load_seconds']:.2f}초)")
+
+def _on_load_done(task: asyncio.Task):
+    global knowledge_load_error
+    if task.cancelled():
+        return
+    e = task.exception()
+    if e is not None:
+        knowledge_load_error = e
+        print(f"❌ 배운 내용 로드 실패: {e!r}")
+        traceback.print_exception(type(e), e, e.__traceback__)
+
+def _on_stop_signal(sig: signal.Signals):
+    # SIGTERM(systemctl stop / docker stop) / SIGINT: 봇을 닫으면 bot.run() 이 돌아와 store.shutdown() 이 남은 변경을 저장
+    # 두 번째 신호는 기본 동작 (닫기가 멈춰도 강제로 끝낼 수 있게)
+    print(f"🛑 {sig.name} 받음: 남은 변경을 저장하고 종료합니다")
+    loop = asyncio.get_running_loop()
+    for s in (signal.SIGTERM, signal.SIGINT):
+        loop.remove_signal_handler(s)
+    _background_tasks.append(loop.create_task(bot.close()))
+
+def _install_signal_handlers():
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, _on_stop_signal, sig)
+        except (NotImplementedError, RuntimeError):
+            return  # Windows 등: 기본 동작 (Ctrl+C 는 bot.run() 이 처리)
+
+async def _setup_hook():
+    _install_signal_handlers()
+    # 기다리지 않음 -> 로드와 게이트웨이 접속이 동시에 진행
+    load_task = bot.loop.create_task(load_knowledge_store())
+    load_task.add_done_callback(_on_load_done)
+    _background_tasks.extend((load_task, bot.loop.create_task(sample_loop_lag())))
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_PORT)
+
+bot.setup_hook = _setup_hook
+
+def _note_first_response():
+    if "first_response_at" not in startup_stats:
+        startup_stats["first_response_at"] = time.perf_counter() - _startup_t0
+        print(f"💬 첫 응답까지 {startup_stats['first_response_at']:.2f}초")
 
 @bot.event
 async def on_ready():
-    global learned_data
-    learned_data = load_data()  # reload/normalize on ready
+    global _commands_synced
+    startup_stats.setdefault("gateway_ready_at", time.perf_counter() - _startup_t0)
     print(f"✅ 로그인됨: {bot.user} (ID: {bot.user.id})")
+    if _commands_synced or SHARD_ID != 0:
+        # 재접속: 로드/동기화 다시 안 함 (샤딩 중이면 명령어 동기화는 0번 샤드만)
+        return
     try:
         if GUILD_ID:
             synced = await tree.sync(guild=discord.Object(id=GUILD_ID))
         else:
             synced = await tree.sync()
         print(f"🔧 {len(synced)}개의 슬래시 명령어를 동기화했어요.")
+        _commands_synced = True
     except Exception as e:
         print(f"❌ 명령어 동기화 실패: {e}")
 
 
+# 계측 노출 (/metrics, /상태)
+# 게이지(크기/대기열)는 수집 시점에 계산 -> 평소 경로에는 비용 없음
+
+def collect_gauges() -> List[Tuple[str, str, float]]:
+    gauges: List[Tuple[str, str, float]] = [
+        ("knowledge_ready", "", 1.0 if knowledge_ready.is_set() else 0.0),
+        ("knowledge_load_failed", "", 1.0 if knowledge_load_error is not None else 0.0),
+        ("open_views", "", float(len(_open_views))),
+        ("render_cache_entries", "", float(len(_render_cache))),
+        ("save_dirty", "", 1.0 if _dirty else 0.0),
+        ("save_in_flight", "", 1.0 if _flush_future is not None and not _flush_future.done() else 0.0),
+        ("journal_pending", "", float(_journal_pending)),
+        ("teachers", "", float(len(teacher_table.names))),
+        ("messages_seen", "", float(message_counts["seen"])),
+        ("messages_rejected", "", float(message_counts["rejected"])),
+        ("outbox_channels", "", float(len(_outboxes))),
+        ("outbox_pending", "", float(sum(len(ob.pending) for ob in _outboxes.values()))),
+        ("spot_guilds", "", float(len(spot_guilds))),
+        ("spot_automata", "", float(len(spot_automata))),
+    ]
+    for k, v in startup_stats.items():
+        gauges.append((f"startup_{k}", "", v))
+    # sqlite 모드는 learned_data 가 비어 있음 (크기는 DB 파일 쪽에서 확인)
+    for gid, size in list(guild_disk_bytes.items()):
+        gauges.append(("disk_bytes", gid, float(size)))
+    if STORAGE_MODE == "guilds":
+        local = getattr(store, "local", store)
+        gauges.append(("guilds_known", "", float(len(guild_manifest))))
+        gauges.append(("guilds_resident", "", float(len(learned_data))))
+        gauges.append(("guild_cache_bytes", "", float(getattr(local, "resident_bytes", 0))))
+    for gid, recs in learned_data.items():
+        gauges.append(("keywords", gid, float(len(recs))))
+        gauges.append(("responses", gid, float(sum(len(rec) for rec in recs.values()))))
+    return gauges
+
+async def sample_loop_lag():
+    """LOOP_LAG_INTERVAL 마다 깨어나서 늦게 깨어난 만큼을 이벤트 루프 지연으로 기록"""
+    while True:
+        t = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        metrics.observe("loop_lag", max(0.0, time.perf_counter() - t - LOOP_LAG_INTERVAL))
+
+async def start_metrics_server(port: int):
+    from aiohttp import web  # discord.py 의존성
+
+    async def handle(request):
+        return web.Response(text=metrics.render_prometheus(collect_gauges()),
+                            content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    print(f"📈 메트릭: http://127.0.0.1:{port}/metrics")
+
+def format_status() -> str:
+    def ms(x: float) -> str:
+        return "∞" if x == float("inf") else f"{x * 1000:.2f}ms"
+
+    lines = [f"배운 내용 로드 실패: {knowledge_load_error!r}"] if knowledge_load_error is not None else []
+    for stage in ("lookup", "spot", "spot_build", "send", "save", "journal_append", "load", "guild_load", "loop_lag"):
+        h = metrics.stage_summary(stage)
+        if h.count:
+            lines.append(f"{stage}: {h.count}회, p50 ≤ {ms(h.quantile(0.5))}, p99 ≤ {ms(h.quantile(0.99))}")
+    totals: Dict[str, float] = {}
+    for (name, _), v in list(metrics.counters.items()):
+        totals[name] = totals.get(name, 0) + v
+    if totals:
+        lines.append(", ".join(f"{k}={int(v)}" for k, v in sorted(totals.items())))
+    gauges = [g for g in collect_gauges() if not g[1]]
+    lines.append(", ".join(f"{k}={v:g}" for k, _, v in gauges))
+    return "\n".join(lines)
+
+@tree.command(name="상태", description="(관리자) 처리 지연/저장 상태를 보여줍니다.")
+async def status_command(interaction: discord.Interaction):
+    if interaction.user.name not in privileged_users:
+        await interaction.response.send_message("❌ 이 명령어는 관리자만 사용할 수 있어요.", ephemeral=True)
+        return
+    await interaction.response.send_message(f"```\n{format_status()}\n```", ephemeral=True)
+
+
+def _format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+@tree.command(name="사용량", description="(관리자) 서버별 지식 사용량(메모리/디스크)을 큰 순서로 보여줍니다.")
+@app_commands.describe(개수="보여줄 서버 수 (기본 10)")
+async def usage_command(interaction: discord.Interaction, 개수: Optional[int] = 10):
+    if interaction.user.name not in privileged_users:
+        await interaction.response.send_message("❌ 이 명령어는 관리자만 사용할 수 있어요.", ephemeral=True)
+        return
+    if not knowledge_ready.is_set():
+        await interaction.response.send_message(not_ready_message(), ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    rows = await store.usage()
+    rows.sort(key=lambda u: (u["memory_bytes"] + u["disk_bytes"], u["responses"]), reverse=True)
+    lines = [f"서버 {len(rows)}개, 키워드 {sum(u['keywords'] for u in rows)}개, 대답 {sum(u['responses'] for u in rows)}개, "
+             f"메모리 {_format_bytes(sum(u['memory_bytes'] for u in rows))}, 디스크 {_format_bytes(sum(u['disk_bytes'] for u in rows))}"]
+    for u in rows[:max(1, min(개수 or 10, 30))]:
+        lines.append(f"{u['guild_id']}: 키워드 {u['keywords']}, 대답 {u['responses']}, "
+                     f"메모리 {_format_bytes(u['memory_bytes'])}, 디스크 {_format_bytes(u['disk_bytes'])}")
+    await interaction.followup.send("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+
 # 실행
 
+def run_shards(count: int) -> int:
+    """샤드 count 개를 각각 별도 프로세스로 띄우고 모두 끝날 때까지 기다림 (Ctrl+C 면 전부 종료)"""
+    procs = []
+    for sid in range(count):
+        env = dict(os.environ, HOSHINO_SHARD_COUNT=str(count), HOSHINO_SHARD_ID=str(sid))
+        procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env))
+    try:
+        return max(p.wait() for p in procs)
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        return max(p.wait() for p in procs)
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        # 오프라인 정리: python code.py migrate [--check]
+        sys.exit(migrate_knowledge_file(check_only="--check" in sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "dedupe":
+        # 오프라인 중복 정리/압축: python code.py dedupe
+        sys.exit(dedupe_knowledge_file())
+    if len(sys.argv) > 1 and sys.argv[1] == "shards":
+        # 샤드별 프로세스 실행: python code.py shards [개수]  (기본: HOSHINO_SHARD_COUNT)
+        sys.exit(run_shards(int(sys.argv[2]) if len(sys.argv) > 2 else max(SHARD_COUNT, 2)))
     if not TOKEN:
         print("DISCORD_TOKEN을 .env에 넣어주세요.")
     else:
         bot.run(TOKEN)
+        # 종료 시 남은 변경 저장
+        store.shutdown()